@@ -0,0 +1,46 @@
+"""
+Benchmark of `calculate_end_date`: per-call dateorro path against cached calculation.
+
+    python benchmarks/calculate_end_date.py
+"""
+import random
+import timeit
+from datetime import timedelta
+
+from prozorro.risks.rules.utils import _cached_end_date, _calculate_end_date, calculate_end_date
+from prozorro.risks.utils import get_now
+
+NUMBER = 100000
+
+
+def main():
+    now = get_now()
+    # complaint decisions of tenders repeat a lot, each of them is checked by several rules on every tender update
+    dates = [
+        (now - timedelta(days=random.randint(0, 365), minutes=random.randint(0, 1440))).isoformat()
+        for _ in range(1000)
+    ]
+    delta = timedelta(days=30)
+
+    cases = (
+        (
+            "calendar days, per-call",
+            lambda: _calculate_end_date(random.choice(dates), delta, True, True, False, 1000),
+        ),
+        (
+            "calendar days, cached",
+            lambda: calculate_end_date(random.choice(dates), delta),
+        ),
+        (
+            "current time, not cached",
+            lambda: calculate_end_date(get_now(), -delta, normalized=False, cache=False),
+        ),
+    )
+    for name, func in cases:
+        _cached_end_date.cache_clear()
+        seconds = timeit.timeit(func, number=NUMBER)
+        print(f"{name:<30} {seconds / NUMBER * 1e6:8.2f} us per call")
+
+
+if __name__ == "__main__":
+    main()
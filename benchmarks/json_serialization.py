@@ -0,0 +1,83 @@
+"""
+Benchmark of API responses serialization: pages/sec of every available JSON backend
+for `/api/risks` pages of 100 tenders with full risks histories.
+Outputs of backends are checked to have the same values before measuring.
+
+    python benchmarks/json_serialization.py [pages ...]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from prozorro.risks.serialization import JSON_BACKENDS
+from prozorro.risks.settings import TIMEZONE
+
+PAGE_SIZE = 100
+RISKS_PER_TENDER = 20
+HISTORY_DEPTH = 10
+
+
+def generate_page(page_size=PAGE_SIZE):
+    date = TIMEZONE.localize(datetime(2024, 1, 1, 12))
+    items = []
+    for index in range(page_size):
+        risks = {
+            f"sas24-3-{risk}": [
+                {
+                    "indicator": "risk_found" if risk % 3 else "risk_not_found",
+                    "date": (date + timedelta(days=risk)).isoformat(),
+                    "item": {"id": f"{index:032x}", "type": "lot"},
+                    "history": [
+                        {
+                            "date": (date + timedelta(days=log)).isoformat(),
+                            "indicator": "risk_found" if log % 2 else "risk_not_found",
+                        }
+                        for log in range(HISTORY_DEPTH)
+                    ],
+                }
+            ]
+            for risk in range(RISKS_PER_TENDER)
+        }
+        items.append({
+            "_id": f"{index:032x}",
+            "tenderID": f"UA-2024-01-01-{index:06d}-a",
+            "dateAssessed": date + timedelta(minutes=index),
+            "dateModified": "2024-01-01T11:00:00.000000+02:00",
+            "procuringEntity": {
+                "name": "Державне підприємство",
+                "identifier": {"scheme": "UA-EDR", "id": "12345678", "legalName": "Державне підприємство"},
+                "kind": "general",
+            },
+            "value": {"amount": index * 10.5, "currency": "UAH", "valueAddedTaxIncluded": True},
+            "risks": risks,
+            "terminated": False,
+            "has_risks": True,
+            "owner": ObjectId(),
+        })
+    return {"items": items, "count": 100000, "count_estimated": False, "next_cursor": None}
+
+
+def measure(dumps, page, pages):
+    started_at = time.perf_counter()
+    size = 0
+    for _ in range(pages):
+        size += len(dumps(page))
+    duration = time.perf_counter() - started_at
+    return pages / duration, size / pages
+
+
+def main(pages_list):
+    page = generate_page()
+    values = {name: json.loads(dumps(page)) for name, dumps in JSON_BACKENDS.items()}
+    assert all(value == values["stdlib"] for value in values.values()), "backends return different values"
+    for pages in pages_list:
+        for name, dumps in JSON_BACKENDS.items():
+            pages_per_second, page_size = measure(dumps, page, pages)
+            print(f"{name:>8}: {pages} pages, {pages_per_second:,.0f} pages/s, {page_size / 1024:,.0f} KiB per page")
+
+
+if __name__ == "__main__":
+    main([int(value) for value in sys.argv[1:]] or [100, 1000])
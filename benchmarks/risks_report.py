@@ -0,0 +1,91 @@
+"""
+Benchmark of risks report writing: rows/sec of per-row DictWriter path (with flattened fields copied
+into every document by $addFields) against batch tuple writer, for 100k and 1M rows.
+MongoDB isn't involved, documents are generated in memory and written to a sink that drops the data.
+
+    python benchmarks/risks_report.py [rows ...]
+"""
+import csv
+import io
+import sys
+import time
+
+from prozorro.risks.reports import REPORT_COLUMNS, CsvReportWriter, format_report_row
+from prozorro.risks.settings import REPORT_BATCH_SIZE
+
+MAX_BUFFER_LINES = 1000
+
+
+def generate_docs(rows):
+    for index in range(rows):
+        yield {
+            "_id": f"{index:032x}",
+            "tenderID": f"UA-2024-01-01-{index:06d}-a",
+            "dateAssessed": "2024-01-01T12:00:00.000000+02:00",
+            "dateModified": "2024-01-01T11:00:00.000000+02:00",
+            "procuringEntityRegion": "Київська область",
+            "procuringEntityEDRPOU": "12345678",
+            "procuringEntity": {"name": "Державне підприємство"},
+            "value": {"amount": index * 10.5, "currency": "UAH"},
+            "worked_risks": ["sas24-3-1", "sas24-3-5"],
+        }
+
+
+def dict_writer_report(docs, sink):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for doc in docs:
+        doc = {
+            **doc,
+            "procuringEntityName": doc["procuringEntity"]["name"],
+            "valueAmount": doc["value"]["amount"],
+            "valueCurrency": doc["value"]["currency"],
+        }
+        writer.writerow(doc)
+        count += 1
+        if count > MAX_BUFFER_LINES:
+            sink(buffer.getvalue().encode("utf-8"))
+            buffer.truncate(0)
+            buffer.seek(0)
+            count = 0
+    sink(buffer.getvalue().encode("utf-8"))
+
+
+def batch_writer_report(docs, sink, compression=None):
+    writer = CsvReportWriter(compression=compression)
+    sink(writer.write_header())
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == REPORT_BATCH_SIZE:
+            sink(writer.write_rows(map(format_report_row, batch)))
+            batch = []
+    sink(writer.write_rows(map(format_report_row, batch)))
+    sink(writer.close())
+
+
+def main(sizes):
+    cases = (
+        ("DictWriter per row", dict_writer_report),
+        ("tuple writer by batches", batch_writer_report),
+        ("tuple writer by batches, gzip", lambda docs, sink: batch_writer_report(docs, sink, compression="gzip")),
+    )
+    for rows in sizes:
+        docs = list(generate_docs(rows))
+        for name, func in cases:
+            written = 0
+
+            def sink(chunk):
+                nonlocal written
+                written += len(chunk)
+
+            started_at = time.perf_counter()
+            func(docs, sink)
+            seconds = time.perf_counter() - started_at
+            print(f"{rows:>8} rows  {name:<32} {rows / seconds:>12,.0f} rows/sec  {written / 2 ** 20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
@@ -15,7 +15,14 @@ from prozorro.risks.handlers import (
     list_tenders,
     ping_handler,
     get_tenders_feed,
+    get_risks_stats,
+    create_risks_report_job,
+    get_risks_report_job,
+    download_risks_report_job_file,
+    stream_tenders_feed,
 )
+from prozorro.risks.feed import RISKS_FEED_NOTIFIER
+from prozorro.risks.report_jobs import REPORT_JOBS_WORKER
 from prozorro.risks.settings import CLIENT_MAX_SIZE, SENTRY_DSN
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 import sentry_sdk
@@ -35,6 +42,9 @@ def create_application(on_cleanup=None):
     )
 
     app.on_startup.append(init_mongodb)
+    app.on_startup.append(REPORT_JOBS_WORKER.start)
+    app.on_cleanup.append(REPORT_JOBS_WORKER.stop)
+    app.on_cleanup.append(RISKS_FEED_NOTIFIER.stop)
     if on_cleanup:
         app.on_cleanup.append(on_cleanup)
     app.on_cleanup.append(cleanup_db_client)
@@ -53,7 +63,16 @@ def setup_swagger(app):
         web.get("/api/risks", list_tenders, allow_head=False),
         web.get("/api/filter-values", get_filter_values, allow_head=False),
         web.get("/api/risks-report", download_risks_report, allow_head=False),
+        web.post("/api/risks-report/jobs", create_risks_report_job),
+        web.get(r"/api/risks-report/jobs/{job_id:[0-9a-f]+}", get_risks_report_job, allow_head=False),
+        web.get(
+            r"/api/risks-report/jobs/{job_id:[0-9a-f]+}/file",
+            download_risks_report_job_file,
+            allow_head=False,
+        ),
         web.get("/api/risks-feed", get_tenders_feed, allow_head=False),
+        web.get("/api/risks-feed/stream", stream_tenders_feed, allow_head=False),
+        web.get("/api/risks-stats", get_risks_stats, allow_head=False),
     ])
 
 
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from prozorro.risks.settings import (
+    HTTP_CONNECTIONS_LIMIT,
+    HTTP_CONNECTIONS_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTPS_PROXY,
+)
+
+logger = logging.getLogger(__name__)
+
+CDB_CLIENT = "cdb"
+NBU_CLIENT = "nbu"
+
+# requests to NBU are sent through proxy if it is configured
+HTTP_CLIENTS_REQUEST_KWARGS = {
+    CDB_CLIENT: {},
+    NBU_CLIENT: {"proxy": HTTPS_PROXY} if HTTPS_PROXY else {},
+}
+
+HTTP_CLIENTS = {}
+
+
+def create_http_client():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTIONS_LIMIT,
+        limit_per_host=HTTP_CONNECTIONS_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def init_http_clients(*_):
+    logger.info("Init http clients")
+    for name in HTTP_CLIENTS_REQUEST_KWARGS:
+        if name not in HTTP_CLIENTS or HTTP_CLIENTS[name].closed:
+            HTTP_CLIENTS[name] = create_http_client()
+    return HTTP_CLIENTS
+
+
+async def cleanup_http_clients(*_):
+    clients = list(HTTP_CLIENTS.values())
+    HTTP_CLIENTS.clear()
+    await asyncio.gather(*(client.close() for client in clients))
+
+
+def get_http_client(name):
+    """
+    Get long-lived session for upstream, it's created on first use if clients weren't initialized
+    :param name: str Upstream name (CDB_CLIENT, NBU_CLIENT)
+    :return: ClientSession
+    """
+    client = HTTP_CLIENTS.get(name)
+    if client is None or client.closed:
+        client = HTTP_CLIENTS[name] = create_http_client()
+    return client
+
+
+def get_http_client_request_kwargs(name):
+    return HTTP_CLIENTS_REQUEST_KWARGS[name]
@@ -0,0 +1,189 @@
+"""
+One-off migration that compacts history of risks in existing documents of risks collection.
+
+    python -m prozorro.risks.commands.compact_risk_history --batch-size 500 [--save-history] [--strip-rule-metadata]
+
+Documents are processed in batches ordered by _id. Every update is guarded by dateAssessed,
+so documents changed by crawlers meanwhile are skipped (their new history is compacted by crawler anyway).
+With --strip-rule-metadata static texts of risk rules are removed from risk items as well
+(for RISK_RULES_METADATA_REFERENCED mode, they are joined from rules catalogue by API).
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from prozorro.risks.db import (
+    cleanup_db_client,
+    compact_risk_history,
+    get_risk_history_collection,
+    get_risks_collection,
+    init_mongodb,
+)
+from prozorro.risks.logging import setup_logging
+from prozorro.risks.rules.catalogue import RISK_RULE_METADATA_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def compact_risk_item(risk_item, strip_metadata=False):
+    risk_item = {**risk_item, "history": compact_risk_history(risk_item.get("history", []))}
+    if strip_metadata:
+        for field in RISK_RULE_METADATA_FIELDS:
+            risk_item.pop(field, None)
+    return risk_item
+
+
+def compact_tender_risks(risks, strip_metadata=False):
+    """
+    Compact history of every risk item of tender
+    :param risks: dict Tender risks {"sas-3-1": [...], ...}
+    :param strip_metadata: bool Whether static texts of risk rules should be removed from risk items
+    :return: dict Tender risks with compacted history
+    """
+    return {
+        risk_id: [compact_risk_item(risk_item, strip_metadata=strip_metadata) for risk_item in risk_items]
+        for risk_id, risk_items in risks.items()
+    }
+
+
+def get_full_history_entries(tender):
+    return [
+        {
+            "tender_id": tender["_id"],
+            "risk_id": risk_id,
+            "item_id": risk_item["item"]["id"] if "item" in risk_item else "tender",
+            **log,
+        }
+        for risk_id, risk_items in tender["risks"].items()
+        for risk_item in risk_items
+        for log in risk_item.get("history", [])
+    ]
+
+
+async def get_modified_tenders(compacted, failed_indexes, modified_count):
+    """
+    Find tenders that were actually updated by compaction
+    (not the ones changed by crawlers meanwhile or failed to be written)
+    :param compacted: list Tuples of tender and its compacted risks in order of update operations
+    :param failed_indexes: set Indexes of failed update operations
+    :param modified_count: int Number of documents modified by bulk write
+    :return: list Tenders (before compaction) that were updated
+    """
+    written = [(tender, risks) for index, (tender, risks) in enumerate(compacted) if index not in failed_indexes]
+    if modified_count == len(written):
+        return [tender for tender, _ in written]
+    cursor = get_risks_collection().find(
+        {"_id": {"$in": [tender["_id"] for tender, _ in written]}},
+        projection={"risks": True, "dateAssessed": True},
+    )
+    saved = {doc["_id"]: doc async for doc in cursor}
+    return [
+        tender
+        for tender, risks in written
+        if tender["_id"] in saved
+        and saved[tender["_id"]].get("dateAssessed") == tender.get("dateAssessed")
+        and saved[tender["_id"]]["risks"] == risks
+    ]
+
+
+async def compact_batch(tenders, save_history=False, strip_metadata=False):
+    """
+    Compact history of risks for batch of tenders
+    :param tenders: list Tenders from risks collection with risks and dateAssessed
+    :param save_history: bool Whether full history of compacted documents should be saved to risk_history collection
+    :param strip_metadata: bool Whether static texts of risk rules should be removed from risk items
+    :return: int Number of updated documents
+    """
+    compacted = []
+    for tender in tenders:
+        risks = compact_tender_risks(tender["risks"], strip_metadata=strip_metadata)
+        if risks != tender["risks"]:
+            compacted.append((tender, risks))
+    if not compacted:
+        return 0
+    operations = [
+        UpdateOne(
+            {"_id": tender["_id"], "dateAssessed": tender.get("dateAssessed")},
+            {"$set": {"risks": risks}},
+        )
+        for tender, risks in compacted
+    ]
+    failed_indexes = set()
+    try:
+        result = await get_risks_collection().bulk_write(operations, ordered=False)
+        modified_count = result.modified_count
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        logger.warning(
+            f"Compact risk history warning: {len(write_errors)} updates failed",
+            extra={"MESSAGE_ID": "MONGODB_EXC"},
+        )
+        failed_indexes = {error["index"] for error in write_errors}
+        modified_count = e.details.get("nModified", 0)
+    if save_history and modified_count:
+        # history is saved after the write only for modified documents,
+        # so reruns and documents skipped by dateAssessed guard don't duplicate entries
+        modified_tenders = await get_modified_tenders(compacted, failed_indexes, modified_count)
+        history_entries = [entry for tender in modified_tenders for entry in get_full_history_entries(tender)]
+        if history_entries:
+            await get_risk_history_collection().insert_many(history_entries, ordered=False)
+    return modified_count
+
+
+async def compact_risk_histories(batch_size=500, save_history=False, strip_metadata=False):
+    """
+    Compact history of risks in all documents of risks collection
+    :param batch_size: int Number of documents read and updated at once
+    :param save_history: bool Whether full history of compacted documents should be saved to risk_history collection
+    :param strip_metadata: bool Whether static texts of risk rules should be removed from risk items
+    :return: tuple Number of processed and updated documents
+    """
+    processed = updated = 0
+    filters = {"risks": {"$exists": True}}
+    while True:
+        cursor = get_risks_collection().find(
+            filters,
+            projection={"risks": True, "dateAssessed": True},
+            sort=[("_id", ASCENDING)],
+            limit=batch_size,
+        )
+        tenders = await cursor.to_list(length=None)
+        if not tenders:
+            break
+        processed += len(tenders)
+        updated += await compact_batch(tenders, save_history=save_history, strip_metadata=strip_metadata)
+        filters["_id"] = {"$gt": tenders[-1]["_id"]}
+        logger.info(
+            f"Compacted risk history: {processed} processed, {updated} updated",
+            extra={"MESSAGE_ID": "COMPACT_RISK_HISTORY_PROGRESS"},
+        )
+    return processed, updated
+
+
+async def main(batch_size, save_history, strip_metadata):
+    await init_mongodb()
+    try:
+        await compact_risk_histories(batch_size=batch_size, save_history=save_history, strip_metadata=strip_metadata)
+    finally:
+        await cleanup_db_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact history of risks in risks collection")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--save-history",
+        action="store_true",
+        help="save full history of compacted documents to risk_history collection",
+    )
+    parser.add_argument(
+        "--strip-rule-metadata",
+        action="store_true",
+        help="remove static texts of risk rules from risk items (for RISK_RULES_METADATA_REFERENCED mode)",
+    )
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(main(args.batch_size, args.save_history, args.strip_rule_metadata))
@@ -0,0 +1,105 @@
+"""
+Backfill of entity_supplier_cpvs collection from tenders collection.
+
+    python -m prozorro.risks.commands.rebuild_entity_supplier_cpvs --batch-size 1000
+
+Historical tenders are read in batches ordered by _id and counted in memory
+(by procuring entity, supplier, year, procurement method, category and CPV),
+then the new collection replaces entity_supplier_cpvs at once.
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import ASCENDING
+
+from prozorro.risks.db import (
+    ENTITY_SUPPLIER_CPVS_KEY_FIELDS,
+    ENTITY_SUPPLIER_CPVS_PROJECTION,
+    cleanup_db_client,
+    get_database,
+    get_entity_supplier_cpvs_collection,
+    get_entity_supplier_cpvs_keys,
+    get_tenders_collection,
+    init_entity_supplier_cpvs_indexes,
+    init_mongodb,
+)
+from prozorro.risks.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+REBUILD_COLLECTION_NAME = "entity_supplier_cpvs_rebuild"
+
+
+async def count_entity_supplier_cpvs(batch_size=1000):
+    """
+    Count historical tenders for every key of entity_supplier_cpvs collection
+    :param batch_size: int Number of documents read at once
+    :return: dict {key: count}
+    """
+    counts = {}
+    processed = 0
+    filters = {"contracts": {"$exists": True}}
+    while True:
+        cursor = get_tenders_collection().find(
+            filters,
+            projection=ENTITY_SUPPLIER_CPVS_PROJECTION,
+            sort=[("_id", ASCENDING)],
+            limit=batch_size,
+        )
+        tenders = await cursor.to_list(length=None)
+        if not tenders:
+            break
+        for tender in tenders:
+            for key in get_entity_supplier_cpvs_keys(tender):
+                counts[key] = counts.get(key, 0) + 1
+        processed += len(tenders)
+        filters["_id"] = {"$gt": tenders[-1]["_id"]}
+        logger.info(
+            f"Counted entity supplier CPVs of {processed} tenders",
+            extra={"MESSAGE_ID": "REBUILD_ENTITY_SUPPLIER_CPVS_PROGRESS"},
+        )
+    return counts
+
+
+async def rebuild_entity_supplier_cpvs(batch_size=1000):
+    """
+    Rebuild entity_supplier_cpvs collection from scratch
+    :param batch_size: int Number of documents read at once
+    :return: int Number of entity_supplier_cpvs documents
+    """
+    counts = await count_entity_supplier_cpvs(batch_size=batch_size)
+    rebuild_collection = get_database()[REBUILD_COLLECTION_NAME]
+    await rebuild_collection.drop()
+    if counts:
+        await init_entity_supplier_cpvs_indexes(rebuild_collection)
+        documents = [
+            {**dict(zip(ENTITY_SUPPLIER_CPVS_KEY_FIELDS, key)), "count": count}
+            for key, count in counts.items()
+        ]
+        for start in range(0, len(documents), batch_size):
+            await rebuild_collection.insert_many(documents[start:start + batch_size])
+        await rebuild_collection.rename(get_entity_supplier_cpvs_collection().name, dropTarget=True)
+    else:
+        await get_entity_supplier_cpvs_collection().delete_many({})
+    logger.info(
+        f"Entity supplier CPVs rebuilt: {len(counts)} documents",
+        extra={"MESSAGE_ID": "REBUILD_ENTITY_SUPPLIER_CPVS_FINISHED"},
+    )
+    return len(counts)
+
+
+async def main(batch_size):
+    await init_mongodb()
+    try:
+        await rebuild_entity_supplier_cpvs(batch_size=batch_size)
+    finally:
+        await cleanup_db_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild entity_supplier_cpvs collection from tenders collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(main(args.batch_size))
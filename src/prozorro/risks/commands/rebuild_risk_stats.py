@@ -0,0 +1,101 @@
+"""
+Reconciliation of risk_stats collection with risks collection.
+
+    python -m prozorro.risks.commands.rebuild_risk_stats --batch-size 1000
+
+Tenders with risks are read in batches ordered by _id and counted in memory (there are only
+regions * risks * 2 counters), then the new collection replaces risk_stats at once.
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import ASCENDING
+
+from prozorro.risks.db import (
+    cleanup_db_client,
+    get_database,
+    get_risk_stats_collection,
+    get_risk_stats_id,
+    get_risk_stats_keys,
+    get_risks_collection,
+    init_mongodb,
+)
+from prozorro.risks.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+REBUILD_COLLECTION_NAME = "risk_stats_rebuild"
+
+
+async def count_risk_stats(batch_size=1000):
+    """
+    Count tenders with risks and sum of their value amount for every key of risk_stats collection
+    :param batch_size: int Number of documents read at once
+    :return: dict {(region, risk, terminated): [count, amount]}
+    """
+    stats = {}
+    processed = 0
+    filters = {"has_risks": True}
+    while True:
+        cursor = get_risks_collection().find(
+            filters,
+            projection={"procuringEntityRegion": True, "worked_risks": True, "terminated": True, "value.amount": True},
+            sort=[("_id", ASCENDING)],
+            limit=batch_size,
+        )
+        tenders = await cursor.to_list(length=None)
+        if not tenders:
+            break
+        for tender in tenders:
+            keys = get_risk_stats_keys(
+                tender.get("procuringEntityRegion"),
+                tender.get("worked_risks"),
+                tender.get("terminated"),
+                (tender.get("value") or {}).get("amount"),
+            )
+            for key, amount in keys.items():
+                counters = stats.setdefault(key, [0, 0])
+                counters[0] += 1
+                counters[1] += amount
+        processed += len(tenders)
+        filters["_id"] = {"$gt": tenders[-1]["_id"]}
+        logger.info(f"Counted risk stats of {processed} tenders", extra={"MESSAGE_ID": "REBUILD_RISK_STATS_PROGRESS"})
+    return stats
+
+
+async def rebuild_risk_stats(batch_size=1000):
+    """
+    Rebuild risk_stats collection from scratch
+    :param batch_size: int Number of documents read at once
+    :return: int Number of risk_stats documents
+    """
+    stats = await count_risk_stats(batch_size=batch_size)
+    rebuild_collection = get_database()[REBUILD_COLLECTION_NAME]
+    await rebuild_collection.drop()
+    if stats:
+        await rebuild_collection.insert_many([
+            {"_id": get_risk_stats_id(key), "count": count, "amount": amount}
+            for key, (count, amount) in stats.items()
+        ])
+        await rebuild_collection.rename(get_risk_stats_collection().name, dropTarget=True)
+    else:
+        await get_risk_stats_collection().delete_many({})
+    logger.info(f"Risk stats rebuilt: {len(stats)} documents", extra={"MESSAGE_ID": "REBUILD_RISK_STATS_FINISHED"})
+    return len(stats)
+
+
+async def main(batch_size):
+    await init_mongodb()
+    try:
+        await rebuild_risk_stats(batch_size=batch_size)
+    finally:
+        await cleanup_db_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild risk_stats collection from risks collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,41 @@
+from prozorro.risks.clients import CDB_CLIENT, NBU_CLIENT, get_http_client, get_http_client_request_kwargs
+from prozorro.risks.historical_cache import HistoricalQueryCache
+from prozorro.risks.rules.facts import TenderFacts
+
+
+class RiskContext:
+    """
+    Shared resources for processing objects with risk rules.
+    Crawler creates context for every feed page and passes it to all rules,
+    rules use it instead of opening their own connections.
+    """
+
+    def __init__(self, cdb_client=None, nbu_client=None):
+        self._cdb_client = cdb_client
+        self._nbu_client = nbu_client
+        self._tender_facts = {}
+        self.historical_cache = HistoricalQueryCache()
+
+    @property
+    def cdb_client(self):
+        return self._cdb_client or get_http_client(CDB_CLIENT)
+
+    @property
+    def nbu_client(self):
+        return self._nbu_client or get_http_client(NBU_CLIENT)
+
+    @property
+    def nbu_request_kwargs(self):
+        return get_http_client_request_kwargs(NBU_CLIENT)
+
+    def get_tender_facts(self, tender):
+        """
+        Get facts of tender built once for all rules
+        :param tender: dict Tender data
+        :return: TenderFacts
+        """
+        # tender is kept with its facts, so id of processed tender can't be reused by another object
+        tender_facts = self._tender_facts.get(id(tender))
+        if tender_facts is None or tender_facts.tender is not tender:
+            tender_facts = self._tender_facts[id(tender)] = TenderFacts(tender)
+        return tender_facts
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter, OrderedDict
+
+from pymongo import DESCENDING
+from pymongo.errors import ExecutionTimeout, PyMongoError
+
+from prozorro.risks.settings import (
+    COUNT_CACHE_SIZE,
+    COUNT_CACHE_TTL,
+    COUNT_EXACT_MAX_TIME,
+    COUNT_HIGH_WATER_MARK_TTL,
+    MAX_TIME_QUERY,
+    RISK_COUNTERS_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+# filters which can be answered by per-(region, risk) counters, dateAssessed is the same for all counts
+ESTIMABLE_FILTERS = frozenset({"has_risks", "procuringEntityRegion", "worked_risks", "dateAssessed"})
+
+
+def canonicalize_filters(filters):
+    """
+    Build cache key of filters, which doesn't depend on order of keys and values
+    :param filters: dict Filters built by `build_tender_filters`
+    :return: str
+    """
+    def default(value):
+        if isinstance(value, re.Pattern):
+            return {"$regex": value.pattern}
+        raise TypeError(f"Object of type {type(value).__name__} can't be a part of count cache key")
+
+    def canonicalize(value):
+        if isinstance(value, dict):
+            return {key: canonicalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return sorted((canonicalize(item) for item in value), key=lambda item: json.dumps(item, default=default))
+        return value
+
+    return json.dumps(canonicalize(filters), sort_keys=True, default=default)
+
+
+async def get_date_assessed_high_water_mark(collection, filters=None):
+    """
+    Get the last dateAssessed of tenders with risks (it's changed after every assessment with risks)
+    :param collection: risks collection
+    :param filters: dict Filters of tenders instead of tenders with risks (e.g. {} for all assessed tenders)
+    """
+    tender = await collection.find_one(
+        {"has_risks": True} if filters is None else filters,
+        projection={"dateAssessed": True},
+        sort=[("dateAssessed", DESCENDING)],
+    )
+    return tender.get("dateAssessed") if tender else None
+
+
+class RiskCounters:
+    """
+    Numbers of tenders with risks per region and per (region, risk) from risk_stats collection.
+    They are used for estimating counts of very broad filters, when exact count is too slow.
+    Counters are refreshed in background once per `RISK_COUNTERS_TTL` seconds.
+    """
+
+    def __init__(self, ttl=RISK_COUNTERS_TTL):
+        self.ttl = ttl
+        self.regions = None
+        self.risks = None
+        self.updated_at = None
+        self._refresh_task = None
+
+    def is_stale(self):
+        return self.updated_at is None or time.monotonic() - self.updated_at > self.ttl
+
+    async def load(self):
+        from prozorro.risks.db import get_risk_stats_collection
+
+        regions, risks = Counter(), Counter()
+        async for stats in get_risk_stats_collection().find({}):
+            region, risk = stats["_id"]["region"], stats["_id"]["risk"]
+            if risk is None:
+                regions[region] += stats["count"]
+            else:
+                risks[(region, risk)] += stats["count"]
+        return regions, risks
+
+    async def refresh(self):
+        try:
+            self.regions, self.risks = await self.load()
+        except PyMongoError as e:
+            logger.warning(f"Refresh risk counters {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+        else:
+            self.updated_at = time.monotonic()
+
+    def schedule_refresh(self):
+        if self.is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.ensure_future(self.refresh())
+
+    @staticmethod
+    def _matches(risk, value):
+        return bool(value.match(risk)) if isinstance(value, re.Pattern) else risk == value
+
+    def estimate(self, filters):
+        """
+        Estimate count of tenders for filters by region and risks.
+        Tenders with several risks are counted for every risk, so count of filter by risks is an upper bound.
+        :param filters: dict Filters built by `build_tender_filters`
+        :return: int or None if counters aren't loaded yet or filters can't be estimated
+        """
+        if self.regions is None or not ESTIMABLE_FILTERS.issuperset(filters):
+            return None
+        if "procuringEntityRegion" in filters:
+            regions = set(filters["procuringEntityRegion"]["$in"])
+        else:
+            regions = set(self.regions)
+        worked_risks = filters.get("worked_risks")
+        if not worked_risks:
+            return sum(self.regions[region] for region in regions)
+        operator, values = next(iter(worked_risks.items()))
+        counts = {}
+        for (region, risk), count in self.risks.items():
+            if region in regions:
+                counts[risk] = counts.get(risk, 0) + count
+        if operator == "$all":
+            return min(
+                sum(count for risk, count in counts.items() if self._matches(risk, value))
+                for value in values
+            )
+        return sum(count for risk, count in counts.items() if any(self._matches(risk, value) for value in values))
+
+
+class CountCache:
+    """
+    Counts of filtered tenders keyed by canonicalized filters.
+    Cached count is valid for `ttl` seconds while dateAssessed high-water mark stays the same,
+    the mark is read at most once per `high_water_mark_ttl` seconds for all filters.
+    Filters by region and risks only are counted with lower time limit and estimated by `RiskCounters` after that,
+    until counters are loaded they are counted with usual time limit.
+    """
+
+    def __init__(
+        self,
+        ttl=COUNT_CACHE_TTL,
+        maxsize=COUNT_CACHE_SIZE,
+        counters=None,
+        high_water_mark_ttl=COUNT_HIGH_WATER_MARK_TTL,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.counters = counters or RiskCounters()
+        self.high_water_mark_ttl = high_water_mark_ttl
+        self._counts = OrderedDict()
+        self._high_water_mark = None
+        self._high_water_mark_expires_at = None
+
+    def clear(self):
+        self._counts.clear()
+        self._high_water_mark_expires_at = None
+
+    async def get_high_water_mark(self, collection):
+        if self._high_water_mark_expires_at is None or self._high_water_mark_expires_at <= time.monotonic():
+            self._high_water_mark = await get_date_assessed_high_water_mark(collection)
+            self._high_water_mark_expires_at = time.monotonic() + self.high_water_mark_ttl
+        return self._high_water_mark
+
+    def _get_cached(self, key, high_water_mark):
+        entry = self._counts.get(key)
+        if entry is None:
+            return None
+        count, estimated, expires_at, entry_high_water_mark = entry
+        if expires_at < time.monotonic() or entry_high_water_mark != high_water_mark:
+            del self._counts[key]
+            return None
+        self._counts.move_to_end(key)
+        return count, estimated
+
+    def _set_cached(self, key, high_water_mark, count, estimated):
+        self._counts[key] = (count, estimated, time.monotonic() + self.ttl, high_water_mark)
+        self._counts.move_to_end(key)
+        while len(self._counts) > self.maxsize:
+            self._counts.popitem(last=False)
+
+    async def count(self, collection, filters):
+        """
+        Get count of tenders for filters
+        :param collection: risks collection
+        :param filters: dict Filters built by `build_tender_filters`
+        :return: tuple Count and flag whether count is estimated
+        :raises ExecutionTimeout: if count can't be calculated in time and can't be estimated
+        """
+        key = canonicalize_filters(filters)
+        high_water_mark = await self.get_high_water_mark(collection)
+        if cached := self._get_cached(key, high_water_mark):
+            return cached
+        estimable = ESTIMABLE_FILTERS.issuperset(filters)
+        if estimable:
+            self.counters.schedule_refresh()
+        try:
+            count = await collection.count_documents(
+                filters,
+                maxTimeMS=COUNT_EXACT_MAX_TIME if estimable else MAX_TIME_QUERY,
+            )
+            estimated = False
+        except ExecutionTimeout:
+            if not estimable:
+                raise
+            count = self.counters.estimate(filters)
+            estimated = count is not None
+            if not estimated:
+                # counters aren't loaded yet (e.g. just after start)
+                count = await collection.count_documents(filters, maxTimeMS=MAX_TIME_QUERY)
+        self._set_cached(key, high_water_mark, count, estimated)
+        return count, estimated
+
+
+COUNT_CACHE = CountCache()
@@ -1,7 +1,15 @@
+import asyncio
 from collections import defaultdict
 from datetime import datetime
+from prozorro_crawler.main import main
+from prozorro.risks.clients import cleanup_http_clients, init_http_clients
+from prozorro.risks.context import RiskContext
+from prozorro.risks.db import cleanup_db_client, init_mongodb
 from prozorro.risks.exceptions import SkipException
 from prozorro.risks.models import BaseRiskResult
+from prozorro.risks.rules.catalogue import RISK_RULE_METADATA_FIELDS
+from prozorro.risks.rules.registry import RuleSet, RulesRegistry
+from prozorro.risks.settings import RISK_RULES_METADATA_REFERENCED
 from prozorro.risks.utils import get_now
 
 
@@ -11,6 +19,42 @@ RISKS_METHODS_MAPPING = {
 }
 
 
+async def init_crawler(*args):
+    """
+    Crawler init task: connect to database and create long-lived http clients for rules
+    """
+    await asyncio.gather(
+        init_mongodb(*args),
+        init_http_clients(*args),
+    )
+
+
+async def cleanup_crawler(*args):
+    """
+    Crawler cleanup task: close long-lived http clients and database client
+    """
+    await asyncio.gather(
+        cleanup_http_clients(*args),
+        cleanup_db_client(*args),
+    )
+
+
+def run_crawler(data_handler):
+    """
+    Run crawler with init task, prozorro_crawler main has no cleanup hook,
+    so cleanup task is run on crawler event loop after main is finished (or failed)
+    :param data_handler: Coroutine function, that processes crawler feed page
+    """
+    try:
+        main(data_handler, init_task=init_crawler)
+    finally:
+        loop = asyncio.get_event_loop()
+        if loop.is_closed():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        loop.run_until_complete(cleanup_crawler())
+
+
 def get_risk_info(item, risk_rule):
     risk = {
         "risk_id": risk_rule.identifier,
@@ -27,33 +71,45 @@ def get_risk_info(item, risk_rule):
             "id": item.id,
             "type": item.type,
         }
+    if RISK_RULES_METADATA_REFERENCED:
+        for field in RISK_RULE_METADATA_FIELDS:
+            del risk[field]
     return risk
 
 
-async def process_risks(obj, rules, resource="tenders", parent_object=None):
+async def process_risks(obj, rules, resource="tenders", parent_object=None, context=None):
     """
     Loop for all risk modules in known module path and process provided object
 
     :param obj: dict Object for processing (could be tender or contract)
-    :param rules: list List of RiskRule instances
+    :param rules: list List of RiskRule instances, RuleSet or RulesRegistry, which prunes rules that can't match object
     :param resource: str Resource that points what kind of objects should be processed
+    :param parent_object: dict Tender of processed contract
+    :param context: RiskContext Shared resources for rules
     :return: dict Processed risks for object (e.g. {"sas-3-1": {...}, "sas-3-2": {...}})
     """
+    if context is None:
+        context = RiskContext()
+    today = get_now().date()
+    if isinstance(rules, RuleSet):
+        active_rules = rules.get_active_rules(today)
+    else:
+        active_rules = [risk_rule for risk_rule in rules if risk_rule.descriptor.is_active_on(today)]
+    candidates = rules.get_candidates(obj) if isinstance(rules, RulesRegistry) else None
+    date_created = datetime.fromisoformat(obj["dateCreated"]).date() if obj.get("dateCreated") else None
+    processed, pruned = 0, 0
     risks = defaultdict(list)
-    for risk_rule in rules:
-        if risk_rule.end_date and get_now().date() >= datetime.strptime(risk_rule.end_date, "%Y-%m-%d").date():
+    for risk_rule in active_rules:
+        if not risk_rule.descriptor.applies_to_date(date_created):
             continue
-        if (
-            risk_rule.start_date
-            and obj.get("dateCreated")
-            and datetime.fromisoformat(obj["dateCreated"]).date() < datetime.strptime(
-                risk_rule.start_date, "%Y-%m-%d"
-            ).date()
-        ):
+        if candidates is not None and risk_rule not in candidates:
+            pruned += 1
+            risks[risk_rule.identifier].append(get_risk_info(risk_rule.not_matched_result(obj), risk_rule))
             continue
+        processed += 1
         process_method = getattr(risk_rule, RISKS_METHODS_MAPPING[resource])
         try:
-            risk_result = await process_method(obj, parent_object=parent_object)
+            risk_result = await process_method(obj, parent_object=parent_object, context=context)
         except SkipException:
             continue
         else:
@@ -64,4 +120,6 @@ async def process_risks(obj, rules, resource="tenders", parent_object=None):
                 for item in risk_result:
                     risk = get_risk_info(item, risk_rule)
                     risks[risk_rule.identifier].append(risk)
+    if candidates is not None:
+        rules.count_pruned(processed, pruned)
     return risks
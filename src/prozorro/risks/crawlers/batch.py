@@ -0,0 +1,19 @@
+import asyncio
+
+from prozorro.risks.db import bulk_save_tenders, bulk_update_tender_risks
+
+
+async def process_risks_batch(assessments, tenders=None):
+    """
+    Batch pipeline for crawler feed page.
+    All objects are assessed concurrently, then results are saved with one bulk write to risks collection
+    and tenders are replaced concurrently in tenders collection.
+
+    :param assessments: list of coroutines, that return arguments for `update_tender_risks` or None
+    :param tenders: list of tenders, which should be saved for calculating historical data
+    """
+    updates = await asyncio.gather(*assessments)
+    await bulk_update_tender_risks([update for update in updates if update])
+    if tenders:
+        # for some risk rules it is required to have saved tenders in database for processing statistics
+        await bulk_save_tenders(tenders)
@@ -1,14 +1,15 @@
 import sys
-from datetime import datetime
 
-from prozorro_crawler.main import main
-from prozorro.risks.crawlers.base import process_risks
-from prozorro.risks.db import init_mongodb, update_tender_risks
+from prozorro.risks.context import RiskContext
+from prozorro.risks.crawlers.base import process_risks, run_crawler
+from prozorro.risks.crawlers.batch import process_risks_batch
+from prozorro.risks.db import update_tender_risks
 from prozorro.risks.logging import setup_logging
 from prozorro.risks.requests import get_object_data
-from prozorro.risks.settings import SENTRY_DSN
+from prozorro.risks.settings import CRAWLER_BATCH_MODE, SENTRY_DSN
 from prozorro.risks.utils import get_now, fetch_tender, tender_should_be_checked_for_termination
 from prozorro.risks.rules import *  # noqa
+from prozorro.risks.rules.registry import RuleSet
 import asyncio
 import logging
 import sentry_sdk
@@ -22,21 +23,24 @@ CONTRACT_RISKS = []
 for module_name in RISK_MODULES:
     risk_module = getattr(sys.modules[RISK_RULES_MODULE], module_name)
     risk_rule = getattr(risk_module, "RiskRule")()
-    if risk_rule.end_date and get_now().date() >= datetime.strptime(risk_rule.end_date, "%Y-%m-%d").date():
-        continue
     if hasattr(risk_rule, "process_contract"):
         CONTRACT_RISKS.append(risk_rule)
+CONTRACT_RISKS = RuleSet(CONTRACT_RISKS)
 API_RESOURCE = "contracts"
 
 
-async def process_contract(contract):
+async def assess_contract(contract, context=None):
     """
-    Process contract with provided risk rules and save results to database
+    Process contract with provided risk rules
     :param contract: dict Contract data
+    :param context: RiskContext Shared resources for rules
+    :return: tuple Arguments for `update_tender_risks` or None if there is nothing to save
     """
     uid = contract.get("tender_id")
-    tender = await fetch_tender(uid)
-    risks = await process_risks(contract, CONTRACT_RISKS, resource=API_RESOURCE, parent_object=tender)
+    tender = await fetch_tender(uid, context=context)
+    risks = await process_risks(
+        contract, CONTRACT_RISKS, resource=API_RESOURCE, parent_object=tender, context=context
+    )
     if risks or tender_should_be_checked_for_termination(tender):
         updated_fields = {
             "dateCreated": tender.get("dateCreated"),
@@ -50,29 +54,53 @@ async def process_contract(contract):
         }
         if risks:
             updated_fields["dateAssessed"] = get_now().isoformat()
-        await update_tender_risks(
-            uid,
-            risks,
-            updated_fields,
-            contracts=[contract],
-        )
+        return uid, risks, updated_fields, [contract]
+
+
+async def process_contract(contract, context=None):
+    """
+    Process contract with provided risk rules and save results to database
+    :param contract: dict Contract data
+    :param context: RiskContext Shared resources for rules
+    """
+    if update := await assess_contract(contract, context=context):
+        await update_tender_risks(*update)
 
 
-async def fetch_and_process_contract(session, contract_id):
+async def fetch_and_process_contract(session, contract_id, context=None):
     """
     Fetch more detailed information about contract and process tender whether it has risks
 
     :param session: ClientSession
     :param contract_id: str Id of particular contract
+    :param context: RiskContext Shared resources for rules
     """
     contract = await get_object_data(session, contract_id, resource=API_RESOURCE)
-    await process_contract(contract)
+    await process_contract(contract, context=context)
+
+
+async def process_contracts_batch(session, items, context=None):
+    """
+    Fetch and process all contracts of feed page, save results with bulk write.
+
+    :param session: ClientSession
+    :param items: list Feed items
+    :param context: RiskContext Shared resources for rules
+    """
+    contracts = await asyncio.gather(
+        *(get_object_data(session, item["id"], resource=API_RESOURCE) for item in items)
+    )
+    await process_risks_batch([assess_contract(contract, context=context) for contract in contracts])
 
 
 async def risks_data_handler(session, items):
+    context = RiskContext()
+    if CRAWLER_BATCH_MODE:
+        await process_contracts_batch(session, items, context=context)
+        return
     process_items_tasks = []
     for item in items:
-        coroutine = fetch_and_process_contract(session, item["id"])
+        coroutine = fetch_and_process_contract(session, item["id"], context=context)
         process_items_tasks.append(coroutine)
     await asyncio.gather(*process_items_tasks)
 
@@ -82,4 +110,4 @@ if __name__ == "__main__":
     if SENTRY_DSN:
         sentry_sdk.init(dsn=SENTRY_DSN)
     logger.info("Contract crawler started")
-    main(risks_data_handler, init_task=init_mongodb)
+    run_crawler(risks_data_handler)
@@ -1,14 +1,23 @@
 import sys
 from datetime import datetime
 
-from prozorro_crawler.main import main
-from prozorro.risks.crawlers.base import process_risks
-from prozorro.risks.db import init_mongodb, save_tender, update_tender_risks
+from prozorro.risks.context import RiskContext
+from prozorro.risks.crawlers.base import process_risks, run_crawler
+from prozorro.risks.crawlers.batch import process_risks_batch
+from prozorro.risks.db import save_tender, update_tender_risks
+from prozorro.risks.exchange_rates import add_values_uah
+from prozorro.risks.historical_data import build_historical_projection, get_historical_tender
 from prozorro.risks.logging import setup_logging
 from prozorro.risks.requests import get_object_data
-from prozorro.risks.settings import CRAWLER_START_DATE, SENTRY_DSN
+from prozorro.risks.settings import (
+    CRAWLER_BATCH_MODE,
+    CRAWLER_START_DATE,
+    HISTORICAL_TENDERS_PROJECTION,
+    SENTRY_DSN,
+)
 from prozorro.risks.utils import get_now, tender_should_be_checked_for_termination, get_subject_of_procurement
 from prozorro.risks.rules import *  # noqa
+from prozorro.risks.rules.registry import RulesRegistry
 import asyncio
 import logging
 import sentry_sdk
@@ -22,25 +31,57 @@ TENDER_RISKS = []
 for module_name in RISK_MODULES:
     risk_module = getattr(sys.modules[RISK_RULES_MODULE], module_name)
     risk_rule = getattr(risk_module, "RiskRule")()
-    if risk_rule.end_date and get_now().date() >= datetime.strptime(risk_rule.end_date, "%Y-%m-%d").date():
-        continue
     if hasattr(risk_rule, "process_tender"):
         TENDER_RISKS.append(risk_rule)
+TENDER_RISKS = RulesRegistry(TENDER_RISKS)
+# tenders collection is read by historical queries of tender rules and by contracts crawler,
+# so fields registered by all rules are saved
+HISTORICAL_PROJECTION = build_historical_projection(
+    getattr(sys.modules[RISK_RULES_MODULE], module_name).RiskRule for module_name in RISK_MODULES
+) if HISTORICAL_TENDERS_PROJECTION else None
 
 
-async def process_tender(tender, tender_risks=TENDER_RISKS):
+def prepare_tender(tender):
     """
-    Process tender with provided risk rules and save processed results to database.
-    Also save tender to tenders mongo collection for calculating historical data.
-
+    Add derived fields to tender, which are required for processing risks and calculating historical data
     :param tender: dict Tender data
-    :param tender_risks: list of risk rules
     """
     identifier = tender.get("procuringEntity", {}).get("identifier", {})
     tender["procuringEntityIdentifier"] = f'{identifier.get("scheme", "")}-{identifier.get("id", "")}'
     tender["subjectOfProcurement"] = get_subject_of_procurement(tender)
 
-    risks = await process_risks(tender, tender_risks)
+
+async def add_tenders_values_uah(tenders, context=None):
+    """
+    Add values in UAH to tenders and their contracts, so historical queries compare and sum them in the database.
+    Value of tender is exchanged by rate on tenderPeriod.startDate (open tenders are compared by it)
+    or on dateCreated (reporting), value of contract by rate on its date.
+    :param tenders: list of tenders
+    :param context: RiskContext Shared resources for rules
+    """
+    await add_values_uah(
+        [
+            (tender, (tender.get("tenderPeriod") or {}).get("startDate") or tender.get("dateCreated"))
+            for tender in tenders
+        ] + [
+            (contract, contract.get("date"))
+            for tender in tenders
+            for contract in tender.get("contracts", [])
+        ],
+        context=context,
+    )
+
+
+async def assess_tender(tender, tender_risks=TENDER_RISKS, context=None):
+    """
+    Process tender with provided risk rules.
+
+    :param tender: dict Tender data
+    :param tender_risks: list of risk rules
+    :param context: RiskContext Shared resources for rules
+    :return: tuple Arguments for `update_tender_risks` or None if there is nothing to save
+    """
+    risks = await process_risks(tender, tender_risks, context=context)
     if risks or tender_should_be_checked_for_termination(tender):
         tender_data = {
             "dateCreated": tender.get("dateCreated"),
@@ -54,38 +95,92 @@ async def process_tender(tender, tender_risks=TENDER_RISKS):
         }
         if risks:
             tender_data["dateAssessed"] = get_now().isoformat()
-        await update_tender_risks(
+        return (
             tender["id"],
             risks,
             tender_data,
-            contracts=tender["contracts"] if tender.get("contracts") else None,
+            tender["contracts"] if tender.get("contracts") else None,
         )
 
+
+async def process_tender(tender, tender_risks=TENDER_RISKS, context=None):
+    """
+    Process tender with provided risk rules and save processed results to database.
+    Also save tender to tenders mongo collection for calculating historical data.
+
+    :param tender: dict Tender data
+    :param tender_risks: list of risk rules
+    :param context: RiskContext Shared resources for rules
+    """
+    prepare_tender(tender)
+    await add_tenders_values_uah([tender], context=context)
+    if update := await assess_tender(tender, tender_risks=tender_risks, context=context):
+        await update_tender_risks(*update)
+
     # for some risk rules it is required to have saved tenders in database for processing statistics
-    await save_tender(tender)
+    await save_tender(get_historical_tender(tender, HISTORICAL_PROJECTION))
 
 
-async def fetch_and_process_tender(session, tender_id, tender_risks=TENDER_RISKS):
+async def fetch_tender_for_processing(session, tender_id):
     """
-    Fetch more detailed information about tender and process tender whether it has risks.
+    Fetch more detailed information about tender.
     Crawler offset is watching dateModified field that's why here is validation
     whether tender dateCreated is more than or equal CRAWLER_START_DATE, just to filter out old tenders.
 
     :param session: ClientSession
     :param tender_id: str Id of particular tender
-    :param tender_risks: list of risk rules
+    :return: dict Tender data or None if tender is too old for processing
     """
     tender = await get_object_data(session, tender_id)
     if datetime.fromisoformat(tender["dateCreated"]) >= CRAWLER_START_DATE:
-        await process_tender(tender, tender_risks=tender_risks)
+        return tender
+
+
+async def fetch_and_process_tender(session, tender_id, tender_risks=TENDER_RISKS, context=None):
+    """
+    Fetch more detailed information about tender and process tender whether it has risks.
+
+    :param session: ClientSession
+    :param tender_id: str Id of particular tender
+    :param tender_risks: list of risk rules
+    :param context: RiskContext Shared resources for rules
+    """
+    if tender := await fetch_tender_for_processing(session, tender_id):
+        await process_tender(tender, tender_risks=tender_risks, context=context)
+
+
+async def process_tenders_batch(session, items, tender_risks=TENDER_RISKS, context=None):
+    """
+    Fetch and process all tenders of feed page, save results with bulk writes.
+
+    :param session: ClientSession
+    :param items: list Feed items
+    :param tender_risks: list of risk rules
+    :param context: RiskContext Shared resources for rules
+    """
+    tenders = await asyncio.gather(*(fetch_tender_for_processing(session, item["id"]) for item in items))
+    tenders = [tender for tender in tenders if tender]
+    for tender in tenders:
+        prepare_tender(tender)
+    await add_tenders_values_uah(tenders, context=context)
+    await process_risks_batch(
+        [assess_tender(tender, tender_risks=tender_risks, context=context) for tender in tenders],
+        tenders=[get_historical_tender(tender, HISTORICAL_PROJECTION) for tender in tenders],
+    )
 
 
 async def risks_data_handler(session, items):
-    process_items_tasks = []
-    for item in items:
-        coroutine = fetch_and_process_tender(session, item["id"])
-        process_items_tasks.append(coroutine)
-    await asyncio.gather(*process_items_tasks)
+    context = RiskContext()
+    if CRAWLER_BATCH_MODE:
+        await process_tenders_batch(session, items, context=context)
+    else:
+        process_items_tasks = []
+        for item in items:
+            coroutine = fetch_and_process_tender(session, item["id"], context=context)
+            process_items_tasks.append(coroutine)
+        await asyncio.gather(*process_items_tasks)
+    TENDER_RISKS.log_stats()
+    context.historical_cache.log_stats()
 
 
 if __name__ == "__main__":
@@ -93,4 +188,4 @@ if __name__ == "__main__":
     if SENTRY_DSN:
         sentry_sdk.init(dsn=SENTRY_DSN)
     logger.info("Tender crawler started")
-    main(risks_data_handler, init_task=init_mongodb)
+    run_crawler(risks_data_handler)
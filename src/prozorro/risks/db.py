@@ -2,23 +2,33 @@ import asyncio
 import logging
 import re
 from contextvars import ContextVar
+from datetime import datetime
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from prozorro.risks.settings import (
     CRAWLER_START_DATE,
+    HISTORICAL_QUERY_BATCH_SIZE,
     MONGODB_URL,
     DB_NAME,
     READ_PREFERENCE,
+    REPORT_BATCH_SIZE,
     REPORT_ITEMS_LIMIT,
     WRITE_CONCERN,
     READ_CONCERN,
     MAX_TIME_QUERY,
     MONGODB_ERROR_INTERVAL,
+    MONGODB_ERROR_MAX_INTERVAL,
+    MONGODB_UPDATE_RETRIES,
+    RISK_HISTORY_COLLECTION_ENABLED,
+    RISK_HISTORY_MAX_DEPTH,
+    TIMEZONE,
 )
+from prozorro.risks.counts import COUNT_CACHE
 from prozorro.risks.models import RiskIndicatorEnum
-from prozorro.risks.utils import clamp_limit, clamp_skip, strtobool
-from pymongo import ASCENDING, DESCENDING, IndexModel
-from pymongo.errors import ExecutionTimeout, PyMongoError
+from prozorro.risks.reports import REPORT_PROJECTION
+from prozorro.risks.utils import clamp_limit, clamp_skip, decode_cursor, encode_cursor, strtobool
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout, PyMongoError
 from aiohttp import web
 
 logger = logging.getLogger(__name__)
@@ -31,6 +41,41 @@ SORTABLE_FIELDS = frozenset({
     "worked_risks",
     "terminated",
 })
+# array fields are sorted by their min (max) element, so they can't be paginated by range of values
+CURSOR_SORTABLE_FIELDS = SORTABLE_FIELDS - {"worked_risks"}
+# fields of risks collection that aren't returned by API
+HIDDEN_TENDER_FIELDS = (
+    "procuringEntityRegion",
+    "procuringEntityEDRPOU",
+    "worked_risks",
+    "contracts",
+    "stats_previous",
+)
+# fields of tender that are counted in risk_stats collection
+RISK_STATS_PROJECTION = {
+    "procuringEntityRegion": True,
+    "worked_risks": True,
+    "terminated": True,
+    "value.amount": True,
+    "stats_previous": True,
+}
+# fields of historical tender that are counted in entity_supplier_cpvs collection
+ENTITY_SUPPLIER_CPVS_PROJECTION = {
+    "procuringEntityIdentifier": True,
+    "procurementMethodType": True,
+    "mainProcurementCategory": True,
+    "contracts.dateSigned": True,
+    "contracts.suppliers.identifier": True,
+    "contracts.items.classification.id": True,
+}
+ENTITY_SUPPLIER_CPVS_KEY_FIELDS = (
+    "procuringEntityIdentifier",
+    "supplierIdentifier",
+    "year",
+    "procurementMethodType",
+    "mainProcurementCategory",
+    "cpv",
+)
 
 DB = None
 session_var = ContextVar("session", default=None)
@@ -54,6 +99,9 @@ async def init_mongodb(*_):
     await asyncio.gather(
         init_risks_indexes(),
         init_tender_indexes(),
+        init_risk_history_indexes(),
+        init_report_jobs_indexes(),
+        init_entity_supplier_cpvs_indexes(),
     )
     return DB
 
@@ -69,7 +117,13 @@ async def flush_database(*_):
     await asyncio.gather(
         get_risks_collection().delete_many({}),
         get_tenders_collection().delete_many({}),
+        get_exchange_rates_collection().delete_many({}),
+        get_risk_history_collection().delete_many({}),
+        get_risk_stats_collection().delete_many({}),
+        get_report_jobs_collection().delete_many({}),
+        get_entity_supplier_cpvs_collection().delete_many({}),
     )
+    COUNT_CACHE.clear()
 
 
 def get_risks_collection():
@@ -80,6 +134,26 @@ def get_tenders_collection():
     return DB.tenders
 
 
+def get_exchange_rates_collection():
+    return DB.exchange_rates
+
+
+def get_risk_history_collection():
+    return DB.risk_history
+
+
+def get_risk_stats_collection():
+    return DB.risk_stats
+
+
+def get_report_jobs_collection():
+    return DB.report_jobs
+
+
+def get_entity_supplier_cpvs_collection():
+    return DB.entity_supplier_cpvs
+
+
 async def init_risks_indexes():
     """
     Create plain and compound indexes for risks collection
@@ -137,9 +211,9 @@ async def init_risks_indexes():
             "has_risks": True,
         },
     )
-    # for risks feed
+    # for risks feed, _id breaks ties of tenders assessed at the same time
     date_assessed_feed_index = IndexModel(
-        [("dateAssessed", DESCENDING)],
+        [("dateAssessed", DESCENDING), ("_id", DESCENDING)],
         background=True,
     )
 
@@ -188,10 +262,77 @@ async def init_tender_indexes():
         logger.exception(e)
 
 
-async def get_risks(tender_id):
+async def init_risk_history_indexes():
+    """
+    Create indexes for risk_history collection
+    """
+    if not RISK_HISTORY_COLLECTION_ENABLED:
+        return
+    tender_risk_index = IndexModel(
+        [
+            ("tender_id", ASCENDING),
+            ("risk_id", ASCENDING),
+            ("date", ASCENDING),
+        ],
+        background=True,
+    )
+    try:
+        await get_risk_history_collection().create_indexes([tender_risk_index])
+    except PyMongoError as e:
+        logger.exception(e)
+
+
+async def init_report_jobs_indexes():
+    """
+    Create indexes for report_jobs collection
+    """
+    status_index = IndexModel(
+        [
+            ("status", ASCENDING),
+            ("created", ASCENDING),
+        ],
+        background=True,
+    )
+    try:
+        await get_report_jobs_collection().create_indexes([status_index])
+    except PyMongoError as e:
+        logger.exception(e)
+
+
+async def init_entity_supplier_cpvs_indexes(collection=None):
+    """
+    Create indexes for entity_supplier_cpvs collection
+    :param collection: Collection for indexes (e.g. collection which is rebuilt), entity_supplier_cpvs by default
+    """
+    key_index = IndexModel(
+        [(field, ASCENDING) for field in ENTITY_SUPPLIER_CPVS_KEY_FIELDS],
+        unique=True,
+        background=True,
+    )
+    try:
+        await (collection or get_entity_supplier_cpvs_collection()).create_indexes([key_index])
+    except PyMongoError as e:
+        logger.exception(e)
+
+
+def build_tender_projection(fields=None):
+    """
+    Build projection of tenders returned by API
+    :param fields: iterable of top-level fields to return (all fields if empty), _id is always returned
+    :return: dict Projection without hidden fields
+    """
+    if not fields:
+        return {field: False for field in HIDDEN_TENDER_FIELDS}
+    projection = {field: True for field in fields if field not in HIDDEN_TENDER_FIELDS}
+    projection["_id"] = True
+    return projection
+
+
+async def get_risks(tender_id, fields=None):
     """
     Get risks for provided tender id
     :param tender_id: str Id of tender
+    :param fields: iterable of top-level fields to return (all fields if empty)
     :return: dict Tender with assessed risks result
     :raise: HTTPInternalServerError during mongo error
     :raise: HTTPNotFound if there is no tender in database with provided tender_id
@@ -200,12 +341,7 @@ async def get_risks(tender_id):
     try:
         result = await collection.find_one(
             {"_id": tender_id},
-            projection={
-                "procuringEntityRegion": False,
-                "procuringEntityEDRPOU": False,
-                "worked_risks": False,
-                "contracts": False,
-            },
+            projection=build_tender_projection(fields),
         )
     except PyMongoError as e:
         logger.error(f"Get tender {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
@@ -261,11 +397,12 @@ def parse_sort_field(request_sort):
     return sort_field
 
 
-async def find_tenders(skip=0, limit=20, **kwargs):
+async def find_tenders(skip=0, limit=20, fields=None, **kwargs):
     """
     Get list of tenders, filtered by request params
     :param skip: int Number of documents to skip (needed for pagination)
     :param limit: int Number of documents per page (needed for pagination)
+    :param fields: iterable of top-level fields to return (all fields if empty)
     :return: dict with filtered items and total count
     """
     collection = get_risks_collection()
@@ -280,157 +417,819 @@ async def find_tenders(skip=0, limit=20, **kwargs):
         skip,
         limit,
         sort=[(sort_field, sort_order)],
-        projection={
-            "procuringEntityRegion": False,
-            "procuringEntityEDRPOU": False,
-            "worked_risks": False,
-            "contracts": False,
-        },
+        projection=build_tender_projection(fields),
     )
     return result
 
 
-async def get_tenders_risks_feed(fields, offset_value=None, descending=False, limit=20):
+def get_field_value(obj, field):
+    for key in field.split("."):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+    return obj
+
+
+def build_cursor_filters(sort_field, sort_order, last_value, last_id):
+    """
+    Build range predicate for documents after the last one of previous page (sorted by sort field and _id)
+    :param sort_field: str Field for sorting
+    :param sort_order: int ASCENDING or DESCENDING
+    :param last_value: Value of sort field of the last document
+    :param last_id: str _id of the last document
+    :return: dict Filters
+    """
+    operator = "$gt" if sort_order == ASCENDING else "$lt"
+    same_value = {sort_field: last_value, "_id": {operator: last_id}}
+    # null (and missing) values are the lowest ones in sort order and can't be compared with $gt/$lt
+    if last_value is None:
+        if sort_order == ASCENDING:
+            return {"$or": [same_value, {sort_field: {"$ne": None}}]}
+        return same_value
+    conditions = [{sort_field: {operator: last_value}}, same_value]
+    if sort_order == DESCENDING:
+        conditions.append({sort_field: None})
+    return {"$or": conditions}
+
+
+async def count_tenders(collection, filters):
+    """
+    Get cached (or estimated for very broad filters) count of tenders
+    :return: tuple Count and flag whether count is estimated
+    """
+    # should be added additional field for using index during counting documents
+    filters = {**filters, "dateAssessed": {"$gte": CRAWLER_START_DATE.isoformat()}}
+    return await COUNT_CACHE.count(collection, filters)
+
+
+async def find_tenders_page(cursor=None, limit=20, with_count=False, fields=None, **kwargs):
+    """
+    Get page of tenders filtered by request params using keyset pagination.
+    Page starts after the document encoded in cursor, so every page takes the same time
+    (there is no skip) and total count is calculated only on demand.
+    :param cursor: str Cursor from `next_cursor` of previous page (None or empty for the first page)
+    :param limit: int Number of documents per page
+    :param with_count: bool Whether total count of filtered documents should be calculated
+    :param fields: iterable of top-level fields to return (all fields if empty)
+    :return: dict with filtered items, cursor of the next page (None for the last page) and optional total count
+    """
+    collection = get_risks_collection()
+    limit = clamp_limit(limit)
+    filters = build_tender_filters(**kwargs)
+    sort_field = parse_sort_field(kwargs.get("sort"))
+    if sort_field not in CURSOR_SORTABLE_FIELDS:
+        raise web.HTTPBadRequest(text=f"Sort field '{sort_field}' isn't supported by cursor pagination")
+    sort_order = ASCENDING if kwargs.get("order") == "asc" else DESCENDING
+    page_filters = filters
+    if cursor:
+        try:
+            cursor_sort_field, cursor_sort_order, last_value, last_id = decode_cursor(cursor)
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"Invalid cursor: {cursor}")
+        if (cursor_sort_field, cursor_sort_order) != (sort_field, sort_order):
+            raise web.HTTPBadRequest(text="Cursor was built for another sort field or order")
+        page_filters = {"$and": [filters, build_cursor_filters(sort_field, sort_order, last_value, last_id)]}
+    # value of sort field is needed for the next cursor, it's removed from items if it isn't returned
+    projection = build_tender_projection(fields)
+    sort_root_field = sort_field.split(".")[0]
+    if fields:
+        returns_sort_field = sort_root_field in projection
+        if not returns_sort_field:
+            projection[sort_field] = True
+    else:
+        returns_sort_field = sort_field not in HIDDEN_TENDER_FIELDS
+        projection.pop(sort_field, None)
+    try:
+        items = await collection.find(
+            page_filters,
+            projection=projection,
+            sort=[(sort_field, sort_order), ("_id", sort_order)],
+            limit=limit + 1,
+            max_time_ms=MAX_TIME_QUERY,
+        ).to_list(length=None)
+        if with_count:
+            count, count_estimated = await count_tenders(collection, filters)
+    except ExecutionTimeout as exc:
+        logger.error(f"Filter tenders {type(exc)}: {exc}, filters: {filters}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+        raise web.HTTPRequestTimeout(text="Please change filters combination to optimize query (e.g. edrpou + risks)")
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([sort_field, sort_order, get_field_value(items[-1], sort_field), items[-1]["_id"]])
+    if not returns_sort_field:
+        for item in items:
+            item.pop(sort_root_field, None)
+    result = dict(items=items, next_cursor=next_cursor)
+    if with_count:
+        result.update(count=count, count_estimated=count_estimated)
+    return result
+
+
+async def get_tenders_risks_feed(fields, offset_value=None, descending=False, limit=20, offset_id=None):
+    """
+    Get page of tenders ordered by (dateAssessed, _id)
+    :param fields: set of returned fields
+    :param offset_value: str dateAssessed of the last tender of the previous page
+    :param descending: bool
+    :param limit: int
+    :param offset_id: _id of the last tender of the previous page, without it all tenders
+        assessed at `offset_value` are skipped (offset by date only)
+    :return: list of tenders
+    """
     limit = clamp_limit(limit)
     collection = get_risks_collection()
     filters = dict()
-    if offset_value:
-        filters["dateAssessed"] = {"$lt" if descending else "$gt": offset_value}
+    operator = "$lt" if descending else "$gt"
+    if offset_value and offset_id is not None:
+        filters["$or"] = [
+            {"dateAssessed": {operator: offset_value}},
+            {"dateAssessed": offset_value, "_id": {operator: offset_id}},
+        ]
+    elif offset_value:
+        filters["dateAssessed"] = {operator: offset_value}
+    order = DESCENDING if descending else ASCENDING
     cursor = collection.find(
         filter=filters,
         projection={field_name: 1 for field_name in fields},
         limit=limit,
-        sort=(("dateAssessed", DESCENDING if descending else ASCENDING),),
+        sort=(("dateAssessed", order), ("_id", order)),
     )
     items = await cursor.to_list(length=None)
     return items
 
 
-def join_old_risks_with_new_ones(risks, tender):
+# contracts of tender with these statuses mean that tender isn't terminated yet
+NOT_TERMINATED_CONTRACT_STATUSES = ["active", "pending", "pending.winner-signing"]
+
+
+def get_risk_item_key(risk_item):
+    return risk_item["item"]["id"] if "item" in risk_item else "tender"
+
+
+def compact_risk_history(history, max_depth=None):
     """
-    Join previous results of tender risks assessment, create log and add it to risk's history.
-    :param risks: dict New assessed risks result {"sas-3-1": [...], "sas-3-2": [...]}
-    :param tender: dict Tender object from risks database with previously assessed risks indicators
-    :return: tuple Concatenated object of old and new risks for tender and array of total worked risk's identifiers
-    """
-    tender_risks = tender.get("risks", {})
-    tender_worked_risks = set(tender.get("worked_risks", []))
-    for risk_id, risk_items in risks.items():
-        current_risk_items = {}
-        for previous_risk_item in tender_risks.get(risk_id, []):
-            item_key = "tender" if "item" not in previous_risk_item else previous_risk_item["item"]["id"]
-            current_risk_items[item_key] = previous_risk_item
-        for risk_data in risk_items:
-            if risk_data["indicator"] == RiskIndicatorEnum.use_previous_result:
-                continue
-            log = {"date": risk_data["date"], "indicator": risk_data["indicator"]}
-            item_key = "tender" if "item" not in risk_data else risk_data["item"]["id"]
-            history = current_risk_items.get(item_key, {}).get("history", [])
-            history.append(log)
-            risk_data["history"] = history
-            current_risk_items[item_key] = risk_data
-        if risk_results := list(current_risk_items.values()):
-            tender_risks[risk_id] = risk_results
-            worked_items = [item for item in risk_results if item["indicator"] == RiskIndicatorEnum.risk_found]
-            if worked_items:
-                tender_worked_risks.add(risk_id)
-            elif risk_id in tender_worked_risks:
-                tender_worked_risks.remove(risk_id)
-    return tender_risks, list(tender_worked_risks)
-
-
-def update_contracts_statuses(contracts, tender):
-    tender_contracts = tender.get("contracts", {})
-    for contract in contracts:
-        if tender_contracts.get(contract["id"]) and tender_contracts[contract["id"]] == "terminated":
+    Compact history of risk item: only logs with changed indicator are kept (the first log of every run)
+    and history is limited by the last `max_depth` logs.
+    :param history: list Logs of risk item [{"date": ..., "indicator": ...}, ...]
+    :param max_depth: int Max number of logs (0 means unlimited), RISK_HISTORY_MAX_DEPTH by default
+    :return: list Compacted logs
+    """
+    if max_depth is None:
+        max_depth = RISK_HISTORY_MAX_DEPTH
+    compacted = []
+    for log in history:
+        if not compacted or compacted[-1]["indicator"] != log["indicator"]:
+            compacted.append(log)
+    return compacted[-max_depth:] if max_depth else compacted
+
+
+def build_risk_history_expression(logs):
+    """
+    Build expression that appends logs to history of previous risk item (`$$item`).
+    The first log isn't appended if previous history ends with the same indicator.
+    :param logs: list Compacted new logs of risk item
+    :return: dict Aggregation expression
+    """
+    history = {
+        "$let": {
+            "vars": {"history": {"$ifNull": ["$$item.history", []]}},
+            "in": {
+                "$concatArrays": [
+                    "$$history",
+                    {
+                        "$cond": [
+                            {"$eq": [
+                                {"$let": {
+                                    "vars": {"last": {"$arrayElemAt": ["$$history", -1]}},
+                                    "in": "$$last.indicator",
+                                }},
+                                logs[0]["indicator"],
+                            ]},
+                            {"$literal": logs[1:]},
+                            {"$literal": logs},
+                        ]
+                    },
+                ]
+            },
+        }
+    }
+    if RISK_HISTORY_MAX_DEPTH:
+        history = {"$slice": [history, -RISK_HISTORY_MAX_DEPTH]}
+    return history
+
+
+def get_new_risk_items(risk_items):
+    """
+    Get new assessed risk items with their logs by item key, items with previous result are skipped.
+    :param risk_items: list New assessed risk items
+    :return: dict {item_key: (risk item, list of logs)}
+    """
+    new_items = {}
+    for risk_data in risk_items:
+        if risk_data["indicator"] == RiskIndicatorEnum.use_previous_result:
             continue
-        tender_contracts[contract["id"]] = contract.get("status")
-    return tender_contracts
-
-
-def tender_is_terminated(tender, contracts, new_status):
-    contract_statuses = set(contracts.values())
-    status = new_status or tender.get("status")
-    return (
-        status in ("unsuccessful", "cancelled")
-        or (
-            status == "complete"
-            and len(contract_statuses) > 0
-            and not contract_statuses.intersection({"active", "pending", "pending.winner-signing"})
-        )
+        log = {"date": risk_data["date"], "indicator": risk_data["indicator"]}
+        item_key = get_risk_item_key(risk_data)
+        logs = new_items.pop(item_key, (None, []))[1] + [log]
+        new_items[item_key] = (risk_data, logs)
+    return new_items
+
+
+def get_risk_history_entries(uid, risks):
+    """
+    Build documents of risk_history collection with all logs of new assessed risks
+    :param uid: str Id of tender
+    :param risks: dict New assessed risks result
+    :return: list of documents
+    """
+    return [
+        {"tender_id": uid, "risk_id": risk_id, "item_id": item_key, **log}
+        for risk_id, risk_items in (risks or {}).items()
+        for item_key, (_, logs) in get_new_risk_items(risk_items).items()
+        for log in logs
+    ]
+
+
+async def save_risk_history(entries):
+    """
+    Save full history of risks to risk_history collection (if it is enabled).
+    History in risks collection is compacted, so this collection is the only place with every assessment log.
+    :param entries: list of documents built by `get_risk_history_entries`
+    """
+    if not RISK_HISTORY_COLLECTION_ENABLED or not entries:
+        return
+    try:
+        await get_risk_history_collection().insert_many(entries, ordered=False, session=session_var.get())
+    except PyMongoError as e:
+        logger.warning(f"Save risk history warning {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+
+
+def build_risk_items_expression(risk_id, risk_items):
+    """
+    Build expression that joins previous results of risk with new ones and adds logs to their history.
+    Previous item is replaced by new item with the same key (id of risk item or "tender")
+    and new items without previous results are appended.
+    :param risk_id: str Risk identifier
+    :param risk_items: list New assessed risk items
+    :return: dict Aggregation expression or None if there are no new results
+    """
+    new_items = {
+        item_key: ({**risk_data, "history": compact_risk_history(logs)}, compact_risk_history(logs, max_depth=0))
+        for item_key, (risk_data, logs) in get_new_risk_items(risk_items).items()
+    }
+    if not new_items:
+        return None
+    return {
+        "$let": {
+            "vars": {"previous": {"$ifNull": [f"$risks.{risk_id}", []]}},
+            "in": {
+                "$concatArrays": [
+                    {
+                        "$map": {
+                            "input": "$$previous",
+                            "as": "item",
+                            "in": {
+                                "$switch": {
+                                    "branches": [
+                                        {
+                                            "case": {"$eq": [{"$ifNull": ["$$item.item.id", "tender"]}, item_key]},
+                                            "then": {
+                                                **{field: {"$literal": value} for field, value in item.items()},
+                                                "history": build_risk_history_expression(logs),
+                                            },
+                                        }
+                                        for item_key, (item, logs) in new_items.items()
+                                    ],
+                                    "default": "$$item",
+                                }
+                            },
+                        }
+                    },
+                    {
+                        "$filter": {
+                            "input": {"$literal": [item for item, _ in new_items.values()]},
+                            "as": "item",
+                            "cond": {
+                                "$not": {
+                                    "$in": [
+                                        {"$ifNull": ["$$item.item.id", "tender"]},
+                                        {"$map": {
+                                            "input": "$$previous",
+                                            "as": "previous_item",
+                                            "in": {"$ifNull": ["$$previous_item.item.id", "tender"]},
+                                        }},
+                                    ]
+                                }
+                            },
+                        }
+                    },
+                ]
+            },
+        }
+    }
+
+
+def build_tender_risks_pipeline(risks, additional_fields, contracts=None):
+    """
+    Build aggregation pipeline for updating tender risks on top of previously saved tender.
+    All previous results are merged on the server side, so update is done with one round-trip
+    and doesn't depend on the size of stored risks history.
+    :param risks: dict New assessed risks result {"sas-3-1": [...], "sas-3-2": [...]}
+    :param additional_fields: dict Tender fields for saving
+    :param contracts: list Contracts with statuses
+    :return: list Update pipeline
+    """
+    merge_data = {}
+    if contracts:
+        # terminated contracts keep their status
+        for contract in contracts:
+            merge_data[f"contracts.{contract['id']}"] = {
+                "$cond": [
+                    {"$eq": [f"$contracts.{contract['id']}", "terminated"]},
+                    "terminated",
+                    {"$literal": contract.get("status")},
+                ]
+            }
+    else:
+        merge_data["contracts"] = {"$literal": {}}
+    assessed_risks = []
+    for risk_id, risk_items in (risks or {}).items():
+        if risk_items_expression := build_risk_items_expression(risk_id, risk_items):
+            merge_data[f"risks.{risk_id}"] = risk_items_expression
+            assessed_risks.append(risk_id)
+
+    new_status = additional_fields.get("status")
+    status = {"$literal": new_status} if new_status else "$status"
+    contract_statuses = {"$map": {"input": {"$objectToArray": "$contracts"}, "in": "$$this.v"}}
+    state_data = {
+        "terminated": {
+            "$or": [
+                {"$in": [status, ["unsuccessful", "cancelled"]]},
+                {
+                    "$and": [
+                        {"$eq": [status, "complete"]},
+                        {"$gt": [{"$size": contract_statuses}, 0]},
+                        {"$eq": [
+                            {"$size": {"$filter": {
+                                "input": contract_statuses,
+                                "as": "status",
+                                "cond": {"$in": ["$$status", NOT_TERMINATED_CONTRACT_STATUSES]},
+                            }}},
+                            0,
+                        ]},
+                    ]
+                },
+            ]
+        },
+    }
+    if risks:
+        state_data["worked_risks"] = {
+            "$concatArrays": [
+                {"$filter": {
+                    "input": {"$ifNull": ["$worked_risks", []]},
+                    "as": "risk",
+                    "cond": {"$not": {"$in": ["$$risk", assessed_risks]}},
+                }},
+                *(
+                    {"$cond": [{"$in": ["risk_found", f"$risks.{risk_id}.indicator"]}, [risk_id], []]}
+                    for risk_id in assessed_risks
+                ),
+            ]
+        }
+
+    fields_data = {field: {"$literal": value} for field, value in additional_fields.items()}
+    if risks:
+        fields_data["has_risks"] = {"$gt": [{"$size": "$worked_risks"}, 0]}
+    # counted fields before update are kept for calculating risk_stats deltas from updated document,
+    # snapshot isn't replaced until its delta is applied (see `apply_risk_stats_snapshots`),
+    # so repeated or concurrent updates are counted once from the last applied state
+    stats_data = {
+        "stats_previous": {
+            "$ifNull": [
+                "$stats_previous",
+                {
+                    "region": "$procuringEntityRegion",
+                    "worked_risks": "$worked_risks",
+                    "terminated": "$terminated",
+                    "amount": "$value.amount",
+                },
+            ]
+        }
+    }
+    return [{"$set": stats_data}, {"$set": merge_data}, {"$set": state_data}, {"$set": fields_data}]
+
+
+def get_risk_stats_keys(region, worked_risks, terminated, amount):
+    """
+    Get keys of risk_stats collection where tender is counted with its value amount.
+    Tender with risks is counted once for every worked risk and once for all risks (risk is None).
+    :return: dict {(region, risk, terminated): amount}
+    """
+    if not worked_risks:
+        return {}
+    amount = amount if isinstance(amount, (int, float)) else 0
+    return {(region, risk, bool(terminated)): amount for risk in (None, *worked_risks)}
+
+
+def get_risk_stats_deltas(tender):
+    """
+    Get changes of risk_stats collection after tender update
+    :param tender: dict Updated tender from risks collection with RISK_STATS_PROJECTION fields
+    :return: dict {(region, risk, terminated): (count delta, amount delta)}
+    """
+    previous = tender.get("stats_previous") or {}
+    previous_keys = get_risk_stats_keys(
+        previous.get("region"), previous.get("worked_risks"), previous.get("terminated"), previous.get("amount")
     )
+    current_keys = get_risk_stats_keys(
+        tender.get("procuringEntityRegion"),
+        tender.get("worked_risks"),
+        tender.get("terminated"),
+        (tender.get("value") or {}).get("amount"),
+    )
+    deltas = {}
+    for key in previous_keys.keys() | current_keys.keys():
+        count = int(key in current_keys) - int(key in previous_keys)
+        amount = current_keys.get(key, 0) - previous_keys.get(key, 0)
+        if count or amount:
+            deltas[key] = (count, amount)
+    return deltas
+
+
+def get_risk_stats_id(key):
+    region, risk, terminated = key
+    return {"region": region, "risk": risk, "terminated": terminated}
+
+
+async def update_risk_stats(deltas):
+    """
+    Apply changes of tenders to risk_stats collection with $inc
+    :param deltas: list of dicts built by `get_risk_stats_deltas`
+    """
+    total = {}
+    for tender_deltas in deltas:
+        for key, (count, amount) in tender_deltas.items():
+            total_count, total_amount = total.get(key, (0, 0))
+            total[key] = (total_count + count, total_amount + amount)
+    operations = [
+        UpdateOne({"_id": get_risk_stats_id(key)}, {"$inc": {"count": count, "amount": amount}}, upsert=True)
+        for key, (count, amount) in total.items()
+        if count or amount
+    ]
+    if not operations:
+        return
+    try:
+        await get_risk_stats_collection().bulk_write(operations, ordered=False, session=session_var.get())
+    except PyMongoError as e:
+        # stats can be fixed by `prozorro.risks.commands.rebuild_risk_stats`
+        logger.warning(f"Update risk stats warning {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
 
 
 async def update_tender_risks(uid, risks, additional_fields, contracts=None):
-    filters = {"_id": uid}
-    while True:
+    """
+    Update risks of tender with one aggregation pipeline update and apply its changes to risk_stats collection.
+    Failed update is repeated `MONGODB_UPDATE_RETRIES` times with exponential backoff,
+    after that the error is raised (repeated update of already updated tender keeps its stats snapshot).
+    :param uid: str Id of tender
+    :param risks: dict New assessed risks result
+    :param additional_fields: dict Tender fields for saving
+    :param contracts: list Contracts with statuses
+    """
+    pipeline = build_tender_risks_pipeline(risks, additional_fields, contracts)
+    for attempt in range(MONGODB_UPDATE_RETRIES + 1):
         try:
-            tender = await get_risks_collection().find_one({"_id": uid})
-            updated_contracts = update_contracts_statuses(contracts, tender if tender else {}) if contracts else {}
-            set_data = {
-                "_id": uid,
-                "contracts": updated_contracts,
-                "terminated": tender_is_terminated(
-                    tender if tender else {},
-                    updated_contracts,
-                    new_status=additional_fields.get("status")
-                ),
-                **additional_fields,
-            }
-            if risks:
-                risks, worked_risks = join_old_risks_with_new_ones(risks, tender if tender else {})
-                set_data.update({
-                    "risks": risks,
-                    "worked_risks": worked_risks,
-                    "has_risks": len(worked_risks) > 0,
-                })
-            if tender:
-                filters["dateAssessed"] = tender.get("dateAssessed")
             result = await get_risks_collection().find_one_and_update(
-                filters,
-                {"$set": set_data},
+                {"_id": uid},
+                pipeline,
+                projection={"_id": True},
                 upsert=True,
+                return_document=ReturnDocument.AFTER,
                 session=session_var.get(),
             )
         except PyMongoError as e:
+            if attempt >= MONGODB_UPDATE_RETRIES:
+                logger.error(
+                    f"Update risks error {type(e)}: {e}. Update of tender {uid} failed after {attempt + 1} attempts",
+                    extra={"MESSAGE_ID": "MONGODB_EXC"}
+                )
+                raise
             logger.warning(
                 f"Update risks warning {type(e)}: {e}. Update will be repeated",
                 extra={"MESSAGE_ID": "MONGODB_EXC"}
             )
-            await asyncio.sleep(MONGODB_ERROR_INTERVAL)
+            await asyncio.sleep(min(MONGODB_ERROR_INTERVAL * 2 ** attempt, MONGODB_ERROR_MAX_INTERVAL))
         else:
+            await apply_risk_stats_snapshots([uid])
+            await save_risk_history(get_risk_history_entries(uid, risks))
             return result
 
 
-async def save_tender(tender_data):
-    uid = tender_data.pop("id" if "id" in tender_data else "_id")
-    await get_tenders_collection().find_one_and_update(
+async def apply_risk_stats_snapshot(uid):
+    """
+    Consume stats_previous snapshot of updated tender: it's removed with the same atomic update
+    that reads current state of tender, so its delta is counted only once
+    (even if tender is updated by several crawlers at the same time).
+    :param uid: str Id of updated tender
+    :return: dict Delta built by `get_risk_stats_deltas` (empty if snapshot is already consumed)
+    """
+    tender = await get_risks_collection().find_one_and_update(
+        {"_id": uid, "stats_previous": {"$exists": True}},
+        {"$unset": {"stats_previous": ""}},
+        projection=RISK_STATS_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+        session=session_var.get(),
+    )
+    return get_risk_stats_deltas(tender) if tender else {}
+
+
+async def apply_risk_stats_snapshots(uids):
+    """
+    Update risk_stats collection after update of tenders.
+    If snapshot can't be consumed, it's kept and counted with the next update of tender.
+    :param uids: list Ids of updated tenders
+    """
+    if not uids:
+        return
+    try:
+        deltas = await asyncio.gather(*(apply_risk_stats_snapshot(uid) for uid in dict.fromkeys(uids)))
+    except PyMongoError as e:
+        logger.warning(f"Update risk stats warning {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+    else:
+        await update_risk_stats(deltas)
+
+
+async def bulk_update_tender_risks(updates):
+    """
+    Update risks of many tenders with one bulk write of pipeline updates.
+    Updates that failed (e.g. concurrent upsert of the same tender by another crawler)
+    and repeated updates of the same tender are applied one by one with `update_tender_risks`.
+    :param updates: list of tuples with `update_tender_risks` arguments (uid, risks, additional_fields, contracts)
+    """
+    if not updates:
+        return
+    bulk_updates, retry_updates = [], []
+    for update in updates:
+        if any(update[0] == bulk_update[0] for bulk_update in bulk_updates):
+            retry_updates.append(update)
+        else:
+            bulk_updates.append(update)
+    failed_indexes = set()
+    try:
+        operations = [
+            UpdateOne({"_id": uid}, build_tender_risks_pipeline(risks, additional_fields, contracts), upsert=True)
+            for uid, risks, additional_fields, contracts in bulk_updates
+        ]
+        await get_risks_collection().bulk_write(operations, ordered=False, session=session_var.get())
+    except BulkWriteError as e:
+        failed_indexes = {error["index"] for error in e.details.get("writeErrors", [])}
+        logger.warning(
+            f"Bulk update risks warning: {len(failed_indexes)} of {len(bulk_updates)} updates failed. "
+            f"They will be repeated one by one",
+            extra={"MESSAGE_ID": "MONGODB_EXC"},
+        )
+        retry_updates = [bulk_updates[index] for index in sorted(failed_indexes)] + retry_updates
+    except PyMongoError as e:
+        logger.warning(
+            f"Bulk update risks warning {type(e)}: {e}. Updates will be repeated one by one",
+            extra={"MESSAGE_ID": "MONGODB_EXC"},
+        )
+        failed_indexes = set(range(len(bulk_updates)))
+        retry_updates = bulk_updates + retry_updates
+    updated = [update for index, update in enumerate(bulk_updates) if index not in failed_indexes]
+    await apply_risk_stats_snapshots([uid for uid, *_ in updated])
+    await save_risk_history([
+        entry
+        for uid, risks, *_ in updated
+        for entry in get_risk_history_entries(uid, risks)
+    ])
+    for update in retry_updates:
+        await update_tender_risks(*update)
+
+
+def get_contract_year(date_signed):
+    """
+    Get year of contract signing, years are bounded the same way as in `historical_data.get_list_of_cpvs`
+    :param date_signed: str Date in ISO format
+    :return: int
+    """
+    year = int(date_signed[:4])
+    return year if date_signed >= datetime(year, 1, 1, tzinfo=TIMEZONE).isoformat() else year - 1
+
+
+def get_entity_supplier_cpvs_keys(tender):
+    """
+    Get keys of entity_supplier_cpvs collection where historical tender is counted.
+    Tender is counted for every supplier of its contracts and every year of their signing
+    with CPVs of contracts signed that year, just like it's matched by `historical_data.get_list_of_cpvs`.
+    :param tender: dict Historical tender (None if tender isn't saved yet)
+    :return: set of tuples with values of ENTITY_SUPPLIER_CPVS_KEY_FIELDS
+    """
+    if not tender or not tender.get("procuringEntityIdentifier"):
+        return set()
+    suppliers, year_cpvs = set(), {}
+    for contract in tender.get("contracts") or []:
+        for supplier in contract.get("suppliers") or []:
+            identifier = supplier.get("identifier") or {}
+            if identifier.get("scheme") and identifier.get("id"):
+                suppliers.add(f'{identifier["scheme"]}-{identifier["id"]}')
+        if isinstance(contract.get("dateSigned"), str):
+            cpvs = year_cpvs.setdefault(get_contract_year(contract["dateSigned"]), set())
+            for item in contract.get("items") or []:
+                if cpv := (item.get("classification") or {}).get("id"):
+                    cpvs.add(cpv)
+    return {
+        (
+            tender["procuringEntityIdentifier"],
+            supplier,
+            year,
+            tender.get("procurementMethodType"),
+            tender.get("mainProcurementCategory"),
+            cpv,
+        )
+        for supplier in suppliers
+        for year, cpvs in year_cpvs.items()
+        for cpv in cpvs
+    }
+
+
+def get_entity_supplier_cpvs_deltas(previous, current):
+    """
+    Get changes of entity_supplier_cpvs collection after historical tender update
+    :param previous: dict Previous revision of tender (None for new tender)
+    :param current: dict Saved revision of tender
+    :return: dict {key: count}
+    """
+    previous_keys = get_entity_supplier_cpvs_keys(previous)
+    current_keys = get_entity_supplier_cpvs_keys(current)
+    return {
+        **{key: -1 for key in previous_keys - current_keys},
+        **{key: 1 for key in current_keys - previous_keys},
+    }
+
+
+async def update_entity_supplier_cpvs(deltas):
+    """
+    Apply changes of historical tenders to entity_supplier_cpvs collection with $inc
+    :param deltas: list of dicts built by `get_entity_supplier_cpvs_deltas`
+    """
+    total = {}
+    for tender_deltas in deltas:
+        for key, count in tender_deltas.items():
+            total[key] = total.get(key, 0) + count
+    operations = [
+        UpdateOne(dict(zip(ENTITY_SUPPLIER_CPVS_KEY_FIELDS, key)), {"$inc": {"count": count}}, upsert=True)
+        for key, count in total.items()
+        if count
+    ]
+    if not operations:
+        return
+    try:
+        await get_entity_supplier_cpvs_collection().bulk_write(
+            operations, ordered=False, session=session_var.get()
+        )
+    except PyMongoError as e:
+        # collection can be fixed by `prozorro.risks.commands.rebuild_entity_supplier_cpvs`
+        logger.warning(f"Update entity supplier CPVs warning {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+
+
+async def replace_tender(uid, tender_data):
+    """
+    Replace tender in tenders collection with one atomic operation
+    :param uid: str Id of tender
+    :param tender_data: dict Tender without id
+    :return: dict Replaced revision of tender with ENTITY_SUPPLIER_CPVS_PROJECTION fields (None for new tender)
+    """
+    return await get_tenders_collection().find_one_and_replace(
         {"_id": uid},
-        {"$set": tender_data},
+        tender_data,
+        projection=ENTITY_SUPPLIER_CPVS_PROJECTION,
         upsert=True,
+        return_document=ReturnDocument.BEFORE,
         session=session_var.get(),
     )
 
 
+async def save_tender(tender_data):
+    """
+    Save tender to tenders collection, previous revision of tender is replaced
+    (so fields, which aren't saved anymore, are removed from existing documents).
+    Changes of contracts are applied to entity_supplier_cpvs collection.
+    :param tender_data: dict Tender with "id" or "_id"
+    """
+    uid = tender_data.pop("id" if "id" in tender_data else "_id")
+    previous = await replace_tender(uid, tender_data)
+    await update_entity_supplier_cpvs([get_entity_supplier_cpvs_deltas(previous, tender_data)])
+
+
+async def save_tender_revisions(uid, revisions):
+    """
+    Save revisions of one tender in order, failed save is repeated
+    :param uid: str Id of tender
+    :param revisions: list Revisions of tender without id
+    :return: list Deltas built by `get_entity_supplier_cpvs_deltas`
+    """
+    deltas = []
+    for tender_data in revisions:
+        while True:
+            try:
+                previous = await replace_tender(uid, tender_data)
+            except PyMongoError as e:
+                logger.warning(
+                    f"Bulk save tenders warning {type(e)}: {e}. Save will be repeated",
+                    extra={"MESSAGE_ID": "MONGODB_EXC"}
+                )
+                await asyncio.sleep(MONGODB_ERROR_INTERVAL)
+            else:
+                break
+        deltas.append(get_entity_supplier_cpvs_deltas(previous, tender_data))
+    return deltas
+
+
+async def bulk_save_tenders(tenders):
+    """
+    Save many tenders to tenders collection concurrently.
+    Every tender is replaced with atomic find_one_and_replace like in `save_tender`,
+    so changes of contracts are counted from the revision that was actually replaced
+    (even if the same tender is saved by another crawler at the same time)
+    and applied to entity_supplier_cpvs collection with one bulk write.
+    :param tenders: list of tenders
+    """
+    revisions = {}
+    for tender_data in tenders:  # the same tender may be saved several times
+        uid = tender_data.pop("id" if "id" in tender_data else "_id")
+        revisions.setdefault(uid, []).append(tender_data)
+    if not revisions:
+        return
+    deltas = await asyncio.gather(*(save_tender_revisions(uid, items) for uid, items in revisions.items()))
+    await update_entity_supplier_cpvs([delta for tender_deltas in deltas for delta in tender_deltas])
+
+
+RISK_STATS_GROUP_FIELDS = ("region", "risk", "terminated")
+
+
+async def get_risk_stats(group_by=(), region=None, risks=None, terminated=None):
+    """
+    Get numbers of tenders with risks and sum of their value amount from risk_stats collection
+    :param group_by: tuple Fields for grouping ("region", "risk", "terminated")
+    :param region: list Procuring entity regions
+    :param risks: list Risk identifiers, tender with several of them is counted for every risk
+    :param terminated: bool Whether tenders are terminated
+    :return: list of groups ({"region": ..., "count": ..., "amount": ...})
+    """
+    filters = {}
+    if risks:
+        filters["_id.risk"] = {"$in": risks}
+    else:
+        # tender is counted once for all risks with risk None and once for every worked risk
+        filters["_id.risk"] = {"$ne": None} if "risk" in group_by else None
+    if region:
+        filters["_id.region"] = {"$in": region}
+    if terminated is not None:
+        filters["_id.terminated"] = terminated
+    cursor = get_risk_stats_collection().aggregate([
+        {"$match": filters},
+        {
+            "$group": {
+                "_id": {field: f"$_id.{field}" for field in group_by} if group_by else None,
+                "count": {"$sum": "$count"},
+                "amount": {"$sum": "$amount"},
+            }
+        },
+        {"$match": {"count": {"$gt": 0}}},
+        {"$sort": {"count": DESCENDING}},
+    ], maxTimeMS=MAX_TIME_QUERY)
+    return [
+        {**(group["_id"] or {}), "count": group["count"], "amount": group["amount"]}
+        async for group in cursor
+    ]
+
+
 async def paginated_result(collection, filters, skip, limit, sort=None, projection=None):
     try:
         cursor = collection.find(filters, projection=projection, max_time_ms=MAX_TIME_QUERY).skip(skip).limit(limit)
         if sort:
             cursor = cursor.sort(sort)
         items = await cursor.to_list(length=None)
-        # should be added additional field for using index during counting documents
-        filters.update({"dateAssessed": {"$gte": CRAWLER_START_DATE.isoformat()}})
-        count = await collection.count_documents(filters, maxTimeMS=MAX_TIME_QUERY)
+        count, count_estimated = await count_tenders(collection, filters)
     except ExecutionTimeout as exc:
         logger.error(f"Filter tenders {type(exc)}: {exc}, filters: {filters}", extra={"MESSAGE_ID": "MONGODB_EXC"})
         raise web.HTTPRequestTimeout(text="Please change filters combination to optimize query (e.g. edrpou + risks)")
-    return dict(items=items, count=count)
+    return dict(items=items, count=count, count_estimated=count_estimated)
 
 
 async def get_distinct_values(field):
     return await get_risks_collection().distinct(field, {"has_risks": True, field: {"$nin": ["", None]}})
 
 
+async def find_entity_supplier_cpvs(filters):
+    """
+    Get CPVs counted in entity_supplier_cpvs collection
+    :param filters: dict Filters by ENTITY_SUPPLIER_CPVS_KEY_FIELDS
+    :return: list of CPVs
+    """
+    return await get_entity_supplier_cpvs_collection().distinct("cpv", {**filters, "count": {"$gt": 0}})
+
+
 async def aggregate_tenders(pipeline):
     cursor = get_tenders_collection().aggregate(pipeline)
     aggregate_response = await cursor.to_list(length=None)
@@ -453,36 +1252,53 @@ async def get_tender(tender_id):
             return result
 
 
-async def get_tenders_from_historical_data(filters):
-    collection = get_tenders_collection()
-    while True:
-        try:
-            cursor = collection.find(filters)
-        except PyMongoError as e:
-            logger.error(f"Get tenders {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
-            await asyncio.sleep(MONGODB_ERROR_INTERVAL)
-        else:
-            items = await cursor.to_list(length=None)
-            return items
+async def iter_tenders_from_historical_data(filters, projection, batch_size=HISTORICAL_QUERY_BATCH_SIZE, limit=None):
+    """
+    Iterate batches of tenders from historical data (tenders collection).
+    Tenders are pulled from cursor by batches, so only batches inspected by rule are fetched.
+    Cursor is closed when iteration is stopped, for early exit iterator should be closed explicitly
+    (e.g. with `contextlib.aclosing`).
+    :param filters: dict Filters of tenders collection
+    :param projection: dict Fields of tenders, which are inspected by rule
+    :param batch_size: int Number of tenders in batch
+    :param limit: int Max number of tenders (None for all of them)
+    :return: async iterator of lists of tenders
+    """
+    if not projection:
+        raise ValueError("Projection of historical tenders is required")
+    cursor = get_tenders_collection().find(
+        filters,
+        projection=dict(projection),  # projections of rules are shared constants and query keys
+        batch_size=batch_size,
+        limit=limit or 0,
+    )
+    try:
+        while tenders := await cursor.to_list(length=batch_size):
+            yield tenders
+    finally:
+        await cursor.close()
 
 
 async def get_tender_risks_report(filters, **kwargs):
+    """
+    Get cursor of tenders for risks report, only fields of report columns are returned
+    :param filters: dict Filters built by `build_tender_filters`
+    :return: Aggregation cursor which returns documents by REPORT_BATCH_SIZE batches
+    """
     collection = get_risks_collection()
     sort_field = parse_sort_field(kwargs.get("sort"))
     sort_order = ASCENDING if kwargs.get("order") == "asc" else DESCENDING
     pipeline = [
         {"$match": filters},
-        {"$project": {"contracts": 0, "dateCreated": 0, "risks": 0, "status": 0}},
         {"$sort": {sort_field: sort_order, "_id": 1}},  # including _id field guarantee sort consistency during limit
         {"$limit": REPORT_ITEMS_LIMIT},
-        {
-            "$addFields": {
-                "procuringEntityName": "$procuringEntity.name",
-                "valueAmount": "$value.amount",
-                "valueCurrency": "$value.currency",
-            }
-        },
+        {"$project": REPORT_PROJECTION},
     ]
     #  allowDiskUse = True allow writing temporary files on disk when a pipeline stage exceeds the 100 megabyte limit
-    cursor = collection.aggregate(pipeline, allowDiskUse=True, maxTimeMS=MAX_TIME_QUERY)
+    cursor = collection.aggregate(
+        pipeline,
+        allowDiskUse=True,
+        maxTimeMS=MAX_TIME_QUERY,
+        batchSize=REPORT_BATCH_SIZE,
+    )
     return cursor
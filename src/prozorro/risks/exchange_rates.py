@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+from prozorro.risks.context import RiskContext
+from prozorro.risks.db import get_exchange_rates_collection
+from prozorro.risks.requests import get_object_data
+from prozorro.risks.settings import EXCHANGE_RATES_CACHE_SIZE, EXCHANGE_RATES_PREFETCH_CONCURRENCY
+from prozorro.risks.utils import value_requires_exchange
+
+logger = logging.getLogger(__name__)
+
+RATE_DATE_FORMAT = "%Y%m%d"
+
+
+def get_rate_date_key(rate_date):
+    """
+    Build NBU date key ("20240131") from date, datetime or ISO formatted string
+    :param rate_date: date, datetime or str
+    :return: str Date key
+    """
+    if isinstance(rate_date, str):
+        rate_date = datetime.fromisoformat(rate_date)
+    return rate_date.strftime(RATE_DATE_FORMAT)
+
+
+class ExchangeRates:
+    """
+    NBU exchange rates keyed by (date, currency).
+
+    Rates are looked up in the in-process LRU first, then in the `exchange_rates` collection shared
+    by all crawler replicas and only after that in NBU API. NBU returns rates of all currencies for a date
+    at once, so the LRU and the collection keep one entry per date with rates of all currencies.
+    Concurrent lookups of the same date are waiting for the one request in flight.
+    """
+
+    def __init__(self, maxsize=EXCHANGE_RATES_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._rates = OrderedDict()
+        self._in_flight = {}
+
+    def clear(self):
+        self._rates.clear()
+
+    def _get_cached(self, date_key):
+        rates = self._rates.get(date_key)
+        if rates is not None:
+            self._rates.move_to_end(date_key)
+        return rates
+
+    def _set_cached(self, date_key, rates):
+        self._rates[date_key] = rates
+        self._rates.move_to_end(date_key)
+        while len(self._rates) > self.maxsize:
+            self._rates.popitem(last=False)
+
+    async def get_rate(self, rate_date, currency, context=None):
+        """
+        Get exchange rate of currency to UAH for provided date
+        :param rate_date: date, datetime or ISO formatted string
+        :param currency: str Currency code (e.g. "USD")
+        :param context: RiskContext with NBU client
+        :return: float Rate or None if NBU doesn't have rate for currency
+        """
+        rates = await self.get_rates(get_rate_date_key(rate_date), context=context)
+        return rates.get(currency)
+
+    async def get_rates(self, date_key, context=None):
+        """
+        Get exchange rates of all currencies for provided date key
+        :param date_key: str Date key ("20240131")
+        :param context: RiskContext with NBU client
+        :return: dict Rates by currency code ({"USD": 39.5151, ...})
+        """
+        rates = self._get_cached(date_key)
+        if rates is not None:
+            return rates
+        future = self._in_flight.get(date_key)
+        if future is None:
+            future = asyncio.ensure_future(self._load_rates(date_key, context))
+            self._in_flight[date_key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(date_key, None))
+        # one cancelled waiter shouldn't cancel loading for the others
+        return await asyncio.shield(future)
+
+    async def prefetch(self, dates, context=None):
+        """
+        Load rates for all provided dates with one query to the `exchange_rates` collection.
+        Dates which aren't stored yet are requested from NBU.
+        :param dates: iterable of date, datetime or ISO formatted string
+        :param context: RiskContext with NBU client
+        """
+        date_keys = {get_rate_date_key(rate_date) for rate_date in dates}
+        date_keys = [date_key for date_key in date_keys if self._get_cached(date_key) is None]
+        if not date_keys:
+            return
+        try:
+            cursor = get_exchange_rates_collection().find({"_id": {"$in": date_keys}})
+            async for doc in cursor:
+                self._set_cached(doc["_id"], doc["rates"])
+        except PyMongoError as e:
+            logger.warning(f"Get exchange rates {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+
+        semaphore = asyncio.Semaphore(EXCHANGE_RATES_PREFETCH_CONCURRENCY)
+
+        async def load(date_key):
+            async with semaphore:
+                await self.get_rates(date_key, context=context)
+
+        await asyncio.gather(
+            *(load(date_key) for date_key in date_keys if self._get_cached(date_key) is None)
+        )
+
+    async def prefetch_range(self, start_date, end_date, context=None):
+        """
+        Load rates for every date in range (including both ends).
+        :param start_date: date, datetime or ISO formatted string
+        :param end_date: date, datetime or ISO formatted string
+        :param context: RiskContext with NBU client
+        """
+        start_date, end_date = (
+            datetime.fromisoformat(value) if isinstance(value, str) else value
+            for value in (start_date, end_date)
+        )
+        await self.prefetch(
+            (start_date + timedelta(days=delta) for delta in range((end_date - start_date).days + 1)),
+            context=context,
+        )
+
+    async def _load_rates(self, date_key, context=None):
+        try:
+            doc = await get_exchange_rates_collection().find_one({"_id": date_key})
+        except PyMongoError as e:
+            logger.warning(f"Get exchange rates {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+            doc = None
+        if doc:
+            rates = doc["rates"]
+        else:
+            rates = await self._fetch_rates(date_key, context or RiskContext())
+            # NBU may return empty list for dates without published rates yet, they shouldn't be stored
+            if rates:
+                try:
+                    await get_exchange_rates_collection().update_one(
+                        {"_id": date_key},
+                        {"$set": {"rates": rates}},
+                        upsert=True,
+                    )
+                except PyMongoError as e:
+                    logger.warning(f"Save exchange rates {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+        if rates:
+            self._set_cached(date_key, rates)
+        return rates
+
+    @staticmethod
+    async def _fetch_rates(date_key, context):
+        response = await get_object_data(
+            context.nbu_client, date_key, resource="NBU", date=date_key, **context.nbu_request_kwargs
+        )
+        return {rate["cc"]: rate["rate"] for rate in response or []}
+
+
+EXCHANGE_RATES = ExchangeRates()
+
+
+async def get_exchange_rate(rate_date, currency, context=None):
+    return await EXCHANGE_RATES.get_rate(rate_date, currency, context=context)
+
+
+async def prefetch_exchange_rates(dates, context=None):
+    await EXCHANGE_RATES.prefetch(dates, context=context)
+
+
+async def prefetch_exchange_rates_range(start_date, end_date, context=None):
+    await EXCHANGE_RATES.prefetch_range(start_date, end_date, context=context)
+
+
+async def add_values_uah(items, context=None):
+    """
+    Add value amount in UAH (`valueUAH`) and date of its exchange rate (`valueUAHRateDate`) to objects,
+    so historical queries can filter and sum values in UAH on the database side.
+    Rates of all objects are loaded at once. Objects without value, rate date or known exchange rate are skipped.
+    :param items: iterable of (object, rate date) pairs, object is tender or contract with value
+    :param context: RiskContext with NBU client
+    """
+    items = [(obj, rate_date) for obj, rate_date in items if rate_date and (obj.get("value") or {}).get("amount")]
+    await prefetch_exchange_rates(
+        (rate_date for obj, rate_date in items if value_requires_exchange(obj)),
+        context=context,
+    )
+    for obj, rate_date in items:
+        amount = obj["value"]["amount"]
+        if value_requires_exchange(obj):
+            rate = await get_exchange_rate(rate_date, obj["value"]["currency"], context=context)
+            if rate is None:
+                continue
+            amount *= rate
+        obj["valueUAH"] = amount
+        obj["valueUAHRateDate"] = rate_date
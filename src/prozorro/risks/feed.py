@@ -0,0 +1,148 @@
+import asyncio
+import logging
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from prozorro.risks.counts import get_date_assessed_high_water_mark
+from prozorro.risks.db import get_risks_collection
+from prozorro.risks.settings import FEED_CHANGE_STREAM, FEED_POLL_INTERVAL, MONGODB_ERROR_MAX_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# change streams are available only on replica sets and sharded clusters
+CHANGE_STREAM_NOT_SUPPORTED_CODES = (40573,)
+# resume token isn't in oplog anymore, stream is opened again without it
+CHANGE_STREAM_HISTORY_LOST_CODES = (280, 286)
+CHANGE_STREAM_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+    {
+        "$project": {
+            "dateAssessed": {
+                "$ifNull": ["$fullDocument.dateAssessed", "$updateDescription.updatedFields.dateAssessed"],
+            },
+        },
+    },
+]
+
+
+async def get_risks_feed_high_water_mark():
+    """
+    Get the last dateAssessed of all tenders in risks feed
+    """
+    return await get_date_assessed_high_water_mark(get_risks_collection(), filters={})
+
+
+class RisksFeedNotifier:
+    """
+    The last dateAssessed of risks collection shared by all waiting feed consumers of API process.
+
+    It's followed by one change stream, or by polling once per `poll_interval` seconds
+    if change streams aren't available, so number of queries doesn't depend on number of waiting consumers.
+    The notifier is started by the first waiting consumer. While there are no waiting consumers
+    polling is paused and change stream is closed (within `poll_interval` seconds),
+    it's resumed by its resume token when the next consumer waits (and after errors).
+    """
+
+    def __init__(self, use_change_stream=FEED_CHANGE_STREAM, poll_interval=FEED_POLL_INTERVAL):
+        self.use_change_stream = use_change_stream
+        self.poll_interval = poll_interval
+        self.last_date_assessed = None
+        self._resume_token = None
+        self._condition = None
+        self._has_waiters = None
+        self._waiters = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._condition = asyncio.Condition()
+            self._has_waiters = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, *_):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self.last_date_assessed = None
+        self._resume_token = None
+
+    def is_newer(self, offset):
+        return self.last_date_assessed is not None and (not offset or self.last_date_assessed > offset)
+
+    async def wait(self, offset, timeout):
+        """
+        Wait for tenders assessed after offset
+        :param offset: str dateAssessed of the last received tender (None to wait for any tender)
+        :param timeout: float Seconds
+        :return: bool Whether there are tenders assessed after offset
+        """
+        self.start()
+        self._waiters += 1
+        self._has_waiters.set()
+        try:
+            async with self._condition:
+                await asyncio.wait_for(self._condition.wait_for(lambda: self.is_newer(offset)), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters -= 1
+            if not self._waiters:
+                self._has_waiters.clear()
+        return True
+
+    async def _set_date_assessed(self, date_assessed):
+        if date_assessed and (self.last_date_assessed is None or date_assessed > self.last_date_assessed):
+            async with self._condition:
+                self.last_date_assessed = date_assessed
+                self._condition.notify_all()
+
+    async def _poll(self):
+        await self._set_date_assessed(await get_risks_feed_high_water_mark())
+
+    async def _watch(self):
+        async with get_risks_collection().watch(
+            CHANGE_STREAM_PIPELINE,
+            resume_after=self._resume_token,
+            max_await_time_ms=int(self.poll_interval * 1000),
+        ) as stream:
+            # changes made before the stream has been opened are caught by polling once
+            if self._resume_token is None:
+                await self._poll()
+            while self._waiters:
+                change = await stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is not None:
+                    await self._set_date_assessed(change.get("dateAssessed"))
+
+    async def _run(self):
+        errors = 0
+        while True:
+            try:
+                await self._has_waiters.wait()
+                if self.use_change_stream:
+                    await self._watch()
+                else:
+                    await self._poll()
+                    await asyncio.sleep(self.poll_interval)
+                errors = 0
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_NOT_SUPPORTED_CODES:
+                    logger.warning(
+                        f"Risks feed change stream isn't supported, polling is used: {e}",
+                        extra={"MESSAGE_ID": "FEED_CHANGE_STREAM_NOT_SUPPORTED"},
+                    )
+                    self.use_change_stream = False
+                    continue
+                if e.code in CHANGE_STREAM_HISTORY_LOST_CODES:
+                    self._resume_token = None
+                errors += 1
+                logger.warning(f"Risks feed {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+                await asyncio.sleep(min(self.poll_interval * errors, MONGODB_ERROR_MAX_INTERVAL))
+            except PyMongoError as e:
+                errors += 1
+                logger.warning(f"Risks feed {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+                await asyncio.sleep(min(self.poll_interval * errors, MONGODB_ERROR_MAX_INTERVAL))
+
+
+RISKS_FEED_NOTIFIER = RisksFeedNotifier()
@@ -1,14 +1,11 @@
-import csv
-import io
 import logging
 import sys
 
 from aiocache import cached
 from aiocache.serializers import JsonSerializer
 from aiohttp import web
-from aiohttp.hdrs import CONTENT_DISPOSITION, CONTENT_TYPE
+from aiohttp.hdrs import CACHE_CONTROL, CONTENT_DISPOSITION, CONTENT_TYPE
 from aiohttp_swagger3 import swagger_doc
-from datetime import datetime
 
 from pymongo.errors import ExecutionTimeout
 
@@ -16,12 +13,27 @@ from prozorro import version as api_version
 from prozorro.risks.db import (
     build_tender_filters,
     get_distinct_values,
+    get_risk_stats,
     get_risks,
     get_tender_risks_report,
     find_tenders,
+    find_tenders_page,
     get_tenders_risks_feed,
+    parse_sort_field,
+    RISK_STATS_GROUP_FIELDS,
 )
-from prozorro.risks.settings import CACHE_TTL, SWAGGER_DOC_PATH
+from prozorro.risks.feed import RISKS_FEED_NOTIFIER, get_risks_feed_high_water_mark
+from prozorro.risks.report_jobs import (
+    DONE,
+    create_report_job,
+    get_report_job,
+    get_report_job_view,
+    get_report_storage,
+)
+from prozorro.risks.reports import check_report_format, get_report_writer, stream_report
+from prozorro.risks.rules.catalogue import shape_tender_risks
+from prozorro.risks.serialization import json_dumps_bytes, json_response
+from prozorro.risks.settings import CACHE_TTL, FEED_MAX_WAIT, FEED_SSE_HEARTBEAT, SWAGGER_DOC_PATH
 from prozorro.risks.utils import (
     build_content_disposition_name,
     get_now,
@@ -29,14 +41,16 @@ from prozorro.risks.utils import (
     requests_sequence_params,
     requests_params,
     get_page,
-    parse_offset,
+    encode_feed_offset,
+    parse_feed_offset,
     get_int_from_query,
     clamp_limit,
+    opt_fields_params,
+    strtobool,
 )
 from prozorro.risks.rules import *  # noqa
 
 logger = logging.getLogger(__name__)
-MAX_BUFFER_LINES = 1000
 
 
 @swagger_doc(f"{SWAGGER_DOC_PATH}/ping.yaml")
@@ -49,40 +63,102 @@ async def get_version(request):
     return {"api_version": api_version}
 
 
+def risk_metadata_param(request):
+    try:
+        return bool(strtobool(request.query.get("risk_metadata", "true")))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"Invalid risk_metadata value: {request.query['risk_metadata']}")
+
+
+def shape_tenders_risks(tenders, with_metadata=True):
+    """
+    Join (or remove) metadata of risk rules in risks of returned tenders
+    :param tenders: list Tenders from risks collection
+    :param with_metadata: bool Whether risk items should have metadata of their rules
+    """
+    for tender in tenders:
+        if tender.get("risks"):
+            shape_tender_risks(tender["risks"], with_metadata=with_metadata)
+
+
 @swagger_doc(f"{SWAGGER_DOC_PATH}/risks.yaml")
 async def get_tender_risks(request, tender_id: str):
-    tender = await get_risks(tender_id)
+    with_metadata = risk_metadata_param(request)
+    tender = await get_risks(tender_id, fields=opt_fields_params(request))
+    shape_tenders_risks([tender], with_metadata=with_metadata)
     return tender
 
 
 @swagger_doc(f"{SWAGGER_DOC_PATH}/risks_list.yaml")
 async def list_tenders(request):
     skip, limit = pagination_params(request)
+    fields = opt_fields_params(request)
+    with_metadata = risk_metadata_param(request)
+    filter_params = {
+        **requests_params(request, "sort", "order", "edrpou", "tender_id", "risks_all", "terminated"),
+        **requests_sequence_params(request, "risks", "region", "owner", separator=";"),
+    }
     try:
-        result = await find_tenders(
-            skip=skip,
-            limit=limit,
-            **requests_params(request, "sort", "order", "edrpou", "tender_id", "risks_all", "terminated"),
-            **requests_sequence_params(request, "risks", "region", "owner", separator=";"),
-        )
+        # cursor pagination is enabled by `cursor` param (empty value for the first page)
+        if "cursor" in request.query:
+            try:
+                with_count = bool(strtobool(request.query.get("with_count", "false")))
+            except ValueError:
+                raise web.HTTPBadRequest(text=f"Invalid with_count value: {request.query['with_count']}")
+            result = await find_tenders_page(
+                cursor=request.query["cursor"],
+                limit=limit,
+                with_count=with_count,
+                fields=fields,
+                **filter_params,
+            )
+        else:
+            result = await find_tenders(skip=skip, limit=limit, fields=fields, **filter_params)
     except web.HTTPRequestTimeout as exc:
         return web.Response(text=exc.text, status=exc.status)
+    shape_tenders_risks(result["items"], with_metadata=with_metadata)
     return result
 
 
+@swagger_doc(f"{SWAGGER_DOC_PATH}/risks_stats.yaml")
+async def get_risks_stats(request):
+    group_by = tuple(request.query["group_by"].split(",")) if request.query.get("group_by") else ()
+    if invalid_fields := set(group_by) - set(RISK_STATS_GROUP_FIELDS):
+        raise web.HTTPBadRequest(
+            text=f"Invalid group_by fields: {', '.join(sorted(invalid_fields))}. "
+                 f"Allowed values: {', '.join(RISK_STATS_GROUP_FIELDS)}"
+        )
+    terminated = None
+    if terminated_param := request.query.get("terminated"):
+        try:
+            terminated = bool(strtobool(terminated_param))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"Invalid terminated value: {terminated_param}")
+    try:
+        items = await get_risk_stats(
+            group_by=group_by,
+            terminated=terminated,
+            **requests_sequence_params(request, "region", "risks", separator=";"),
+        )
+    except ExecutionTimeout as exc:
+        logger.error(f"Get risks stats {type(exc)}: {exc}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+        return web.Response(text="Please change filters combination", status=web.HTTPRequestTimeout.status_code)
+    return {"items": items}
+
+
 @swagger_doc(f"{SWAGGER_DOC_PATH}/risks_feed.yaml")
 async def get_tenders_feed(request):
     params = {}
 
-    # offset param
-    offset = None
+    # offset param: (dateAssessed, _id) token or timestamp / ISO formatted date
+    offset = offset_id = None
     offset_param = request.query.get("offset")
     if offset_param:
         try:
-            offset = parse_offset(offset_param)
+            offset, offset_id = parse_feed_offset(offset_param)
         except ValueError:
             return web.HTTPNotFound(text=f"Invalid offset provided: {offset_param}")
-        params["offset"] = offset
+        params["offset"] = offset if offset_id is None else encode_feed_offset(offset, offset_id)
 
     # limit param
     limit_param = request.query.get("limit")
@@ -105,6 +181,11 @@ async def get_tenders_feed(request):
     else:
         opt_fields = set()
 
+    # risk_metadata param
+    with_metadata = risk_metadata_param(request)
+    if "risk_metadata" in request.query:
+        params["risk_metadata"] = request.query["risk_metadata"]
+
     # prev_page
     prev_params = dict(**params)
     if params.get("descending"):
@@ -112,30 +193,39 @@ async def get_tenders_feed(request):
     else:
         prev_params["descending"] = 1
 
+    # wait param (long polling)
+    wait = 0
+    if request.query.get("wait"):
+        try:
+            wait = min(max(int(request.query["wait"]), 0), FEED_MAX_WAIT)
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"Invalid wait value: {request.query['wait']}")
+
     data_fields = opt_fields | {"dateAssessed"}
-    results = await get_tenders_risks_feed(
+    feed_kwargs = dict(
         offset_value=offset,
+        offset_id=offset_id,
         fields=data_fields,
         descending=params.get("descending"),
         limit=params.get("limit", 20),
     )
+    results = await get_tenders_risks_feed(**feed_kwargs)
+    # there is nothing after offset yet, so response is returned as soon as new tenders are assessed
+    if not results and wait and not params.get("descending"):
+        if await RISKS_FEED_NOTIFIER.wait(offset, timeout=wait):
+            results = await get_tenders_risks_feed(**feed_kwargs)
+    shape_tenders_risks(results, with_metadata=with_metadata)
 
     # prepare response
     if results:
-        if "dateAssessed" in results[-1]:
-            params["offset"] = results[-1]["dateAssessed"]
-        else:
-            for result in list(reversed(results)):
-                if "dateAssessed" in result:
-                    params["offset"] = result["dateAssessed"]
-                    break
-        if "dateAssessed" in results[0]:
-            prev_params["offset"] = results[0]["dateAssessed"]
-        else:
-            for result in results:
-                if "dateAssessed" in result:
-                    prev_params["offset"] = result["dateAssessed"]
-                    break
+        for result in reversed(results):
+            if "dateAssessed" in result:
+                params["offset"] = encode_feed_offset(result["dateAssessed"], result["_id"])
+                break
+        for result in results:
+            if "dateAssessed" in result:
+                prev_params["offset"] = encode_feed_offset(result["dateAssessed"], result["_id"])
+                break
     data = {
         "data": results,
         "next_page": get_page(request, params)
@@ -146,12 +236,60 @@ async def get_tenders_feed(request):
     return data
 
 
+@swagger_doc(f"{SWAGGER_DOC_PATH}/risks_feed_stream.yaml")
+async def stream_tenders_feed(request):
+    # reconnected EventSource sends id of the last received event, which is feed offset
+    offset_id = None
+    offset_param = request.headers.get("Last-Event-ID") or request.query.get("offset")
+    if offset_param:
+        try:
+            offset, offset_id = parse_feed_offset(offset_param)
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"Invalid offset provided: {offset_param}")
+    else:
+        offset = await get_risks_feed_high_water_mark()
+    try:
+        limit = clamp_limit(int(request.query.get("limit", 100)))
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=e.args[0])
+    opt_fields = request.query.get("opt_fields")
+    data_fields = (set(opt_fields.split(",")) if opt_fields else set()) | {"dateAssessed"}
+    with_metadata = risk_metadata_param(request)
+
+    response = web.StreamResponse()
+    response.headers[CONTENT_TYPE] = "text/event-stream"
+    response.headers[CACHE_CONTROL] = "no-cache"
+    await response.prepare(request)
+    wait_offset = offset
+    while True:
+        results = await get_tenders_risks_feed(
+            offset_value=offset,
+            offset_id=offset_id,
+            fields=data_fields,
+            limit=limit,
+        )
+        if results:
+            offset, offset_id = results[-1]["dateAssessed"], results[-1]["_id"]
+            wait_offset = offset
+            event_id = encode_feed_offset(offset, offset_id)
+            shape_tenders_risks(results, with_metadata=with_metadata)
+            await response.write(b"id: %s\ndata: %s\n\n" % (event_id.encode(), json_dumps_bytes({"data": results})))
+            if len(results) == limit:
+                continue
+        elif RISKS_FEED_NOTIFIER.is_newer(wait_offset):
+            # tenders assessed after offset have been already reassessed, so waiting for the next ones
+            wait_offset = RISKS_FEED_NOTIFIER.last_date_assessed
+        if not await RISKS_FEED_NOTIFIER.wait(wait_offset, timeout=FEED_SSE_HEARTBEAT):
+            await response.write(b": heartbeat\n\n")
+
+
 @swagger_doc(f"{SWAGGER_DOC_PATH}/filter_values.yaml")
 @cached(ttl=CACHE_TTL, serializer=JsonSerializer())
 async def get_filter_values(request):
     regions = await get_distinct_values("procuringEntityRegion")
     risk_rules = []
     risk_rule_module = sys.modules["prozorro.risks.rules"]
+    today = get_now().date()
     for module_name in risk_rule_module.__all__:
         risk_module = getattr(risk_rule_module, module_name)
         risk_rule = getattr(risk_module, "RiskRule")()
@@ -160,9 +298,7 @@ async def get_filter_values(request):
                 "identifier": risk_rule.identifier,
                 "start_date": risk_rule.start_date,
                 "end_date": risk_rule.end_date,
-                "status": "archived"
-                if risk_rule.end_date and get_now().date() >= datetime.strptime(risk_rule.end_date, "%Y-%m-%d").date()
-                else "active",
+                "status": "active" if risk_rule.descriptor.is_active_on(today) else "archived",
             }
         )
     result = {
@@ -174,6 +310,10 @@ async def get_filter_values(request):
 
 @swagger_doc(f"{SWAGGER_DOC_PATH}/download_risks_report.yaml")
 async def download_risks_report(request):
+    try:
+        writer = get_report_writer(request.query.get("format"), request.query.get("compression"))
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=e.args[0])
     filters = build_tender_filters(
         **requests_params(request, "edrpou", "tender_id", "risks_all"),
         **requests_sequence_params(request, "risks", "region", separator=";"),
@@ -183,52 +323,46 @@ async def download_risks_report(request):
         **requests_params(request, "sort", "order"),
     )
     logger.info(f"Getting tender risks report with parameters: {filters}")
-    filename = "Tender_risks_report.csv"
+    filename = f"Tender_risks_report.{writer.filename_extension}"
 
     response = web.StreamResponse()
     response.headers[CONTENT_DISPOSITION] = build_content_disposition_name(filename)
-    response.headers[CONTENT_TYPE] = "text/csv"
+    response.headers[CONTENT_TYPE] = writer.response_content_type
     await response.prepare(request)
-
-    async def send_buffer():
-        await response.write(buffer.getvalue().encode("utf-8"))
-        buffer.truncate(0)
-        buffer.seek(0)
-
-    field_names = [
-        "_id",
-        "tenderID",
-        "dateAssessed",
-        "dateModified",
-        "procuringEntityRegion",
-        "procuringEntityEDRPOU",
-        "procuringEntityName",
-        "valueAmount",
-        "valueCurrency",
-        "worked_risks",
-    ]
-
-    buffer = io.StringIO()
-    writer = csv.DictWriter(buffer, fieldnames=field_names, extrasaction="ignore")
-    writer.writeheader()
-    await send_buffer()
-
-    count = 0
-    try:
-        async for doc in cursor:
-            writer.writerow(doc)
-            count += 1
-
-            if count > MAX_BUFFER_LINES:
-                await send_buffer()
-                count = 0
-
-    except ExecutionTimeout as exc:
-        logger.error(
-            f"Report downloading {type(exc)}: {exc}, filters: {filters}",
-            extra={"MESSAGE_ID": "MONGODB_EXC"},
-        )
-        writer.writerow({"_id": "...", "tenderID": "..."})
-    await send_buffer()
+    await stream_report(response, cursor, writer)
     await response.write_eof()
     return response
+
+
+@swagger_doc(f"{SWAGGER_DOC_PATH}/create_risks_report_job.yaml")
+async def create_risks_report_job(request):
+    params = {
+        key: value
+        for key, value in {
+            **requests_params(request, "edrpou", "tender_id", "risks_all", "sort", "order", "format", "compression"),
+            **requests_sequence_params(request, "risks", "region", separator=";"),
+        }.items()
+        if value
+    }
+    parse_sort_field(params.get("sort"))
+    try:
+        check_report_format(params.get("format"), params.get("compression"))
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=e.args[0])
+    job = await create_report_job(params)
+    logger.info(f"Report job {job['_id']} with parameters: {params} is {job['status']}")
+    return json_response(get_report_job_view(job), status=200 if job["status"] == DONE else 202)
+
+
+@swagger_doc(f"{SWAGGER_DOC_PATH}/risks_report_job.yaml")
+async def get_risks_report_job(request, job_id: str):
+    job = await get_report_job(job_id)
+    return get_report_job_view(job)
+
+
+@swagger_doc(f"{SWAGGER_DOC_PATH}/download_risks_report_job_file.yaml")
+async def download_risks_report_job_file(request, job_id: str):
+    job = await get_report_job(job_id)
+    if job["status"] != DONE:
+        raise web.HTTPConflict(text=f"Report job is {job['status']}")
+    return await get_report_storage().get_response(request, job)
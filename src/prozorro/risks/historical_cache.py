@@ -0,0 +1,105 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+
+from prozorro.risks.settings import HISTORICAL_CACHE_SIZE, HISTORICAL_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def get_query_key(name, *args):
+    """
+    Build cache key of historical query
+    :param name: str Name of query
+    :param args: Arguments of query (filters, projection, etc.), keys of dicts may be in any order
+    :return: str
+    """
+    return json.dumps([name, *args], sort_keys=True, default=str)
+
+
+class HistoricalQueryCache:
+    """
+    Results of historical queries of risk rules shared by all tenders of crawler feed page.
+
+    Tenders of the same procuring entity are clustered in feed pages and their rules run the same queries,
+    so concurrent identical queries are waiting for the one query in flight
+    and results are reused for `ttl` seconds. Results are shared by callers and shouldn't be changed.
+    """
+
+    def __init__(self, ttl=HISTORICAL_CACHE_TTL, maxsize=HISTORICAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats = Counter()
+        self._results = OrderedDict()
+        self._in_flight = {}
+
+    def clear(self):
+        self._results.clear()
+
+    def _get_cached(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry
+
+    def _set_cached(self, key, result):
+        self._results[key] = (result, time.monotonic() + self.ttl)
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    async def get(self, key, load):
+        """
+        Get result of query from cache, from query in flight or load it
+        :param key: str Key built by `get_query_key`
+        :param load: function without arguments which returns coroutine of query
+        :return: Result of query
+        """
+        if entry := self._get_cached(key):
+            self.stats["hits"] += 1
+            return entry[0]
+        future = self._in_flight.get(key)
+        if future is None:
+            self.stats["misses"] += 1
+            future = asyncio.ensure_future(self._load(key, load))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # one cancelled waiter shouldn't cancel query for the others
+        return await asyncio.shield(future)
+
+    async def _load(self, key, load):
+        result = await load()
+        self._set_cached(key, result)
+        return result
+
+    def log_stats(self, reset=True):
+        """
+        Log hit rate of cache (e.g. once per crawler page)
+        :param reset: bool Whether counters should be started from zero after logging
+        """
+        queries = sum(self.stats.values())
+        if not queries:
+            return
+        hit_rate = (self.stats["hits"] + self.stats["coalesced"]) / queries
+        logger.info(
+            f"Historical queries: {queries} requested, {self.stats['misses']} executed, hit rate {hit_rate:.0%}",
+            extra={
+                "MESSAGE_ID": "HISTORICAL_QUERY_CACHE_STATS",
+                "QUERIES": queries,
+                "HITS": self.stats["hits"],
+                "COALESCED": self.stats["coalesced"],
+                "MISSES": self.stats["misses"],
+                "HIT_RATE": hit_rate,
+            },
+        )
+        if reset:
+            self.stats.clear()
@@ -1,7 +1,136 @@
+from contextlib import aclosing
 from datetime import datetime
 
-from prozorro.risks.db import aggregate_tenders
-from prozorro.risks.settings import TIMEZONE
+from prozorro.risks.db import aggregate_tenders, find_entity_supplier_cpvs, iter_tenders_from_historical_data
+from prozorro.risks.historical_cache import get_query_key
+from prozorro.risks.settings import HISTORICAL_QUERY_BATCH_SIZE, TIMEZONE
+from prozorro.risks.utils import get_value_uah_rate_date_filters
+
+# fields of tenders collection documents, which are read by crawlers (contracts crawler gets parent tender
+# from there) and used by indexes and filters shared by historical queries of rules
+HISTORICAL_TENDER_FIELDS = (
+    "dateCreated",
+    "dateModified",
+    "status",
+    "tenderID",
+    "procurementMethodType",
+    "mainProcurementCategory",
+    "procuringEntity",
+    "value",
+    # derived fields added by `prepare_tender` and `add_tenders_values_uah`
+    "procuringEntityIdentifier",
+    "subjectOfProcurement",
+    "valueUAH",
+    "valueUAHRateDate",
+)
+
+
+def build_historical_projection(rules):
+    """
+    Build projection of tenders saved to tenders collection:
+    fields read by crawlers and fields registered by rules in `historical_fields`
+    :param rules: iterable of risk rules (classes or instances)
+    :return: dict Projection tree ({"procuringEntity": True, "contracts": {"dateSigned": True, ...}, ...})
+    """
+    fields = set(HISTORICAL_TENDER_FIELDS)
+    for rule in rules:
+        fields.update(rule.historical_fields)
+    projection = {}
+    # parents go before nested fields, so nested fields of projected parent are skipped
+    for field in sorted(fields, key=lambda name: name.count(".")):
+        node = projection
+        *parents, name = field.split(".")
+        for key in parents:
+            if node.get(key) is True:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[name] = True
+    return projection
+
+
+def project_document(obj, projection):
+    """
+    Get projected copy of document, nested fields of arrays are projected in every array element (as MongoDB does)
+    :param obj: dict Document
+    :param projection: dict Projection tree built by `build_historical_projection`
+    :return: dict Projected document
+    """
+    if isinstance(obj, list):
+        return [project_document(item, projection) for item in obj if isinstance(item, (dict, list))]
+    result = {}
+    for key, field_projection in projection.items():
+        if key not in obj:
+            continue
+        value = obj[key]
+        if field_projection is True:
+            result[key] = value
+        elif isinstance(value, (dict, list)):
+            result[key] = project_document(value, field_projection)
+    return result
+
+
+def get_historical_tender(tender, projection=None):
+    """
+    Get document of tenders collection for tender
+    :param tender: dict Tender data with fields derived by `prepare_tender`
+    :param projection: dict Projection tree built by `build_historical_projection` (None to save the whole tender)
+    :return: dict Tender data with "_id" ("id")
+    """
+    if projection is None:
+        return tender
+    return {"_id": tender["id" if "id" in tender else "_id"], **project_document(tender, projection)}
+
+
+async def query_historical_data(load, name, *args, context=None):
+    """
+    Run historical query once for all tenders of crawler feed page (see `HistoricalQueryCache` of context)
+    :param load: function without arguments which returns coroutine of query
+    :param name: str Name of query
+    :param args: Arguments of query, which are the part of cache key
+    :param context: RiskContext (query isn't cached without it)
+    :return: Result of query, it's shared by tenders and shouldn't be changed
+    """
+    if context is None:
+        return await load()
+    return await context.historical_cache.get(get_query_key(name, *args), load)
+
+
+async def get_historical_tenders(filters, projection):
+    return [
+        tender
+        async for tenders in iter_tenders_from_historical_data(filters, projection)
+        for tender in tenders
+    ]
+
+
+async def iter_historical_tenders(filters, projection, context=None):
+    """
+    Iterate batches of historical tenders.
+    Without context tenders are pulled from cursor by `iter_tenders_from_historical_data`,
+    with context all tenders are queried once for all tenders of crawler feed page.
+    Cached tenders are fetched in full, so context should be passed only for queries shared by tenders
+    (e.g. by procuring entity), queries specific to tender should be stopped early without context.
+    For early exit iterator should be closed explicitly (e.g. with `contextlib.aclosing`).
+    :param filters: dict Filters of tenders collection
+    :param projection: dict Fields of tenders, which are inspected by rule
+    :param context: RiskContext
+    :return: async iterator of lists of tenders
+    """
+    if context is None:
+        async with aclosing(iter_tenders_from_historical_data(filters, projection)) as batches:
+            async for tenders in batches:
+                yield tenders
+        return
+    tenders = await query_historical_data(
+        lambda: get_historical_tenders(filters, projection),
+        "tenders",
+        filters,
+        projection,
+        context=context,
+    )
+    for start in range(0, len(tenders), HISTORICAL_QUERY_BATCH_SIZE):
+        yield tenders[start:start + HISTORICAL_QUERY_BATCH_SIZE]
 
 
 async def get_list_of_cpvs(
@@ -10,7 +139,8 @@ async def get_list_of_cpvs(
     entity_identifier=None,
     procurement_methods=None,
     supplier_identifier=None,
-    procurement_categories=None
+    procurement_categories=None,
+    context=None,
 ):
     """
     Get list of unique CPVs for provided filters arguments.
@@ -20,6 +150,7 @@ async def get_list_of_cpvs(
     :param procurement_methods: tuple Available procuring method types
     :param supplier_identifier: dict Contract supplier identifier ({"scheme": "UA-EDR", "id": "45310000-7"})
     :param procurement_categories: tuple Available procurement categories
+    :param context: RiskContext, the same query is run once for all tenders of crawler feed page
     :return: dict List of CPVs ({"cpv": [...]})
     """
     filters = {
@@ -60,4 +191,69 @@ async def get_list_of_cpvs(
         },
         {"$project": {"_id": 0}},
     ]
-    return await aggregate_tenders(aggregation_pipeline)
+    return await query_historical_data(
+        lambda: aggregate_tenders(aggregation_pipeline),
+        "get_list_of_cpvs",
+        aggregation_pipeline,
+        context=context,
+    )
+
+
+async def get_entity_supplier_cpvs(
+    *_,
+    year,
+    entity_identifier,
+    supplier_identifier,
+    procurement_methods,
+    procurement_categories,
+    context=None,
+):
+    """
+    Get list of unique CPVs pre-aggregated in entity_supplier_cpvs collection,
+    the result is the same as of `get_list_of_cpvs` with the same arguments.
+    :param _:
+    :param year: int Year of contracts dateSigned
+    :param entity_identifier: str Procuring entity identifier scheme + id ("UA-EDR-39604270")
+    :param supplier_identifier: dict Contract supplier identifier ({"scheme": "UA-EDR", "id": "45310000-7"})
+    :param procurement_methods: tuple Available procuring method types
+    :param procurement_categories: tuple Available procurement categories
+    :param context: RiskContext, the same query is run once for all tenders of crawler feed page
+    :return: dict List of CPVs ({"cpv": [...]})
+    """
+    filters = {
+        "procuringEntityIdentifier": entity_identifier,
+        "supplierIdentifier": f'{supplier_identifier.get("scheme", "")}-{supplier_identifier.get("id", "")}',
+        "year": year,
+        "procurementMethodType": {"$in": procurement_methods},
+        "mainProcurementCategory": {"$in": procurement_categories},
+    }
+    cpvs = await query_historical_data(
+        lambda: find_entity_supplier_cpvs(filters),
+        "get_entity_supplier_cpvs",
+        filters,
+        context=context,
+    )
+    return {"cpv": cpvs}
+
+
+async def get_sum_of_values_uah(filters, rate_date_field="dateCreated", context=None):
+    """
+    Get sum of values in UAH saved at ingestion (`valueUAH`) of historical tenders,
+    tenders saved without valueUAH or with valueUAH exchanged by rate on another date aren't summed
+    (see `get_value_uah_rate_date_filters`).
+    :param filters: dict Filters of tenders collection
+    :param rate_date_field: str Field of tender with date of exchange rate
+    :param context: RiskContext, the same query is run once for all tenders of crawler feed page
+    :return: float Sum of values
+    """
+    aggregation_pipeline = [
+        {"$match": {**filters, **get_value_uah_rate_date_filters(rate_date_field)}},
+        {"$group": {"_id": None, "valueUAH": {"$sum": "$valueUAH"}}},
+    ]
+    result = await query_historical_data(
+        lambda: aggregate_tenders(aggregation_pipeline),
+        "get_sum_of_values_uah",
+        aggregation_pipeline,
+        context=context,
+    )
+    return result.get("valueUAH", 0)
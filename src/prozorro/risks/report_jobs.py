@@ -0,0 +1,398 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from aiohttp import web
+from aiohttp.hdrs import CONTENT_DISPOSITION, CONTENT_LENGTH, CONTENT_TYPE
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from prozorro.risks.counts import canonicalize_filters, get_date_assessed_high_water_mark
+from prozorro.risks.db import (
+    build_tender_filters,
+    get_database,
+    get_report_jobs_collection,
+    get_risks_collection,
+    get_tender_risks_report,
+)
+from prozorro.risks.reports import get_report_writer, stream_report
+from prozorro.risks.settings import (
+    REPORT_JOBS_DIR,
+    REPORT_JOBS_POLL_INTERVAL,
+    REPORT_JOBS_STORAGE,
+    REPORT_JOBS_TIMEOUT,
+    REPORT_JOBS_TTL,
+    REPORT_JOBS_WATERMARK_INTERVAL,
+    REPORT_JOBS_WORKERS,
+    TIMEZONE,
+)
+from prozorro.risks.utils import build_content_disposition_name, get_now
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# fields of job document which aren't returned by API
+HIDDEN_REPORT_JOB_FIELDS = ("artifact",)
+
+
+def get_report_job_id(params, watermark):
+    """
+    Build id of report job, which is the same for all requests of the same report of the same data
+    :param params: dict Report params (filters params, sort, order, format and compression)
+    :param watermark: str Rounded last dateAssessed of tenders (see `get_report_watermark`)
+    :return: str
+    """
+    key = {
+        "filters": canonicalize_filters(build_tender_filters(**params)),
+        "sort": params.get("sort") or "dateAssessed",
+        "order": "asc" if params.get("order") == "asc" else "desc",
+        "format": params.get("format") or "csv",
+        "compression": params.get("compression"),
+        "watermark": watermark,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+async def run_in_executor(func, *args):
+    """
+    Run blocking file system call in default executor, so it doesn't block event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class FileReportArtifact:
+    """
+    Report file on disk, it's written to temporary file and renamed after closing.
+    Artifact is created by `FileReportArtifact.open`.
+    """
+
+    def __init__(self, path, file):
+        self.path = path
+        self.ref = os.path.basename(path)
+        self.size = 0
+        self._tmp_path = file.name
+        self._file = file
+
+    @classmethod
+    async def open(cls, path):
+        return cls(path, await run_in_executor(open, f"{path}.tmp", "wb"))
+
+    async def write(self, data):
+        await run_in_executor(self._file.write, data)
+        self.size += len(data)
+
+    def _close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def _abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    async def close(self):
+        await run_in_executor(self._close)
+
+    async def abort(self):
+        await run_in_executor(self._abort)
+
+
+class FileReportStorage:
+    """
+    Storage of report files in directory, it should be shared by API replicas (e.g. volume)
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or REPORT_JOBS_DIR
+        if not self.directory:
+            raise ValueError("REPORT_JOBS_DIR is required for file storage of reports")
+
+    async def open(self, job_id, filename):
+        await run_in_executor(lambda: os.makedirs(self.directory, exist_ok=True))
+        extension = filename.split(".", 1)[-1]
+        # every run of job has its own file, so the run which has lost job (see `process_report_job`) removes only it
+        return await FileReportArtifact.open(os.path.join(self.directory, f"{job_id}-{uuid4().hex[:8]}.{extension}"))
+
+    async def get_response(self, request, job):
+        path = os.path.join(self.directory, job["artifact"])
+        if not await run_in_executor(os.path.exists, path):
+            raise web.HTTPNotFound(text="Report file not found")
+        return web.FileResponse(
+            path,
+            headers={
+                CONTENT_DISPOSITION: build_content_disposition_name(job["filename"]),
+                CONTENT_TYPE: job["content_type"],
+            },
+        )
+
+    async def delete(self, job):
+        try:
+            await run_in_executor(os.remove, os.path.join(self.directory, job["artifact"]))
+        except FileNotFoundError:
+            pass
+
+
+class GridFSReportArtifact:
+    def __init__(self, grid_in):
+        self._grid_in = grid_in
+        self.ref = grid_in._id
+        self.size = 0
+
+    async def write(self, data):
+        await self._grid_in.write(data)
+        self.size += len(data)
+
+    async def close(self):
+        await self._grid_in.close()
+
+    async def abort(self):
+        await self._grid_in.abort()
+
+
+class GridFSReportStorage:
+    """
+    Storage of report files in GridFS bucket of risks database
+    """
+
+    bucket_name = "reports"
+
+    def get_bucket(self):
+        return AsyncIOMotorGridFSBucket(get_database(), bucket_name=self.bucket_name)
+
+    async def open(self, job_id, filename):
+        grid_in = self.get_bucket().open_upload_stream(filename, metadata={"job_id": job_id})
+        return GridFSReportArtifact(grid_in)
+
+    async def get_response(self, request, job):
+        try:
+            grid_out = await self.get_bucket().open_download_stream(job["artifact"])
+        except NoFile:
+            raise web.HTTPNotFound(text="Report file not found")
+        response = web.StreamResponse()
+        response.headers[CONTENT_DISPOSITION] = build_content_disposition_name(job["filename"])
+        response.headers[CONTENT_TYPE] = job["content_type"]
+        response.headers[CONTENT_LENGTH] = str(grid_out.length)
+        await response.prepare(request)
+        while chunk := await grid_out.readchunk():
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    async def delete(self, job):
+        try:
+            await self.get_bucket().delete(job["artifact"])
+        except NoFile:
+            pass
+
+
+REPORT_STORAGES = {
+    "file": FileReportStorage,
+    "gridfs": GridFSReportStorage,
+}
+
+
+def get_report_storage():
+    return REPORT_STORAGES[REPORT_JOBS_STORAGE]()
+
+
+async def get_report_watermark():
+    """
+    Get the last dateAssessed of all assessed tenders rounded down to REPORT_JOBS_WATERMARK_INTERVAL,
+    all assessed tenders are used, so the watermark is also changed when tender loses its risks.
+    :return: str or None if there are no assessed tenders
+    """
+    date_assessed = await get_date_assessed_high_water_mark(get_risks_collection(), filters={})
+    if date_assessed is None:
+        return None
+    if isinstance(date_assessed, str):
+        date_assessed = datetime.fromisoformat(date_assessed)
+    timestamp = date_assessed.timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % REPORT_JOBS_WATERMARK_INTERVAL, tz=TIMEZONE).isoformat()
+
+
+async def create_report_job(params):
+    """
+    Create report job or get existing job of the same report of the same data.
+    Failed job is queued again.
+    :param params: dict Report params (filters params, sort, order, format and compression)
+    :return: dict Job document
+    """
+    collection = get_report_jobs_collection()
+    watermark = await get_report_watermark()
+    job_id = get_report_job_id(params, watermark)
+    now = get_now().isoformat()
+    try:
+        job = await collection.find_one_and_update(
+            {"_id": job_id},
+            {"$setOnInsert": {"status": QUEUED, "params": params, "watermark": watermark, "created": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:  # the same job has been created concurrently
+        job = await collection.find_one({"_id": job_id})
+    if job["status"] == FAILED:
+        job = await collection.find_one_and_update(
+            {"_id": job_id, "status": FAILED},
+            {"$set": {"status": QUEUED, "created": now}, "$unset": {"error": "", "finished": ""}},
+            return_document=ReturnDocument.AFTER,
+        ) or await collection.find_one({"_id": job_id})
+    if job["status"] == QUEUED:
+        REPORT_JOBS_WORKER.wake_up()
+    return job
+
+
+async def get_report_job(job_id):
+    job = await get_report_jobs_collection().find_one({"_id": job_id})
+    if not job:
+        raise web.HTTPNotFound(text="Report job not found")
+    return job
+
+
+def get_report_job_view(job):
+    """
+    Build API representation of job
+    :param job: dict Job document
+    :return: dict
+    """
+    result = {key: value for key, value in job.items() if key not in HIDDEN_REPORT_JOB_FIELDS}
+    result["id"] = result.pop("_id")
+    if job["status"] == DONE:
+        result["url"] = f"/api/risks-report/jobs/{job['_id']}/file"
+    return result
+
+
+async def claim_report_job():
+    """
+    Take the oldest queued job (or running job of stopped worker) for processing
+    :return: dict Job document or None
+    """
+    now = get_now()
+    timed_out = (now - timedelta(seconds=REPORT_JOBS_TIMEOUT)).isoformat()
+    return await get_report_jobs_collection().find_one_and_update(
+        {"$or": [{"status": QUEUED}, {"status": RUNNING, "started": {"$lt": timed_out}}]},
+        {"$set": {"status": RUNNING, "started": now.isoformat()}},
+        sort=[("created", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def process_report_job(job, storage):
+    """
+    Write report of job to the storage
+    :param job: dict Claimed job document
+    :param storage: FileReportStorage or GridFSReportStorage
+    """
+    collection = get_report_jobs_collection()
+    params = job["params"]
+    # job can be claimed again by another worker after timeout, the last one wins
+    job_filter = {"_id": job["_id"], "started": job["started"]}
+    logger.info(f"Processing report job {job['_id']} with parameters: {params}", extra={"MESSAGE_ID": "REPORT_JOB"})
+    try:
+        writer = get_report_writer(params.get("format"), params.get("compression"))
+        filename = f"Tender_risks_report.{writer.filename_extension}"
+        cursor = await get_tender_risks_report(
+            build_tender_filters(**params),
+            sort=params.get("sort"),
+            order=params.get("order"),
+        )
+        artifact = await storage.open(job["_id"], filename)
+        try:
+            rows_count = await stream_report(artifact, cursor, writer)
+        except BaseException:
+            await artifact.abort()
+            raise
+        await artifact.close()
+    except Exception as e:
+        logger.exception(f"Report job {job['_id']} failed: {e}", extra={"MESSAGE_ID": "REPORT_JOB_FAILED"})
+        await collection.update_one(
+            job_filter,
+            {"$set": {"status": FAILED, "finished": get_now().isoformat(), "error": str(e)}},
+        )
+        return
+    result = await collection.update_one(
+        job_filter,
+        {
+            "$set": {
+                "status": DONE,
+                "finished": get_now().isoformat(),
+                "rows": rows_count,
+                "size": artifact.size,
+                "filename": filename,
+                "content_type": writer.response_content_type,
+                "artifact": artifact.ref,
+            }
+        },
+    )
+    if not result.modified_count:
+        await storage.delete({**job, "artifact": artifact.ref})
+
+
+async def delete_expired_report_jobs(storage):
+    """
+    Delete jobs finished more than REPORT_JOBS_TTL seconds ago with their files
+    :param storage: FileReportStorage or GridFSReportStorage
+    """
+    collection = get_report_jobs_collection()
+    expired = (get_now() - timedelta(seconds=REPORT_JOBS_TTL)).isoformat()
+    async for job in collection.find({"status": {"$in": [DONE, FAILED]}, "finished": {"$lt": expired}}):
+        if job.get("artifact"):
+            await storage.delete(job)
+        await collection.delete_one({"_id": job["_id"], "finished": job["finished"]})
+
+
+class ReportJobsWorker:
+    """
+    Background tasks of API process that generate reports of queued jobs.
+    Jobs are claimed atomically, so workers of all API replicas share the same queue.
+    Workers are woken up by jobs created in the same process, otherwise they poll queue
+    once per `poll_interval` seconds.
+    """
+
+    def __init__(self, workers=REPORT_JOBS_WORKERS, poll_interval=REPORT_JOBS_POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wake_up = None
+
+    def wake_up(self):
+        if self._wake_up is not None:
+            self._wake_up.set()
+
+    async def start(self, *_):
+        get_report_storage()  # misconfigured storage fails on startup
+        self._wake_up = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self, *_):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wake_up = None
+
+    async def _run(self):
+        while True:
+            self._wake_up.clear()
+            storage = get_report_storage()
+            try:
+                if job := await claim_report_job():
+                    await process_report_job(job, storage)
+                    continue
+                await delete_expired_report_jobs(storage)
+            except PyMongoError as e:
+                logger.warning(f"Report jobs {type(e)}: {e}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+            try:
+                await asyncio.wait_for(self._wake_up.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+REPORT_JOBS_WORKER = ReportJobsWorker()
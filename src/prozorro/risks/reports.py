@@ -0,0 +1,374 @@
+import csv
+import importlib.util
+import io
+import logging
+import re
+import zipfile
+import zlib
+from abc import ABC, abstractmethod
+from xml.sax.saxutils import escape
+
+from pymongo.errors import ExecutionTimeout
+
+from prozorro.risks.settings import REPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = (
+    "_id",
+    "tenderID",
+    "dateAssessed",
+    "dateModified",
+    "procuringEntityRegion",
+    "procuringEntityEDRPOU",
+    "procuringEntityName",
+    "valueAmount",
+    "valueCurrency",
+    "worked_risks",
+)
+# fields of risks collection which are needed for report columns
+REPORT_PROJECTION = {
+    "tenderID": True,
+    "dateAssessed": True,
+    "dateModified": True,
+    "procuringEntityRegion": True,
+    "procuringEntityEDRPOU": True,
+    "procuringEntity.name": True,
+    "value.amount": True,
+    "value.currency": True,
+    "worked_risks": True,
+}
+# row which is added to the end of report if report query has been interrupted by time limit
+TRUNCATED_REPORT_ROW = ("...", "...") + ("",) * (len(REPORT_COLUMNS) - 2)
+COMPRESSIONS = ("gzip",)
+# characters which aren't allowed in XML
+XML_ILLEGAL_CHARACTERS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def format_report_row(doc):
+    """
+    Build report row in order of REPORT_COLUMNS from document projected with REPORT_PROJECTION
+    :param doc: dict Document from risks collection
+    :return: tuple
+    """
+    procuring_entity = doc.get("procuringEntity") or {}
+    value = doc.get("value") or {}
+    return (
+        doc.get("_id"),
+        doc.get("tenderID"),
+        doc.get("dateAssessed"),
+        doc.get("dateModified"),
+        doc.get("procuringEntityRegion"),
+        doc.get("procuringEntityEDRPOU"),
+        procuring_entity.get("name"),
+        value.get("amount"),
+        value.get("currency"),
+        doc.get("worked_risks"),
+    )
+
+
+class CsvReportWriter:
+    """
+    Report writer that turns batches of rows into chunks of CSV file, optionally compressed by gzip.
+    Every batch is written to one reused text buffer and encoded once.
+    """
+
+    content_type = "text/csv"
+    extension = "csv"
+    truncated_row = TRUNCATED_REPORT_ROW
+
+    def __init__(self, compression=None):
+        self.compression = compression
+        self._compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compression == "gzip" else None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    @property
+    def response_content_type(self):
+        return "application/gzip" if self._compressor else self.content_type
+
+    @property
+    def filename_extension(self):
+        return f"{self.extension}.gz" if self._compressor else self.extension
+
+    def _encode(self, data):
+        return self._compressor.compress(data) if self._compressor else data
+
+    def _flush_buffer(self):
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate(0)
+        return self._encode(data)
+
+    def write_header(self):
+        self._writer.writerow(REPORT_COLUMNS)
+        return self._flush_buffer()
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+        return self._flush_buffer()
+
+    def close(self):
+        return self._compressor.flush() if self._compressor else b""
+
+
+class ChunksSink(io.RawIOBase):
+    """
+    Unseekable file object that keeps written bytes until they are taken to response
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Tender risks" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def format_xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value!r}</v></c>"
+    if isinstance(value, list):
+        value = ", ".join(map(str, value))
+    value = escape(XML_ILLEGAL_CHARACTERS.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{value}</t></is></c>'
+
+
+class XlsxReportWriter:
+    """
+    Report writer that streams XLSX workbook with one sheet.
+    Sheet XML is written into deflated zip entry by batches, zip data descriptors are used instead of seeking,
+    so memory doesn't depend on the number of rows. Strings are written inline (without shared strings table).
+    """
+
+    response_content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    filename_extension = "xlsx"
+    truncated_row = TRUNCATED_REPORT_ROW
+
+    def __init__(self):
+        self._sink = ChunksSink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+        for name, data in XLSX_STATIC_PARTS.items():
+            self._zip.writestr(name, data)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True)
+
+    def _write_rows(self, rows):
+        self._sheet.write("".join(
+            f"<row>{''.join(map(format_xlsx_cell, row))}</row>" for row in rows
+        ).encode("utf-8"))
+        return self._sink.pop()
+
+    def write_header(self):
+        self._sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        return self._write_rows((REPORT_COLUMNS,))
+
+    def write_rows(self, rows):
+        return self._write_rows(rows)
+
+    def close(self):
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+        return self._sink.pop()
+
+
+class ColumnarReportWriter(ABC):
+    """
+    Base of report writers with pyarrow (optional dependency), every batch of rows is one Arrow record batch
+    """
+
+    filename_extension = None
+    response_content_type = None
+    # empty values of truncated row don't fit number and list columns
+    truncated_row = ("...", "...") + (None,) * (len(REPORT_COLUMNS) - 2)
+
+    def __init__(self):
+        import pyarrow
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            ("_id", pyarrow.string()),
+            ("tenderID", pyarrow.string()),
+            ("dateAssessed", pyarrow.string()),
+            ("dateModified", pyarrow.string()),
+            ("procuringEntityRegion", pyarrow.string()),
+            ("procuringEntityEDRPOU", pyarrow.string()),
+            ("procuringEntityName", pyarrow.string()),
+            ("valueAmount", pyarrow.float64()),
+            ("valueCurrency", pyarrow.string()),
+            ("worked_risks", pyarrow.list_(pyarrow.string())),
+        ])
+        self._sink = ChunksSink()
+        self._writer = self.create_writer(pyarrow.PythonFile(self._sink, mode="w"))
+
+    @abstractmethod
+    def create_writer(self, sink):
+        ...
+
+    def write_header(self):
+        return self._sink.pop()
+
+    def write_rows(self, rows):
+        rows = list(rows)
+        if not rows:
+            return b""
+        columns = [
+            self.pa.array(column, type=field.type)
+            for column, field in zip(zip(*rows), self.schema)
+        ]
+        self._write_batch(self.pa.RecordBatch.from_arrays(columns, schema=self.schema))
+        return self._sink.pop()
+
+    def _write_batch(self, batch):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+        return self._sink.pop()
+
+
+class ArrowReportWriter(ColumnarReportWriter):
+    """
+    Report writer that streams Arrow IPC stream format
+    """
+
+    filename_extension = "arrows"
+    response_content_type = "application/vnd.apache.arrow.stream"
+
+    def create_writer(self, sink):
+        return self.pa.ipc.new_stream(sink, self.schema)
+
+
+class ParquetReportWriter(ColumnarReportWriter):
+    """
+    Report writer that streams Parquet file, every batch of rows is written as one row group
+    """
+
+    filename_extension = "parquet"
+    response_content_type = "application/vnd.apache.parquet"
+
+    def create_writer(self, sink):
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(sink, self.schema, compression="snappy")
+
+    def _write_batch(self, batch):
+        self._writer.write_table(self.pa.Table.from_batches([batch]))
+
+
+REPORT_WRITERS = {
+    "csv": CsvReportWriter,
+    "xlsx": XlsxReportWriter,
+    "parquet": ParquetReportWriter,
+    "arrow": ArrowReportWriter,
+}
+
+
+def check_report_format(report_format=None, compression=None):
+    """
+    Check that report can be written in format with compression
+    :param report_format: str "csv" (default), "xlsx", "parquet" or "arrow"
+    :param compression: str "gzip" or None, only CSV report can be compressed
+    :raises ValueError: if format or compression isn't supported or pyarrow isn't installed for columnar formats
+    """
+    report_format = report_format or "csv"
+    if report_format not in REPORT_WRITERS:
+        raise ValueError(f"Invalid format '{report_format}'. Allowed values: {', '.join(REPORT_WRITERS)}")
+    if compression and compression not in COMPRESSIONS:
+        raise ValueError(f"Invalid compression '{compression}'. Allowed values: {', '.join(COMPRESSIONS)}")
+    if compression and report_format != "csv":
+        raise ValueError(f"Report in {report_format} format can't be compressed")
+    if issubclass(REPORT_WRITERS[report_format], ColumnarReportWriter) and not importlib.util.find_spec("pyarrow"):
+        raise ValueError(f"Report format {report_format} isn't available (pyarrow isn't installed)")
+
+
+def get_report_writer(report_format=None, compression=None):
+    """
+    Create report writer for format
+    :param report_format: str "csv" (default), "xlsx", "parquet" or "arrow"
+    :param compression: str "gzip" or None, only CSV report can be compressed
+    :return: report writer
+    :raises ValueError: if format or compression isn't supported (see `check_report_format`)
+    """
+    check_report_format(report_format, compression)
+    if not report_format or report_format == "csv":
+        return CsvReportWriter(compression=compression)
+    return REPORT_WRITERS[report_format]()
+
+
+async def stream_report(response, cursor, writer, batch_size=REPORT_BATCH_SIZE):
+    """
+    Write report to prepared stream response by batches of cursor documents.
+    `response.write` waits while transport buffer is full, so slow clients don't make batches pile up in memory.
+    :param response: StreamResponse Prepared response
+    :param cursor: Cursor of documents projected with REPORT_PROJECTION
+    :param writer: Report writer (e.g. CsvReportWriter)
+    :param batch_size: int Number of documents pulled from cursor at once
+    :return: int Number of written rows
+    """
+    rows_count = 0
+    await response.write(writer.write_header())
+    try:
+        while docs := await cursor.to_list(length=batch_size):
+            await response.write(writer.write_rows(map(format_report_row, docs)))
+            rows_count += len(docs)
+    except ExecutionTimeout as exc:
+        logger.error(f"Report downloading {type(exc)}: {exc}", extra={"MESSAGE_ID": "MONGODB_EXC"})
+        await response.write(writer.write_rows((writer.truncated_row,)))
+    if tail := writer.close():
+        await response.write(tail)
+    return rows_count
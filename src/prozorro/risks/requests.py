@@ -1,4 +1,5 @@
 from prozorro.risks.exceptions import RequestRetryException
+from prozorro.risks.scheduler import FETCH_SCHEDULER
 from prozorro.risks.settings import BASE_URL
 from prozorro_crawler.settings import (
     logger,
@@ -14,9 +15,10 @@ async def get_object_data(session, obj_id, resource="tenders", retries=20, date=
     retried = 0
     while True:
         try:
-            result = await request_object(
-                session=session, obj_id=obj_id, resource=resource, method_name="get", date=date, **kwargs
-            )
+            async with FETCH_SCHEDULER.slot(get_object_url(obj_id, resource, date=date)):
+                result = await request_object(
+                    session=session, obj_id=obj_id, resource=resource, method_name="get", date=date, **kwargs
+                )
         except RequestRetryException as e:
             if retried > retries:
                 logger.critical(
@@ -29,11 +31,14 @@ async def get_object_data(session, obj_id, resource="tenders", retries=20, date=
             return result
 
 
-async def request_object(session, obj_id, resource, method_name="get", date=None, **kwargs):
+def get_object_url(obj_id, resource, date=None):
     if resource == "NBU":
-        url = f"https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?date={date}&json"
-    else:
-        url = f"{BASE_URL}/{resource}/{obj_id}"
+        return f"https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?date={date}&json"
+    return f"{BASE_URL}/{resource}/{obj_id}"
+
+
+async def request_object(session, obj_id, resource, method_name="get", date=None, **kwargs):
+    url = get_object_url(obj_id, resource, date=date)
     context = {"METHOD": method_name, "OBJ_ID": obj_id, "RESOURCE": resource}
     method = getattr(session, method_name)
     try:
@@ -72,13 +77,13 @@ async def request_object(session, obj_id, resource, method_name="get", date=None
                 "Precondition Failed while requesting object",
                 extra={"MESSAGE_ID": "PRECONDITION_FAILED", **context},
             )
-            raise RequestRetryException()
+            raise RequestRetryException(response=resp)
         elif resp.status == 429:
             logger.warning(
                 "Too many requests while requesting object",
                 extra={"MESSAGE_ID": "TOO_MANY_REQUESTS", **context},
             )
-            raise RequestRetryException(timeout=TOO_MANY_REQUESTS_INTERVAL)
+            raise RequestRetryException(timeout=TOO_MANY_REQUESTS_INTERVAL, response=resp)
         elif resp.status == 409:
             logger.warning(
                 f"Resource error while requesting object {obj_id}",
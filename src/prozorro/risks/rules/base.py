@@ -1,10 +1,52 @@
 from abc import ABC, abstractmethod
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from functools import cached_property
+from typing import Optional
 
+from pydantic import BaseModel, ConfigDict
+
+from prozorro.risks.models import RiskFromPreviousResult, RiskNotFound
 from prozorro.risks.rules.utils import calculate_end_date
 from prozorro.risks.utils import get_now
 
 
+RULE_DATE_FORMAT = "%Y-%m-%d"
+
+
+class RiskRuleDescriptor(BaseModel):
+    """
+    Immutable rule metadata with parsed dates, so objects are checked against rule dates without parsing strings
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    identifier: str
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+    @classmethod
+    def from_rule(cls, rule):
+        return cls(
+            identifier=rule.identifier,
+            start_date=datetime.strptime(rule.start_date, RULE_DATE_FORMAT).date() if rule.start_date else None,
+            end_date=datetime.strptime(rule.end_date, RULE_DATE_FORMAT).date() if rule.end_date else None,
+        )
+
+    def is_active_on(self, day):
+        """
+        Whether rule isn't archived on provided day
+        :param day: date
+        """
+        return self.end_date is None or day < self.end_date
+
+    def applies_to_date(self, day):
+        """
+        Whether rule should process object created on provided day
+        :param day: date Date of object creation or None if it's unknown
+        """
+        return self.start_date is None or day is None or day >= self.start_date
+
+
 class BaseRiskRule(ABC):
     identifier: str
     name: str
@@ -23,6 +65,15 @@ class BaseRiskRule(ABC):
     value_for_services: int = 0
     value_for_works: int = 0
     max_tender_age_days: int = None
+    # rule returns previous result for tender in `stop_assessment_status` which doesn't match requirements
+    keep_previous_result_on_stop: bool = False
+    # fields of tenders collection documents (dot notation) read by rule in historical queries and their results,
+    # or in parent tender of contract, besides `HISTORICAL_TENDER_FIELDS` which are saved for all rules
+    historical_fields: tuple = ()
+
+    @cached_property
+    def descriptor(self):
+        return RiskRuleDescriptor.from_rule(self)
 
     def tender_matches_requirements(self, tender, status=True, category=True, value=False):
         status_matches = tender["status"] in self.tender_statuses if status else True
@@ -43,6 +94,7 @@ class BaseRiskRule(ABC):
                 get_now(),
                 -timedelta(days=self.max_tender_age_days),
                 normalized=False,
+                cache=False,
             )
             age_matches = datetime.fromisoformat(tender["dateCreated"]) >= cutoff
 
@@ -57,14 +109,23 @@ class BaseRiskRule(ABC):
 
 
 class BaseTenderRiskRule(BaseRiskRule):
+    def not_matched_result(self, tender):
+        """
+        Result of rule for tender, which procurement method, status, procuring entity kind or category
+        doesn't match rule requirements. It's used by rules registry instead of calling `process_tender`.
+        """
+        if self.keep_previous_result_on_stop and tender.get("status") == self.stop_assessment_status:
+            return RiskFromPreviousResult()
+        return RiskNotFound()
+
     @classmethod
     @abstractmethod
-    def process_tender(cls, tender, parent_object=None):
+    def process_tender(cls, tender, parent_object=None, context=None):
         ...
 
 
 class BaseContractRiskRule(BaseRiskRule):
     @classmethod
     @abstractmethod
-    def process_contract(cls, contract, parent_object=None):
+    def process_contract(cls, contract, parent_object=None, context=None):
         ...
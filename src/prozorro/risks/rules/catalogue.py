@@ -0,0 +1,48 @@
+import importlib
+import pkgutil
+from functools import lru_cache
+
+RISK_RULES_PACKAGE = "prozorro.risks.rules"
+# static texts of risk rules, which aren't stored in risk items with RISK_RULES_METADATA_REFERENCED
+# and are joined from the catalogue by risk_id in API responses
+RISK_RULE_METADATA_FIELDS = ("name", "description", "legitimateness", "development_basis")
+
+
+@lru_cache(maxsize=1)
+def get_risk_rules_catalogue():
+    """
+    Get metadata of all risk rules of the package, including rules which aren't processed anymore,
+    because their results are still stored.
+    :return: dict Metadata by rule identifier ({"sas-3-1": {"name": ..., ...}, ...})
+    """
+    package = importlib.import_module(RISK_RULES_PACKAGE)
+    catalogue = {}
+    for module_info in pkgutil.iter_modules(package.__path__):
+        module = importlib.import_module(f"{RISK_RULES_PACKAGE}.{module_info.name}")
+        rule_class = getattr(module, "RiskRule", None)
+        if rule_class is not None:
+            catalogue[rule_class.identifier] = {
+                field: getattr(rule_class, field, None) for field in RISK_RULE_METADATA_FIELDS
+            }
+    return catalogue
+
+
+def shape_tender_risks(risks, with_metadata=True):
+    """
+    Join metadata of risk rules to risk items, which don't have it (stored in reference mode),
+    or remove metadata from all risk items
+    :param risks: dict Tender risks ({"sas-3-1": [{...}, ...], ...})
+    :param with_metadata: bool Whether risk items should have metadata of their rules
+    :return: dict Tender risks (changed in place)
+    """
+    catalogue = get_risk_rules_catalogue() if with_metadata else {}
+    for risk_id, risk_items in risks.items():
+        metadata = catalogue.get(risk_id)
+        for risk_item in risk_items if isinstance(risk_items, list) else (risk_items,):
+            if not with_metadata:
+                for field in RISK_RULE_METADATA_FIELDS:
+                    risk_item.pop(field, None)
+            elif metadata:
+                for field, value in metadata.items():
+                    risk_item.setdefault(field, value)
+    return risks
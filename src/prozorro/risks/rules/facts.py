@@ -0,0 +1,146 @@
+from collections import defaultdict
+from functools import cached_property
+
+# key of all tender objects in indexes grouped by lot
+ALL_LOTS = object()
+
+COMPLAINT_CONTAINERS = ("awards", "cancellations", "qualifications")
+
+
+def get_identifier_key(party):
+    return f"{party['identifier']['scheme']}-{party['identifier']['id']}"
+
+
+class TenderFacts:
+    """
+    Indexes of tender arrays shared by all risk rules.
+
+    Every index is built lazily with one pass over tender array on the first access,
+    so rules don't rescan awards, bids and complaints for every lot.
+    Indexes grouped by lot also have `ALL_LOTS` key with objects of all lots.
+    """
+
+    def __init__(self, tender):
+        self.tender = tender
+
+    @cached_property
+    def awards_by_lot(self):
+        awards = defaultdict(list)
+        for award in self.tender.get("awards", []):
+            awards[award.get("lotID")].append(award)
+            awards[ALL_LOTS].append(award)
+        return awards
+
+    @cached_property
+    def active_awards_by_bid(self):
+        awards = defaultdict(list)
+        for award in self.tender.get("awards", []):
+            if award["status"] == "active":
+                awards[award.get("bid_id")].append(award)
+        return awards
+
+    @cached_property
+    def winner_lots(self):
+        """
+        Lots with active awards (`ALL_LOTS` if tender has any active award)
+        """
+        lots = set()
+        for award in self.tender.get("awards", []):
+            if award["status"] == "active":
+                lots.update((award.get("lotID"), ALL_LOTS))
+        return lots
+
+    @cached_property
+    def disqualified_suppliers_by_lot(self):
+        """
+        Unique suppliers (identifier scheme and id) of unsuccessful awards
+        """
+        suppliers = defaultdict(set)
+        for award in self.tender.get("awards", []):
+            if award["status"] == "unsuccessful":
+                for supplier in award.get("suppliers", []):
+                    key = get_identifier_key(supplier)
+                    suppliers[award.get("lotID")].add(key)
+                    suppliers[ALL_LOTS].add(key)
+        return suppliers
+
+    @cached_property
+    def bids_by_id(self):
+        return {bid["id"]: bid for bid in self.tender.get("bids", [])}
+
+    @cached_property
+    def bidders_by_lot(self):
+        """
+        Unique tenderers (identifier scheme and id) of active bids
+        """
+        bidders = defaultdict(set)
+        for bid in self.tender.get("bids", []):
+            if bid["status"] == "active":
+                tenderers = {get_identifier_key(tenderer) for tenderer in bid.get("tenderers", [])}
+                bidders[ALL_LOTS].update(tenderers)
+                for lot_value in bid.get("lotValues", []):
+                    bidders[lot_value["relatedLot"]].update(tenderers)
+        return bidders
+
+    @cached_property
+    def complaints_by_container(self):
+        """
+        Complaints with type "complaint" of tender and its awards, cancellations and qualifications
+        :return: dict (e.g. {"tender": [...], "awards": [...]}), award complaints are also grouped by award lot
+        """
+        complaints = defaultdict(list)
+        for complaint in self.tender.get("complaints", []):
+            if complaint["type"] == "complaint":
+                complaints["tender"].append(complaint)
+        for container in COMPLAINT_CONTAINERS:
+            for obj in self.tender.get(container, []):
+                for complaint in obj.get("complaints", []):
+                    if complaint["type"] == "complaint":
+                        complaints[container].append(complaint)
+                        if container == "awards":
+                            complaints[("awards", obj.get("lotID"))].append(complaint)
+        return complaints
+
+    @cached_property
+    def active_contracts(self):
+        return [contract for contract in self.tender.get("contracts", []) if contract["status"] == "active"]
+
+    def is_winner_awarded(self, lot=None):
+        return (lot["id"] if lot else ALL_LOTS) in self.winner_lots
+
+    def get_complaints(self, container, statuses, lot=None):
+        """
+        Get complaints of container with provided statuses
+        :param container: str "tender", "awards", "cancellations" or "qualifications"
+        :param statuses: list Allowed complaint statuses
+        :param lot: dict Lot object, only award complaints can be filtered by lot
+        :return: list of complaints
+        """
+        key = (container, lot["id"]) if lot else container
+        return [complaint for complaint in self.complaints_by_container.get(key, []) if complaint["status"] in statuses]
+
+    def count_winner_disqualifications_and_bidders(self, lot=None):
+        """
+        Count number of winner, disqualifications and bidders in tender or lot,
+        the same as `count_winner_disqualifications_and_bidders` in rules utils.
+        :param lot: dict Lot object
+        :return: set of winner, disqualifications and bidders count
+        """
+        lot_key = lot["id"] if lot else ALL_LOTS
+        return (
+            len(self.disqualified_suppliers_by_lot.get(lot_key, ())),
+            int(lot_key in self.winner_lots),
+            len(self.bidders_by_lot.get(lot_key, ())),
+        )
+
+
+def get_tender_facts(tender, context=None):
+    """
+    Get facts of tender, they are shared by all rules through context
+    :param tender: dict Tender data
+    :param context: RiskContext
+    :return: TenderFacts
+    """
+    if context is None:
+        return TenderFacts(tender)
+    return context.get_tender_facts(tender)
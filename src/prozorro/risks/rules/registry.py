@@ -0,0 +1,127 @@
+import logging
+from collections import Counter
+from itertools import product
+
+logger = logging.getLogger(__name__)
+
+# any value which isn't mentioned by rules (e.g. procurementMethodType=reporting)
+OTHER = object()
+
+# requirements checked by `tender_matches_requirements` for every tender: (rule attribute, tender value getter),
+# rule without attribute doesn't check the requirement (e.g. rules without `procurement_categories`)
+TENDER_REQUIREMENTS = (
+    ("procurement_methods", lambda tender: tender.get("procurementMethodType")),
+    ("tender_statuses", lambda tender: tender.get("status")),
+    ("procuring_entity_kinds", lambda tender: (tender.get("procuringEntity") or {}).get("kind", "other")),
+    ("procurement_categories", lambda tender: tender.get("mainProcurementCategory")),
+)
+
+
+class RuleSet:
+    """
+    Risk rules of crawler. Archived rules (with passed `end_date`) are dropped from active rules
+    on the first call of the next day, so rules are archived at midnight without crawler restart.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._active_day = None
+        self._active_rules = ()
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def get_active_rules(self, day):
+        """
+        Get rules which aren't archived on provided day, they are computed once per day
+        :param day: date
+        :return: tuple of rules
+        """
+        if day != self._active_day:
+            self._active_rules = tuple(rule for rule in self.rules if rule.descriptor.is_active_on(day))
+            self._active_day = day
+        return self._active_rules
+
+
+class RulesRegistry(RuleSet):
+    """
+    Tender risk rules indexed by (procurementMethodType, status, procuringEntity.kind, mainProcurementCategory).
+
+    Index of candidate rules for every combination of values mentioned by rules is built once on start.
+    Rules which aren't candidates for tender are pruned: `process_risks` uses their `not_matched_result`
+    without calling `process_tender`, so results stay the same as if all rules were processed.
+    """
+
+    def __init__(self, rules):
+        super().__init__(rules)
+        self.known_values = [
+            frozenset(value for rule in self.rules for value in (getattr(rule, attr, None) or ()))
+            for attr, _ in TENDER_REQUIREMENTS
+        ]
+        self.index = {
+            key: frozenset(rule for rule in self.rules if self._rule_matches(rule, key))
+            for key in product(*(tuple(values) + (OTHER,) for values in self.known_values))
+        }
+        self.stats = Counter()
+        self.pruned_per_object = Counter()
+
+    @staticmethod
+    def _rule_matches(rule, key):
+        for (attr, _), value in zip(TENDER_REQUIREMENTS, key):
+            required = getattr(rule, attr, None)
+            if required is not None and value not in required:
+                return False
+        return True
+
+    def get_key(self, tender):
+        return tuple(
+            value if value in known_values else OTHER
+            for value, known_values in zip(
+                (get_value(tender) for _, get_value in TENDER_REQUIREMENTS),
+                self.known_values,
+            )
+        )
+
+    def get_candidates(self, tender):
+        """
+        Get rules which can match tender
+        :param tender: dict Tender data
+        :return: frozenset of rules
+        """
+        return self.index[self.get_key(tender)]
+
+    def count_pruned(self, processed, pruned):
+        """
+        Count rules processed and pruned for one object
+        :param processed: int
+        :param pruned: int
+        """
+        self.stats["objects"] += 1
+        self.stats["rules_processed"] += processed
+        self.stats["rules_pruned"] += pruned
+        self.pruned_per_object[pruned] += 1
+
+    def log_stats(self, reset=True):
+        """
+        Log counters of pruned rules (e.g. once per crawler page)
+        :param reset: bool Whether counters should be started from zero after logging
+        """
+        if not self.stats["objects"]:
+            return
+        logger.info(
+            f"Processed {self.stats['objects']} objects: "
+            f"{self.stats['rules_processed']} rules processed, {self.stats['rules_pruned']} rules pruned",
+            extra={
+                "MESSAGE_ID": "RISK_RULES_PRUNED",
+                "OBJECTS": self.stats["objects"],
+                "RULES_PROCESSED": self.stats["rules_processed"],
+                "RULES_PRUNED": self.stats["rules_pruned"],
+                "PRUNED_PER_OBJECT": dict(self.pruned_per_object),
+            },
+        )
+        if reset:
+            self.stats.clear()
+            self.pruned_per_object.clear()
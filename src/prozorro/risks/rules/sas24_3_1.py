@@ -1,11 +1,8 @@
 from datetime import timedelta
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.rules.utils import (
-    calculate_end_date,
-    get_complaints,
-    flatten,
-)
+from prozorro.risks.rules.facts import get_tender_facts
+from prozorro.risks.rules.utils import calculate_end_date
 from prozorro.risks.utils import get_now
 
 DECISION_LIMIT = 30
@@ -65,27 +62,13 @@ class RiskRule(BaseTenderRiskRule):
                 return RiskFound()
         return RiskNotFound()
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender, category=False, value=True):
-            complaints = get_complaints(tender, statuses=["satisfied"])
-            award_complaints = flatten(
-                [
-                    get_complaints(award, statuses=["satisfied"])
-                    for award in tender.get("awards", [])
-                ]
-            )
-            cancellation_complaints = flatten(
-                [
-                    get_complaints(cancellation, statuses=["satisfied"])
-                    for cancellation in tender.get("cancellations", [])
-                ]
-            )
-            qualifications_complaints = flatten(
-                [
-                    get_complaints(qualification, statuses=["satisfied"])
-                    for qualification in tender.get("qualifications", [])
-                ]
-            )
+            tender_facts = get_tender_facts(tender, context)
+            complaints = tender_facts.get_complaints("tender", statuses=["satisfied"])
+            award_complaints = tender_facts.get_complaints("awards", statuses=["satisfied"])
+            cancellation_complaints = tender_facts.get_complaints("cancellations", statuses=["satisfied"])
+            qualifications_complaints = tender_facts.get_complaints("qualifications", statuses=["satisfied"])
 
             # Якщо в процедурі присутні блоки data.complaints, data.awards.complaints, data.qualification:complaints
             # або data.cancellations:complaints. що мають complaints.type='complaint' та complaints.status = 'satisfied'
@@ -2,7 +2,8 @@ from datetime import datetime, timedelta
 
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.rules.utils import is_winner_awarded, calculate_end_date
+from prozorro.risks.rules.facts import ALL_LOTS, get_tender_facts
+from prozorro.risks.rules.utils import calculate_end_date
 from prozorro.risks.utils import get_now
 
 DOC_PUBLISHED_LIMIT_DAYS = 4
@@ -49,51 +50,48 @@ class RiskRule(BaseTenderRiskRule):
     max_tender_age_days = 180
 
     @staticmethod
-    def bidder_does_not_have_documents_during_complaint_period(tender, lot=None):
-        for award in tender.get("awards", []):
+    def bidder_does_not_have_documents_during_complaint_period(tender_facts, lot=None):
+        for award in tender_facts.awards_by_lot[lot["id"] if lot else ALL_LOTS]:
             # Визначаємо наявність Переможця та завершення періоду оскарження щодо рішення про нього.
             if (
                 award["status"] == "active"
-                and (not lot or lot["id"] == award["lotID"])
                 and award.get("complaintPeriod", {}).get("endDate")
                 and get_now() > datetime.fromisoformat(award["complaintPeriod"]["endDate"])
             ):
-                documents_found = False
+                award_date = datetime.fromisoformat(award["date"])
                 end_date = calculate_end_date(
                     award["date"],
                     timedelta(days=DOC_PUBLISHED_LIMIT_DAYS),
                 )
                 # Визначаємо наявність довантаження відповідних документів Переможцем
                 # за межами строку в 4 дні після його визначення
-                for bid in tender.get("bids", []):
-                    if bid["id"] == award["bid_id"]:
-                        fields = (
-                            "documents",
-                            "financialDocuments",
-                            "eligibilityDocuments",
-                            "qualificationDocuments",
-                        )
-                        for docs_field in fields:
-                            for doc in bid.get(docs_field, []):
-                                if (
-                                    doc.get("datePublished")
-                                    and datetime.fromisoformat(award["date"])
-                                    < datetime.fromisoformat(doc["datePublished"])
-                                    < end_date
-                                ):
-                                    documents_found = True
-                        if not documents_found:
-                            return True
+                bid = tender_facts.bids_by_id.get(award["bid_id"])
+                if bid:
+                    fields = (
+                        "documents",
+                        "financialDocuments",
+                        "eligibilityDocuments",
+                        "qualificationDocuments",
+                    )
+                    documents_found = any(
+                        doc.get("datePublished")
+                        and award_date < datetime.fromisoformat(doc["datePublished"]) < end_date
+                        for docs_field in fields
+                        for doc in bid.get(docs_field, [])
+                    )
+                    if not documents_found:
+                        return True
 
-    async def process_tender(self, tender, parent_object=None):
-        if self.tender_matches_requirements(tender, category=False, value=True) and is_winner_awarded(tender):
+    async def process_tender(self, tender, parent_object=None, context=None):
+        tender_facts = get_tender_facts(tender, context)
+        if self.tender_matches_requirements(tender, category=False, value=True) and tender_facts.is_winner_awarded():
             if tender.get("lots"):
                 for lot in tender["lots"]:
                     if lot["status"] in ("cancelled", "unsuccessful"):
                         continue
-                    if self.bidder_does_not_have_documents_during_complaint_period(tender, lot=lot):
+                    if self.bidder_does_not_have_documents_during_complaint_period(tender_facts, lot=lot):
                         return RiskFound()
             else:
-                if self.bidder_does_not_have_documents_during_complaint_period(tender):
+                if self.bidder_does_not_have_documents_during_complaint_period(tender_facts):
                     return RiskFound()
         return RiskNotFound()
@@ -1,10 +1,26 @@
+from contextlib import aclosing
 from datetime import timedelta
 
-from prozorro.risks.db import get_tenders_from_historical_data
+from prozorro.risks.db import iter_tenders_from_historical_data
+from prozorro.risks.exchange_rates import prefetch_exchange_rates
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
 from prozorro.risks.rules.utils import calculate_end_date
-from prozorro.risks.utils import get_exchanged_value
+from prozorro.risks.utils import (
+    get_exchanged_value,
+    get_value_uah,
+    get_value_uah_range_filters,
+    value_uah_requires_exchange,
+)
+
+
+# fields of open tenders inspected by rule
+OPEN_TENDERS_PROJECTION = {
+    "tenderPeriod.startDate": True,
+    "value": True,
+    "valueUAH": True,
+    "valueUAHRateDate": True,
+}
 
 
 class RiskRule(BaseTenderRiskRule):
@@ -42,8 +58,9 @@ class RiskRule(BaseTenderRiskRule):
     )
     value_for_services = 400000
     value_for_works = 1500000
+    historical_fields = ("title", "tenderPeriod.startDate")
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if (
             self.tender_matches_requirements(tender, category=False, value=True)
             # Причина закупівлі = openUnsuccessful (підпункт 6 пункту 13). Якщо обрана інша
@@ -54,6 +71,7 @@ class RiskRule(BaseTenderRiskRule):
             # data.procurement.MethodType = reporting зі статусом data.status = complete,
             # з data.procurement.MethodType = aboveThreshold, = aboveThresholdUA, = aboveThresholdEU
             # зі статусами data.status=unsuccessful.
+            tender_value = await get_exchanged_value(tender, date=tender["dateCreated"], context=context)
             filters = {
                 "procuringEntityIdentifier": tender.get(
                     "procuringEntityIdentifier"
@@ -77,21 +95,33 @@ class RiskRule(BaseTenderRiskRule):
                     ).isoformat(),
                     "$lt": tender["dateCreated"],
                 },
+                # value in UAH saved at ingestion is within +-10% (tenders saved without it are checked below)
+                **get_value_uah_range_filters(tender_value, 0.1),
             }
-            open_tenders = await get_tenders_from_historical_data(filters)
-            for open_tender in open_tenders:
-                tender_value = await get_exchanged_value(
-                    tender, date=tender["dateCreated"]
-                )
-                open_tender_value = await get_exchanged_value(
-                    open_tender, open_tender["tenderPeriod"]["startDate"]
-                )
-                # data.value.amount в гривнях на дату звітування знаходиться в межах +-10% від data.value.amount
-                # в гривнях відповідних відкритих торгів
-                if abs(tender_value - open_tender_value) <= open_tender_value * 0.1:
-                    # Протягом року були unsuccessful відкриті торги через неподання жодної тендерної
-                    # пропозиції (з цієї причини) -> ризик не спрацьовує.
-                    return RiskNotFound()
+            # filters by title and value are specific to tender, so query isn't cached and stops at the first match
+            async with aclosing(
+                iter_tenders_from_historical_data(filters, projection=OPEN_TENDERS_PROJECTION)
+            ) as batches:
+                async for open_tenders in batches:
+                    # rates for open tenders saved without value in UAH are loaded at once before comparing values
+                    await prefetch_exchange_rates(
+                        (
+                            open_tender["tenderPeriod"]["startDate"]
+                            for open_tender in open_tenders
+                            if value_uah_requires_exchange(open_tender, open_tender["tenderPeriod"]["startDate"])
+                        ),
+                        context=context,
+                    )
+                    for open_tender in open_tenders:
+                        open_tender_value = await get_value_uah(
+                            open_tender, open_tender["tenderPeriod"]["startDate"], context=context
+                        )
+                        # data.value.amount в гривнях на дату звітування знаходиться в межах +-10%
+                        # від data.value.amount в гривнях відповідних відкритих торгів
+                        if abs(tender_value - open_tender_value) <= open_tender_value * 0.1:
+                            # Протягом року були unsuccessful відкриті торги через неподання жодної тендерної
+                            # пропозиції (з цієї причини) -> ризик не спрацьовує.
+                            return RiskNotFound()
             # Протягом 365 днів у замовника не було відмінених відкритих торгів -> ризик.
             return RiskFound()
         return RiskNotFound()
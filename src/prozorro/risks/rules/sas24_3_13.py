@@ -1,5 +1,6 @@
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
+from prozorro.risks.rules.facts import ALL_LOTS, get_tender_facts
 from prozorro.risks.rules.utils import has_milestone_24
 
 
@@ -42,20 +43,21 @@ class RiskRule(BaseTenderRiskRule):
     max_tender_age_days = 180
 
     @staticmethod
-    def awards_have_milestone_24_code(tender, lot=None):
-        for award in tender.get("awards", []):
-            if (not lot or lot["id"] == award["lotID"]) and has_milestone_24(award):
+    def awards_have_milestone_24_code(tender_facts, lot=None):
+        for award in tender_facts.awards_by_lot[lot["id"] if lot else ALL_LOTS]:
+            if has_milestone_24(award):
                 return True
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender, category=False, value=True):
+            tender_facts = get_tender_facts(tender, context)
             if tender.get("lots"):
                 for lot in tender["lots"]:
                     if lot["status"] in ("cancelled", "unsuccessful"):
                         continue
-                    if self.awards_have_milestone_24_code(tender, lot=lot):
+                    if self.awards_have_milestone_24_code(tender_facts, lot=lot):
                         return RiskFound()
             else:
-                if self.awards_have_milestone_24_code(tender):
+                if self.awards_have_milestone_24_code(tender_facts):
                     return RiskFound()
         return RiskNotFound()
@@ -1,15 +1,22 @@
 from datetime import timedelta, datetime
 
-from prozorro.risks.db import get_tenders_from_historical_data
+from prozorro.risks.exchange_rates import prefetch_exchange_rates
+from prozorro.risks.historical_data import get_sum_of_values_uah, iter_historical_tenders
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
+from prozorro.risks.rules.facts import get_tender_facts
 from prozorro.risks.rules.utils import calculate_end_date
 from prozorro.risks.settings import TIMEZONE
 from prozorro.risks.utils import (
-    get_exchanged_value,
     get_now,
+    get_value_uah,
+    get_value_uah_rate_date_filters,
+    value_uah_requires_exchange,
 )
 
+# fields of historical tenders saved without value in UAH, which are exchanged by rule
+HISTORICAL_TENDERS_PROJECTION = {"dateCreated": True, "value": True}
+
 
 class RiskRule(BaseTenderRiskRule):
     identifier = "sas24-3-14-1"
@@ -38,8 +45,9 @@ class RiskRule(BaseTenderRiskRule):
         "special",
     )
     value_for_services = 400000
+    historical_fields = ("date",)
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender):
             year = datetime.fromisoformat(tender["dateCreated"]).year
             filters = {
@@ -54,20 +62,43 @@ class RiskRule(BaseTenderRiskRule):
                     "$lt": datetime(year + 1, 1, 1, tzinfo=TIMEZONE).isoformat(),
                 },
                 "date": {
-                    "$lt": calculate_end_date(get_now(), -timedelta(days=3), ceil=False).isoformat(),
+                    "$lt": calculate_end_date(get_now(), -timedelta(days=3), ceil=False, cache=False).isoformat(),
                 },
             }
-            historical_tenders = await get_tenders_from_historical_data(filters)
-            year_value = 0
-            for hist_tender in historical_tenders:
-                year_value += await get_exchanged_value(hist_tender, hist_tender["dateCreated"])
-            for contract in tender.get("contracts", []):
-                if contract["status"] == "active":
-                    contract_value = await get_exchanged_value(
-                        contract, date=contract["date"]
-                    )
-                    # Додаємо суму з аналітичної таблиці до нашої очікуваної вартості.
-                    year_value += contract_value
+            # values in UAH saved at ingestion by rates on dateCreated are summed by the database,
+            # tenders saved without them or exchanged by rates on tenderPeriod.startDate are exchanged here
+            year_value = await get_sum_of_values_uah(filters, rate_date_field="dateCreated", context=context)
+            async for historical_tenders in iter_historical_tenders(
+                {**filters, **get_value_uah_rate_date_filters("dateCreated", saved=False)},
+                projection=HISTORICAL_TENDERS_PROJECTION,
+                context=context,
+            ):
+                # rates for batch of historical tenders are loaded at once before summing values
+                await prefetch_exchange_rates(
+                    (
+                        hist_tender["dateCreated"]
+                        for hist_tender in historical_tenders
+                        if value_uah_requires_exchange(hist_tender, hist_tender["dateCreated"])
+                    ),
+                    context=context,
+                )
+                for hist_tender in historical_tenders:
+                    year_value += await get_value_uah(hist_tender, hist_tender["dateCreated"], context=context)
+            active_contracts = get_tender_facts(tender, context).active_contracts
+            await prefetch_exchange_rates(
+                (
+                    contract["date"]
+                    for contract in active_contracts
+                    if value_uah_requires_exchange(contract, contract["date"])
+                ),
+                context=context,
+            )
+            for contract in active_contracts:
+                contract_value = await get_value_uah(
+                    contract, date=contract["date"], context=context
+                )
+                # Додаємо суму з аналітичної таблиці до нашої очікуваної вартості.
+                year_value += contract_value
             # Якщо сума data.contracts.value виходить більша або дорівнює сумі робіт/послуг за поточний рік,
             # то індикатор приймає значення 1.
             value_mapping = {
@@ -1,11 +1,6 @@
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.rules.utils import (
-    is_winner_awarded,
-    count_winner_disqualifications_and_bidders,
-    flatten,
-    get_complaints,
-)
+from prozorro.risks.rules.facts import get_tender_facts
 
 
 class RiskRule(BaseTenderRiskRule):
@@ -49,37 +44,20 @@ class RiskRule(BaseTenderRiskRule):
     value_for_works = 1500000
     max_tender_age_days = 180
 
-    async def process_tender(self, tender, parent_object=None):
-        if self.tender_matches_requirements(tender, category=False, value=True) and is_winner_awarded(tender):
+    async def process_tender(self, tender, parent_object=None, context=None):
+        tender_facts = get_tender_facts(tender, context)
+        if self.tender_matches_requirements(tender, category=False, value=True) and tender_facts.is_winner_awarded():
             if tender.get("lots"):
                 for lot in tender["lots"]:
                     if lot["status"] in ("cancelled", "unsuccessful"):
                         continue
-                    disqualifications_count, _, _ = count_winner_disqualifications_and_bidders(
-                        tender,
-                        lot,
-                        check_winner=True,
-                    )
-                    award_complaints = flatten(
-                        [
-                            get_complaints(award, statuses=["resolved"])
-                            for award in tender.get("awards", [])
-                            if award.get("lotID") == lot["id"]
-                        ]
-                    )
+                    disqualifications_count, _, _ = tender_facts.count_winner_disqualifications_and_bidders(lot)
+                    award_complaints = tender_facts.get_complaints("awards", statuses=["resolved"], lot=lot)
                     if disqualifications_count >= 2 and award_complaints:
                         return RiskFound()
             else:
-                disqualifications_count, _, _ = count_winner_disqualifications_and_bidders(
-                    tender,
-                    check_winner=True,
-                )
-                award_complaints = flatten(
-                    [
-                        get_complaints(award, statuses=["resolved"])
-                        for award in tender.get("awards", [])
-                    ]
-                )
+                disqualifications_count, _, _ = tender_facts.count_winner_disqualifications_and_bidders()
+                award_complaints = tender_facts.get_complaints("awards", statuses=["resolved"])
                 if disqualifications_count >= 2 and award_complaints:
                     return RiskFound()
         return RiskNotFound()
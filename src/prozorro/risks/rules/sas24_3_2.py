@@ -1,6 +1,6 @@
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.rules.utils import is_winner_awarded, count_winner_disqualifications_and_bidders
+from prozorro.risks.rules.facts import get_tender_facts
 
 
 class RiskRule(BaseTenderRiskRule):
@@ -30,16 +30,15 @@ class RiskRule(BaseTenderRiskRule):
     value_for_services = 400000
     max_tender_age_days = 180
 
-    async def process_tender(self, tender, parent_object=None):
-        if self.tender_matches_requirements(tender, value=True) and is_winner_awarded(tender):
+    async def process_tender(self, tender, parent_object=None, context=None):
+        tender_facts = get_tender_facts(tender, context)
+        if self.tender_matches_requirements(tender, value=True) and tender_facts.is_winner_awarded():
             if len(tender.get("lots", [])):
                 for lot in tender.get("lots", []):
                     if lot["status"] in ("cancelled", "unsuccessful"):
                         continue
-                    disqualifications_count, winner_count, _ = count_winner_disqualifications_and_bidders(
-                        tender,
-                        lot,
-                        check_winner=True,
+                    disqualifications_count, winner_count, _ = tender_facts.count_winner_disqualifications_and_bidders(
+                        lot
                     )
                     if not disqualifications_count:
                         continue
@@ -48,10 +47,7 @@ class RiskRule(BaseTenderRiskRule):
                     if winner_count and disqualifications_count >= 2:
                         return RiskFound()
             else:
-                disqualifications_count, winner_count, _ = count_winner_disqualifications_and_bidders(
-                    tender,
-                    check_winner=True,
-                )
+                disqualifications_count, winner_count, _ = tender_facts.count_winner_disqualifications_and_bidders()
                 if not disqualifications_count:
                     return RiskNotFound()
 
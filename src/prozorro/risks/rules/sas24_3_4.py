@@ -40,7 +40,7 @@ class RiskRule(BaseContractRiskRule):
     value_for_services = 400000
     value_for_works = 1500000
 
-    async def process_contract(self, contract, parent_object=None):
+    async def process_contract(self, contract, parent_object=None, context=None):
         if contract["status"] in self.contract_statuses:
             if datetime.fromisoformat(parent_object["dateCreated"]) < CRAWLER_START_DATE:
                 raise SkipException()
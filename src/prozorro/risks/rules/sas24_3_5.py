@@ -1,10 +1,9 @@
+from collections import defaultdict
+
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.rules.utils import (
-    is_winner_awarded,
-    count_winner_disqualifications_and_bidders,
-    has_milestone_24,
-)
+from prozorro.risks.rules.facts import ALL_LOTS, get_identifier_key, get_tender_facts
+from prozorro.risks.rules.utils import has_milestone_24
 
 
 class RiskRule(BaseTenderRiskRule):
@@ -34,8 +33,9 @@ class RiskRule(BaseTenderRiskRule):
     value_for_works = 1500000
     max_tender_age_days = 180
 
-    async def process_tender(self, tender, parent_object=None):
-        if self.tender_matches_requirements(tender, category=False, value=True) and is_winner_awarded(tender):
+    async def process_tender(self, tender, parent_object=None, context=None):
+        tender_facts = get_tender_facts(tender, context)
+        if self.tender_matches_requirements(tender, category=False, value=True) and tender_facts.is_winner_awarded():
             open_eu_tender = tender["procurementMethodType"] == "aboveThresholdEU"
             # Визначаємо кількість дискваліфікацій
             if open_eu_tender:
@@ -47,67 +47,35 @@ class RiskRule(BaseTenderRiskRule):
             else:
                 unsuccessful_qualifications = [
                     aw
-                    for aw in tender.get("awards", [])
+                    for aw in tender_facts.awards_by_lot[ALL_LOTS]
                     if aw["status"] == "unsuccessful" and not has_milestone_24(aw)
                 ]
             if not unsuccessful_qualifications:
                 return RiskNotFound()
 
+            # Визначаємо дискваліфікованих учасників для кожного лота за один прохід
+            disqualified_bidders_in_qualif = defaultdict(set)
+            for qualification in unsuccessful_qualifications:
+                # Визначаємо кількість дискваліфікацій для aboveThresholdEU - qualifications.status = 'unsuccessful'
+                if open_eu_tender:
+                    bidders = {qualification["bidID"]}
+                else:
+                    bidders = {get_identifier_key(supplier) for supplier in qualification.get("suppliers", [])}
+                disqualified_bidders_in_qualif[qualification.get("lotID")].update(bidders)
+                disqualified_bidders_in_qualif[ALL_LOTS].update(bidders)
+
             if len(tender.get("lots", [])):
                 for lot in tender["lots"]:
                     if lot["status"] in ("cancelled", "unsuccessful"):
                         continue
-                    disqualified_bidders_in_qualif = set()
-
-                    # Визначаємо кількість дискваліфікацій для aboveThresholdEU - qualifications.status = 'unsuccessful'
-                    if open_eu_tender:
-                        for qualification in unsuccessful_qualifications:
-                            if qualification.get("lotID") == lot["id"]:
-                                disqualified_bidders_in_qualif.add(
-                                    qualification["bidID"]
-                                )
-                    else:
-                        for award in unsuccessful_qualifications:
-                            if award.get("lotID") == lot["id"]:
-                                for supplier in award.get("suppliers", []):
-                                    disqualified_bidders_in_qualif.add(
-                                        f'{supplier["identifier"]["scheme"]}-{supplier["identifier"]["id"]}'
-                                    )
-
                     # Визначаємо кількість дискваліфікацій - кількість об’єктів data.awards, що посилаються
                     # на лот data.awards.lotID=data.lots.id та мають data.awards.status='unsuccessful'
-                    _, winner_count, _ = (
-                        count_winner_disqualifications_and_bidders(
-                            tender,
-                            lot,
-                            check_winner=True,
-                        )
-                    )
-
                     # Якщо кількість дискваліфікацій дорівнює 2 або більше, індикатор приймає значення 1
-                    if winner_count and len(disqualified_bidders_in_qualif) >= 2:
+                    if tender_facts.is_winner_awarded(lot) and len(disqualified_bidders_in_qualif[lot["id"]]) >= 2:
                         return RiskFound()
             else:
                 # Якщо процедура не має лотів i кількість дискваліфікацій дорівнює 2 або більше,
                 # індикатор приймає значення 1
-                disqualified_bidders_in_qualif = set()
-
-                # Визначаємо кількість дискваліфікацій для aboveThresholdEU - qualifications.status = 'unsuccessful'
-                if open_eu_tender:
-                    for qualification in unsuccessful_qualifications:
-                        disqualified_bidders_in_qualif.add(qualification["bidID"])
-                else:
-                    for award in unsuccessful_qualifications:
-                        for supplier in award.get("suppliers", []):
-                            disqualified_bidders_in_qualif.add(
-                                f'{supplier["identifier"]["scheme"]}-{supplier["identifier"]["id"]}'
-                            )
-                _, winner_count, _ = (
-                    count_winner_disqualifications_and_bidders(
-                        tender,
-                        check_winner=True,
-                    )
-                )
-                if winner_count and len(disqualified_bidders_in_qualif) >= 2:
+                if tender_facts.is_winner_awarded() and len(disqualified_bidders_in_qualif[ALL_LOTS]) >= 2:
                     return RiskFound()
         return RiskNotFound()
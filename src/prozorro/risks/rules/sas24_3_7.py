@@ -39,8 +39,9 @@ class RiskRule(BaseContractRiskRule):
     )
     procurement_categories = ("works",)
     value_for_works = 1500000
+    historical_fields = ("contracts.id", "contracts.date", "contracts.status")
 
-    async def process_contract(self, contract, parent_object=None):
+    async def process_contract(self, contract, parent_object=None, context=None):
         if contract["status"] in self.contract_statuses:
             if (
                 datetime.fromisoformat(parent_object["dateCreated"])
@@ -1,9 +1,7 @@
 from prozorro.risks.models import RiskFound, RiskNotFound
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.rules.utils import (
-    get_complaints,
-    is_winner_awarded,
-)
+from prozorro.risks.rules.facts import ALL_LOTS, get_tender_facts
+from prozorro.risks.rules.utils import get_complaints
 
 
 class RiskRule(BaseTenderRiskRule):
@@ -25,30 +23,22 @@ class RiskRule(BaseTenderRiskRule):
     max_tender_age_days = 180
 
     @staticmethod
-    def tender_has_active_awards_with_same_bid(awards, current_award):
+    def tender_has_active_awards_with_same_bid(tender_facts, current_award):
         # перевіряємо чи є ще інші data.awards в статусі data.awards.status= "active"
         # із таким же data.awards.bid_id та lotID
         active_awards = [
             award
-            for award in awards
-            if all(
-                [
-                    award["id"] != current_award["id"],
-                    award["status"] == "active",
-                    award["bid_id"] == current_award["bid_id"],
-                    (
-                        award["lotID"] == current_award["lotID"]
-                        if current_award.get("lotID")
-                        else True
-                    ),
-                ]
-            )
+            for award in tender_facts.active_awards_by_bid.get(current_award["bid_id"], [])
+            if award["id"] != current_award["id"]
+            and (award["lotID"] == current_award["lotID"] if current_award.get("lotID") else True)
         ]
         return len(active_awards) > 0
 
-    async def process_tender(self, tender, parent_object=None):
-        if self.tender_matches_requirements(tender, category=False, value=True) and is_winner_awarded(tender):
-            for award in tender.get("awards", []):
+    async def process_tender(self, tender, parent_object=None, context=None):
+        tender_facts = get_tender_facts(tender, context)
+        if self.tender_matches_requirements(tender, category=False, value=True) and tender_facts.is_winner_awarded():
+            lots = {lot["id"]: lot for lot in tender.get("lots", [])}
+            for award in tender_facts.awards_by_lot[ALL_LOTS]:
                 # Шукаємо в процедурі блоки data.awards.complaints, що мають complaints.type='complaint'
                 # та complaints.status = 'satisfied',
                 complaints = get_complaints(award, statuses=["satisfied", "resolved"])
@@ -57,19 +47,12 @@ class RiskRule(BaseTenderRiskRule):
 
                 # Якщо процедура має лоти, то розрахунок проводимо лише для лотів data.lots.id,
                 # у яких є awards.complaints, на які посилається data.awards.lotID
-                if len(tender.get("lots", [])):
-                    for lot in tender["lots"]:
-                        if (
-                            lot["status"] not in ("cancelled", "unsuccessful")
-                            and lot["id"] == award["lotID"]
-                        ):
-                            if self.tender_has_active_awards_with_same_bid(
-                                tender["awards"], award
-                            ):
-                                return RiskFound()
+                if lots:
+                    lot = lots.get(award["lotID"])
+                    if lot and lot["status"] not in ("cancelled", "unsuccessful"):
+                        if self.tender_has_active_awards_with_same_bid(tender_facts, award):
+                            return RiskFound()
                 else:
-                    if self.tender_has_active_awards_with_same_bid(
-                        tender["awards"], award
-                    ):
+                    if self.tender_has_active_awards_with_same_bid(tender_facts, award):
                         return RiskFound()
         return RiskNotFound()
@@ -52,6 +52,7 @@ class RiskRule(BaseTenderRiskRule):
         "special",
     )
     end_date = OLD_SAS_RISKS_END_DATE
+    keep_previous_result_on_stop = True
 
     @staticmethod
     def check_decision_delta(complaints):
@@ -62,7 +63,7 @@ class RiskRule(BaseTenderRiskRule):
                 return RiskFound()
         return RiskNotFound()
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender, category=False):
             complaints = get_complaints(tender, statuses=["satisfied"])
             award_complaints = flatten(
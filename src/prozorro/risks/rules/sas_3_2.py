@@ -24,8 +24,9 @@ class RiskRule(BaseTenderRiskRule):
     )
     procurement_categories = ("goods", "services")
     end_date = OLD_SAS_RISKS_END_DATE
+    keep_previous_result_on_stop = True
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender):
             if len(tender.get("lots", [])):
                 for lot in tender.get("lots", []):
@@ -2,7 +2,7 @@ from datetime import datetime
 
 from prozorro.risks.models import RiskFound, RiskNotFound, RiskFromPreviousResult
 from prozorro.risks.rules.base import BaseTenderRiskRule
-from prozorro.risks.historical_data import get_list_of_cpvs
+from prozorro.risks.historical_data import get_entity_supplier_cpvs
 from prozorro.risks.settings import OLD_SAS_RISKS_END_DATE
 
 
@@ -28,8 +28,14 @@ class RiskRule(BaseTenderRiskRule):
     )
     procurement_categories = ("goods", "services")
     end_date = OLD_SAS_RISKS_END_DATE
+    keep_previous_result_on_stop = True
+    historical_fields = (
+        "contracts.dateSigned",
+        "contracts.suppliers.identifier",
+        "contracts.items.classification.id",
+    )
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender):
             active_awards = [award for award in tender.get("awards", []) if award["status"] == "active"]
             # Якщо в процедурі немає жодного об’єкту data.awards, що має статус data.awards.status='active',
@@ -42,12 +48,13 @@ class RiskRule(BaseTenderRiskRule):
                     # Перевіряємо, що закупав замовник у конкретного постачальника протягом календарного року
                     supplier_identifier = supplier.get("identifier", {})
                     year = datetime.fromisoformat(tender["dateCreated"]).year
-                    result = await get_list_of_cpvs(
+                    result = await get_entity_supplier_cpvs(
                         year=year,
                         entity_identifier=tender["procuringEntityIdentifier"],
                         supplier_identifier=supplier_identifier,
                         procurement_methods=self.procurement_methods,
                         procurement_categories=self.procurement_categories,
+                        context=context,
                     )
 
                     # За ідентифікатором замовника та ідентифікатором перможця рахуємо коди CPV.
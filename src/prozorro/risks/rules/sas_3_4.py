@@ -26,7 +26,7 @@ class RiskRule(BaseContractRiskRule):
     )
     end_date = OLD_SAS_RISKS_END_DATE
 
-    async def process_contract(self, contract, parent_object=None):
+    async def process_contract(self, contract, parent_object=None, context=None):
         if contract["status"] in self.contract_statuses:
             if datetime.fromisoformat(parent_object["dateCreated"]) < CRAWLER_START_DATE:
                 raise SkipException()
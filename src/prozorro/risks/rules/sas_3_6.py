@@ -20,8 +20,9 @@ class RiskRule(BaseTenderRiskRule):
         "special",
     )
     end_date = OLD_SAS_RISKS_END_DATE
+    keep_previous_result_on_stop = True
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender, category=False):
             if len(tender.get("lots", [])):
                 # Якщо процедура має лоти, то розрахунок проводимо в розрізі кожного лота
@@ -28,8 +28,9 @@ class RiskRule(BaseContractRiskRule):
     )
     procurement_categories = ("works",)
     end_date = OLD_SAS_RISKS_END_DATE
+    historical_fields = ("contracts.id", "contracts.date", "contracts.status")
 
-    async def process_contract(self, contract, parent_object=None):
+    async def process_contract(self, contract, parent_object=None, context=None):
         if contract["status"] in self.contract_statuses:
             if datetime.fromisoformat(parent_object["dateCreated"]) < CRAWLER_START_DATE:
                 raise SkipException()
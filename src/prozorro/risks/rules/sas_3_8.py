@@ -19,6 +19,7 @@ class RiskRule(BaseTenderRiskRule):
         "special",
     )
     end_date = OLD_SAS_RISKS_END_DATE
+    keep_previous_result_on_stop = True
 
     @staticmethod
     def tender_has_another_award_with_same_bid_and_milestone(award, awards_with_milestones):
@@ -34,7 +35,7 @@ class RiskRule(BaseTenderRiskRule):
                         return True
         return False
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender, category=False):
             # Шукаємо в процедурі блоки data.awards.complaints, що мають complaints.type='complaint',
             # а також data.award.milestones.code="24h"
@@ -17,6 +17,7 @@ class RiskRule(BaseTenderRiskRule):
         "special",
     )
     end_date = OLD_SAS_RISKS_END_DATE
+    keep_previous_result_on_stop = True
 
     @staticmethod
     def tender_has_active_awards_with_same_bid(awards, current_award):
@@ -36,7 +37,7 @@ class RiskRule(BaseTenderRiskRule):
         ]
         return len(active_awards) > 0
 
-    async def process_tender(self, tender, parent_object=None):
+    async def process_tender(self, tender, parent_object=None, context=None):
         if self.tender_matches_requirements(tender, category=False):
             for award in tender.get("awards", []):
                 # Шукаємо в процедурі блоки data.awards.complaints, що мають complaints.type='complaint'
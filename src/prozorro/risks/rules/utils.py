@@ -1,7 +1,9 @@
 from datetime import datetime
+from functools import lru_cache
+
 from dateorro import calc_datetime, calc_normalized_datetime, calc_working_datetime
 
-from prozorro.risks.settings import TEST_MODE, TIMEZONE, WORKING_DAYS
+from prozorro.risks.settings import END_DATE_CACHE_SIZE, TEST_MODE, TIMEZONE, WORKING_DAYS
 
 
 def calculate_end_date(
@@ -11,19 +13,36 @@ def calculate_end_date(
     ceil=True,
     working_days=False,
     accelerator=1000,
+    cache=True,
 ):
     """
     Calculate end datetime for given date obj depends on timedelta obj.
     For TEST_MODE it will calculate datetime with accelerator 1000 without normalizing.
     Parameters `normalized` and `ceil` are required for calculating datetime from the next day of the week.
-    :param date_obj: datetime Datetime object.
+    Results are cached, the same complaint or award dates are calculated for every rule and every tender update.
+    Dates which are different on every call (e.g. current time) shouldn't be cached.
+    :param date_obj: datetime Datetime object or ISO formatted string.
     :param timedelta_obj: datetime.timedelta Timedelta object.
     :param normalized: bool Flag for calculating normalized date.
     :param ceil: bool Flag for calculating date from the next day of the week.
     :param working_days: bool Flag for calculating working days, excluding weekends.
     :param accelerator: int Accelerator for calculating datetime in TEST_MODE.
+    :param cache: bool Whether result should be cached.
     :return: result datetime object
     """
+    if not cache:
+        return _calculate_end_date(date_obj, timedelta_obj, normalized, ceil, working_days, accelerator)
+    # equal datetimes in different timezones are normalized to different days, so utcoffset is the part of key
+    offset = date_obj.utcoffset() if isinstance(date_obj, datetime) else None
+    return _cached_end_date(date_obj, offset, timedelta_obj, normalized, ceil, working_days, accelerator)
+
+
+@lru_cache(maxsize=END_DATE_CACHE_SIZE)
+def _cached_end_date(date_obj, offset, timedelta_obj, normalized, ceil, working_days, accelerator):
+    return _calculate_end_date(date_obj, timedelta_obj, normalized, ceil, working_days, accelerator)
+
+
+def _calculate_end_date(date_obj, timedelta_obj, normalized, ceil, working_days, accelerator):
     date_obj = (
         date_obj if isinstance(date_obj, datetime) else datetime.fromisoformat(date_obj)
     )
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+from prozorro.risks.exceptions import RequestRetryException
+from prozorro.risks.settings import (
+    FETCH_LATENCY_TARGET,
+    FETCH_MAX_CONCURRENCY,
+    FETCH_MIN_CONCURRENCY,
+    FETCH_RATE_BURST,
+    FETCH_RATE_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+# adaptive concurrency isn't decreased more often than once per interval,
+# so burst of 429 responses for requests sent together is counted as one signal
+DECREASE_INTERVAL = 1
+
+
+class TokenBucket:
+    """
+    Rate limiter for one host: `rate` requests per second with bursts up to `burst` requests
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FetchScheduler:
+    """
+    Scheduler for object fetches shared by all requests of crawler process.
+    Every request takes a slot of global concurrency limit and a token of its host rate limiter.
+    Concurrency limit is adaptive (additive increase, multiplicative decrease):
+    it grows by one after `limit` fast successful requests,
+    it is halved after 429 response and decreased by one after response slower than latency target.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=FETCH_MAX_CONCURRENCY,
+        min_concurrency=FETCH_MIN_CONCURRENCY,
+        rate=FETCH_RATE_LIMIT,
+        burst=FETCH_RATE_BURST,
+        latency_target=FETCH_LATENCY_TARGET,
+    ):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = max(min(min_concurrency, self.max_concurrency), 1)
+        self.limit = self.max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._successes = 0
+        self._decreased_at = 0
+        self._waiters = deque()
+        self._buckets = {}
+
+    def _wake_up_waiters(self):
+        free_slots = self.limit - self.in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    async def _acquire(self):
+        while self.in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # slot was given to the cancelled waiter, so it should be passed further
+                    self._wake_up_waiters()
+                raise
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake_up_waiters()
+
+    def _decrease(self, new_limit, reason):
+        now = time.monotonic()
+        if now - self._decreased_at < DECREASE_INTERVAL:
+            return
+        self._decreased_at = now
+        self._successes = 0
+        new_limit = max(self.min_concurrency, new_limit)
+        if new_limit < self.limit:
+            logger.info(
+                f"Fetch concurrency decreased from {self.limit} to {new_limit} ({reason})",
+                extra={"MESSAGE_ID": "FETCH_CONCURRENCY_DECREASED"},
+            )
+            self.limit = new_limit
+
+    def _increase(self):
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            if self.limit < self.max_concurrency:
+                self.limit += 1
+                self._wake_up_waiters()
+
+    def observe(self, status, latency):
+        """
+        Adapt concurrency limit to the result of request
+        :param status: int Response status or None if there was no response
+        :param latency: float Request duration in seconds
+        """
+        if status == 429:
+            self._decrease(self.limit // 2, "too many requests")
+        elif latency > self.latency_target:
+            self._decrease(self.limit - 1, f"latency {latency:.2f}s")
+        elif status is not None and status < 400:
+            self._increase()
+
+    def get_bucket(self, host):
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """
+        Wait for the free slot and host rate limit for request to url
+        :param url: str Request url
+        """
+        await self._acquire()
+        try:
+            await self.get_bucket(urlparse(url).netloc).acquire()
+            started_at = time.monotonic()
+            status = 200
+            try:
+                yield
+            except RequestRetryException as e:
+                status = e.response.status if e.response is not None else None
+                raise
+            except BaseException:
+                status = None
+                raise
+            finally:
+                self.observe(status, time.monotonic() - started_at)
+        finally:
+            self._release()
+
+
+FETCH_SCHEDULER = FetchScheduler()
@@ -1,9 +1,19 @@
-from aiohttp.web import json_response as base_json_response
+from aiohttp import web
 from datetime import datetime, timezone
 from bson import ObjectId
 from uuid import UUID
 import json
 
+from prozorro.risks.settings import JSON_SERIALIZER
+
+try:
+    import orjson
+except ImportError:  # optional dependency, stdlib json is used without it
+    orjson = None
+
+# datetimes are passed to `json_serialize`, so they are formatted the same way as with stdlib json
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else None
+
 
 def to_iso_format(obj):
     if obj.tzinfo is None:
@@ -21,10 +31,48 @@ def json_serialize(obj):
     raise TypeError(f"Type {type(obj)} not serializable")
 
 
-def json_dumps(*args, **kwargs):
-    kwargs["default"] = json_serialize
-    return json.dumps(*args, **kwargs)
+def stdlib_json_dumps_bytes(obj):
+    return json.dumps(obj, default=json_serialize).encode("utf-8")
+
+
+def orjson_dumps_bytes(obj):
+    return orjson.dumps(obj, default=json_serialize, option=ORJSON_OPTIONS)
+
+
+JSON_BACKENDS = {"stdlib": stdlib_json_dumps_bytes}
+if orjson:
+    JSON_BACKENDS["orjson"] = orjson_dumps_bytes
+
+
+def get_json_backend(name=JSON_SERIALIZER):
+    """
+    Get function that serializes object to JSON bytes.
+    Backends return the same values (e.g. dates, ids and sets are converted by `json_serialize`),
+    only whitespaces and escaping of non-ASCII characters are different.
+    :param name: str "orjson", "stdlib" or "auto" (orjson if it's installed)
+    :return: function
+    """
+    if name == "auto":
+        name = "orjson" if "orjson" in JSON_BACKENDS else "stdlib"
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"JSON serializer {name} isn't available. Available values: {', '.join(JSON_BACKENDS)}")
+    return JSON_BACKENDS[name]
+
+
+json_dumps_bytes = get_json_backend()
+
+
+def json_dumps(obj, **kwargs):
+    if kwargs:  # formatting options (e.g. indent) are supported by stdlib json only
+        return json.dumps(obj, default=json_serialize, **kwargs)
+    return json_dumps_bytes(obj).decode("utf-8")
 
 
-def json_response(*args, **kwargs):
-    return base_json_response(dumps=json_dumps, *args, **kwargs)
+def json_response(data, status=200, **kwargs):
+    return web.Response(
+        body=json_dumps_bytes(data),
+        status=status,
+        content_type="application/json",
+        charset="utf-8",
+        **kwargs,
+    )
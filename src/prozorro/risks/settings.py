@@ -28,19 +28,80 @@ CLIENT_MAX_SIZE = int(os.getenv("CLIENT_MAX_SIZE", 1024**2 * 100))
 MAX_LIST_LIMIT = int(os.environ.get("MAX_LIST_LIMIT", 100))
 MAX_TIME_QUERY = int(os.environ.get("MAX_TIME_QUERY", 10000))  # query time limit during filtering risks in ms
 MONGODB_ERROR_INTERVAL = float(os.getenv("MONGODB_ERROR_INTERVAL", 1))
+MONGODB_ERROR_MAX_INTERVAL = float(os.getenv("MONGODB_ERROR_MAX_INTERVAL", 30))
+# number of repeats of failed tender risks update, the error is raised after that
+MONGODB_UPDATE_RETRIES = int(os.getenv("MONGODB_UPDATE_RETRIES", 5))
+# risk history keeps only indicator changes, at most RISK_HISTORY_MAX_DEPTH last of them (0 means unlimited)
+RISK_HISTORY_MAX_DEPTH = int(os.getenv("RISK_HISTORY_MAX_DEPTH", 50))
+# save full history of every assessment to risk_history collection
+RISK_HISTORY_COLLECTION_ENABLED = bool(os.environ.get("RISK_HISTORY_COLLECTION_ENABLED", False))
+# tenders collection keeps only fields of tenders registered by risk rules (empty value to save the whole tenders)
+HISTORICAL_TENDERS_PROJECTION = bool(os.environ.get("HISTORICAL_TENDERS_PROJECTION", True))
+# number of tenders pulled at once by historical queries of rules
+HISTORICAL_QUERY_BATCH_SIZE = int(os.environ.get("HISTORICAL_QUERY_BATCH_SIZE", 100))
+# results of historical queries are shared by tenders of crawler feed page
+HISTORICAL_CACHE_TTL = int(os.environ.get("HISTORICAL_CACHE_TTL", 60))  # seconds
+HISTORICAL_CACHE_SIZE = int(os.environ.get("HISTORICAL_CACHE_SIZE", 1000))
+# risk items are saved without static texts of their rules (name, description, etc.),
+# which are joined from rules catalogue by risk_id in API responses
+RISK_RULES_METADATA_REFERENCED = bool(os.environ.get("RISK_RULES_METADATA_REFERENCED", False))
 CRAWLER_START_DATE = datetime.fromisoformat(os.getenv("CRAWLER_START_DATE", "2015-02-23T12:00:00.756010+02:00"))
 OLD_SAS_RISKS_END_DATE = os.getenv("OLD_SAS_RISKS_END_DATE", "2024-10-31")
 
 # Excel cannot handle more than 1,048,576 rows
 REPORT_ITEMS_LIMIT = min(int(os.environ.get("REPORT_ITEMS_LIMIT", 100000)), 1048500)
+# number of documents pulled from report cursor and written to response at once
+REPORT_BATCH_SIZE = int(os.environ.get("REPORT_BATCH_SIZE", 5000))
+# report jobs: reports are generated in background and their files are stored in GridFS or in directory ("file"),
+# which is shared by API replicas (REPORT_JOBS_DIR is required for it)
+REPORT_JOBS_STORAGE = os.environ.get("REPORT_JOBS_STORAGE", "gridfs")
+REPORT_JOBS_DIR = os.environ.get("REPORT_JOBS_DIR")
+# seconds, last dateAssessed is rounded down to it in job id, so done report is reused while new tenders are assessed
+REPORT_JOBS_WATERMARK_INTERVAL = int(os.environ.get("REPORT_JOBS_WATERMARK_INTERVAL", 3600))
+REPORT_JOBS_WORKERS = int(os.environ.get("REPORT_JOBS_WORKERS", 1))  # per API process, 0 - jobs aren't processed
+REPORT_JOBS_POLL_INTERVAL = float(os.environ.get("REPORT_JOBS_POLL_INTERVAL", 5))  # seconds
+REPORT_JOBS_TIMEOUT = int(os.environ.get("REPORT_JOBS_TIMEOUT", 3600))  # seconds, then running job is restarted
+REPORT_JOBS_TTL = int(os.environ.get("REPORT_JOBS_TTL", 86400))  # seconds, then finished job and its file are removed
+# risks feed consumers waiting for new tenders (long polling and SSE) share one change stream of risks collection,
+# if change streams are disabled or not supported (standalone MongoDB), the last dateAssessed is polled instead
+FEED_CHANGE_STREAM = bool(os.environ.get("FEED_CHANGE_STREAM", True))
+FEED_POLL_INTERVAL = float(os.environ.get("FEED_POLL_INTERVAL", 5))  # seconds
+FEED_MAX_WAIT = int(os.environ.get("FEED_MAX_WAIT", 60))  # seconds, max `wait` param of risks feed long polling
+FEED_SSE_HEARTBEAT = float(os.environ.get("FEED_SSE_HEARTBEAT", 15))  # seconds between SSE keep-alive comments
+# serializer of API responses: "orjson", "stdlib" or "auto" (orjson if it's installed)
+JSON_SERIALIZER = os.environ.get("JSON_SERIALIZER", "auto")
 ALLOW_ALL_ORIGINS = bool(os.environ.get("ALLOW_ALL_ORIGINS", True))
 TEST_MODE = bool(os.environ.get("TEST_MODE", False))
+# process crawler feed page as one batch with bulk writes instead of processing every object separately
+CRAWLER_BATCH_MODE = bool(os.environ.get("CRAWLER_BATCH_MODE", False))
 HTTPS_PROXY = os.environ.get("HTTPS_PROXY", "")
+# object fetches scheduler: concurrency is adapted between min and max values by 429 responses and latency
+FETCH_MAX_CONCURRENCY = int(os.environ.get("FETCH_MAX_CONCURRENCY", 30))
+FETCH_MIN_CONCURRENCY = int(os.environ.get("FETCH_MIN_CONCURRENCY", 2))
+FETCH_RATE_LIMIT = float(os.environ.get("FETCH_RATE_LIMIT", 50))  # requests per second for every host, 0 - unlimited
+FETCH_RATE_BURST = int(os.environ.get("FETCH_RATE_BURST", 50))
+FETCH_LATENCY_TARGET = float(os.environ.get("FETCH_LATENCY_TARGET", 3))  # seconds
+
+HTTP_CONNECTIONS_LIMIT = int(os.environ.get("HTTP_CONNECTIONS_LIMIT", 100))
+HTTP_CONNECTIONS_LIMIT_PER_HOST = int(os.environ.get("HTTP_CONNECTIONS_LIMIT_PER_HOST", 30))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30))  # seconds
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))  # seconds
+EXCHANGE_RATES_CACHE_SIZE = int(os.environ.get("EXCHANGE_RATES_CACHE_SIZE", 1000))  # number of dates kept in memory
+EXCHANGE_RATES_PREFETCH_CONCURRENCY = int(os.environ.get("EXCHANGE_RATES_PREFETCH_CONCURRENCY", 5))
 
 WORKING_DAYS = {}
 HOLIDAYS = standards.load("calendars/workdays_off.json")
 for date_str in HOLIDAYS:
     WORKING_DAYS[date_str] = True
+END_DATE_CACHE_SIZE = int(os.environ.get("END_DATE_CACHE_SIZE", 10000))
 
 CACHE_TTL = os.environ.get("CACHE_TTL", 86400)  # default 24 hours
+# counts of risks list filters are cached until TTL expires or new tenders are assessed
+COUNT_CACHE_TTL = int(os.environ.get("COUNT_CACHE_TTL", 60))  # seconds
+COUNT_CACHE_SIZE = int(os.environ.get("COUNT_CACHE_SIZE", 1000))
+# the last dateAssessed is read at most once per interval, so cached counts outlive frequent assessments
+COUNT_HIGH_WATER_MARK_TTL = int(os.environ.get("COUNT_HIGH_WATER_MARK_TTL", 10))  # seconds
+# time limit of exact count for filters by region and risks only, after that count is estimated
+COUNT_EXACT_MAX_TIME = int(os.environ.get("COUNT_EXACT_MAX_TIME", 1000))  # ms
+RISK_COUNTERS_TTL = int(os.environ.get("RISK_COUNTERS_TTL", 60))  # seconds
 SWAGGER_DOC_PATH = os.environ.get("SWAGGER_DOC_PATH", "swagger")
@@ -1,19 +1,24 @@
-import aiohttp
+import base64
+import json
 import logging
 from configparser import RawConfigParser
 from datetime import datetime
 
 import pytz
 from aiohttp import web
+from bson import ObjectId
+from bson.errors import InvalidId
 from aiohttp.web_exceptions import HTTPBadRequest
 from urllib.parse import quote, urlencode
 from ciso8601 import parse_datetime
 
 from prozorro.risks.requests import get_object_data
-from prozorro.risks.settings import ALLOW_ALL_ORIGINS, TIMEZONE, HTTPS_PROXY, MAX_LIST_LIMIT
+from prozorro.risks.settings import ALLOW_ALL_ORIGINS, TIMEZONE, MAX_LIST_LIMIT
 
 logger = logging.getLogger(__name__)
 
+VALUE_UAH_RANGE_MARGIN = 1e-9
+
 
 def get_now() -> datetime:
     return datetime.now(TIMEZONE)
@@ -71,18 +76,33 @@ def requests_sequence_params(request, *args, separator=None):
     return params
 
 
-async def fetch_tender(tender_id):
+def opt_fields_params(request):
+    """
+    Get top-level fields of tenders requested by `opt_fields` param
+    :return: list of fields (empty if all fields are requested)
+    :raise: HTTPBadRequest for nested fields and operators
+    """
+    fields = [field.strip() for field in request.query.get("opt_fields", "").split(",") if field.strip()]
+    if invalid_fields := [field for field in fields if "." in field or field.startswith("$")]:
+        raise web.HTTPBadRequest(
+            text=f"Invalid opt_fields: {', '.join(invalid_fields)}. Only top-level fields are allowed"
+        )
+    return fields
+
+
+async def fetch_tender(tender_id, context=None):
     """
     Get tender from database if it can be found or fetch from API
-    :param tender_id:
-    :return:
+    :param tender_id: str Id of tender
+    :param context: RiskContext with CDB client
+    :return: dict Tender data
     """
+    from prozorro.risks.context import RiskContext
     from prozorro.risks.db import get_tender
 
     tender = await get_tender(tender_id)
     if not tender:
-        async with aiohttp.ClientSession() as session:
-            tender = await get_object_data(session, tender_id)
+        tender = await get_object_data((context or RiskContext()).cdb_client, tender_id)
     return tender
 
 
@@ -136,6 +156,65 @@ def parse_offset(offset: str):
     return date.isoformat()
 
 
+def encode_cursor(values):
+    """
+    Build opaque pagination cursor from list of JSON serializable values
+    :param values: list of values (e.g. sort field, order, last sort value and last _id)
+    :return: str Cursor token
+    """
+    data = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Parse pagination cursor built by `encode_cursor`
+    :param token: str Cursor token
+    :return: list of values
+    :raises ValueError: if cursor is malformed
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {token}")
+    return values
+
+
+def encode_feed_offset(date_assessed, uid):
+    """
+    Build risks feed offset token of the last tender of page
+    :param date_assessed: str dateAssessed of tender
+    :param uid: str or ObjectId Tender _id, it breaks ties of tenders assessed at the same time
+    :return: str Offset token
+    """
+    return encode_cursor([date_assessed, {"$oid": str(uid)} if isinstance(uid, ObjectId) else uid])
+
+
+def parse_feed_offset(offset):
+    """
+    Parse risks feed offset: (dateAssessed, _id) token built by `encode_feed_offset`
+    or timestamp / ISO formatted date (see `parse_offset`) without _id
+    :param offset: str
+    :return: tuple (dateAssessed, _id or None)
+    :raises ValueError: if offset is malformed
+    """
+    try:
+        values = decode_cursor(offset)
+    except ValueError:
+        return parse_offset(offset), None
+    if len(values) != 2 or not isinstance(values[0], str):
+        raise ValueError(f"Invalid offset: {offset}")
+    date_assessed, uid = values
+    if isinstance(uid, dict):
+        try:
+            uid = ObjectId(uid.get("$oid"))
+        except (InvalidId, TypeError) as e:
+            raise ValueError(f"Invalid offset: {offset}") from e
+    return date_assessed, uid
+
+
 def tender_should_be_checked_for_termination(tender):
     """
     As we reload crawler in past date and check once again all tenders,
@@ -186,21 +265,78 @@ def get_subject_of_procurement(tender_obj):
     return code
 
 
-async def get_exchanged_value(obj, date):
-    if obj.get("value", {}).get("amount") and obj["value"].get("currency") and obj["value"]["currency"] != "UAH":
-        uid = obj.get("id" if "id" in obj else "_id")
-        async with aiohttp.ClientSession() as session:
-            kwargs = {}
-            if HTTPS_PROXY:
-                kwargs.update(proxy=HTTPS_PROXY)
-            rates = await get_object_data(
-                session,
-                uid,
-                resource="NBU",
-                date=datetime.fromisoformat(date).strftime('%Y%m%d'),
-                **kwargs,
-            )
-        for rate in rates:
-            if rate["cc"] == obj["value"]["currency"]:
-                return obj["value"]["amount"] * rate["rate"]
+def value_requires_exchange(obj):
+    value = obj.get("value") or {}
+    return bool(value.get("amount") and value.get("currency") and value["currency"] != "UAH")
+
+
+def get_value_uah_range_filters(value, tolerance):
+    """
+    Build filters of historical tenders, which saved value in UAH can be within tolerance from value
+    (abs(value - valueUAH) <= valueUAH * tolerance). Tenders saved without valueUAH are matched as well,
+    so condition should be checked for found tenders anyway.
+    :param value: float Value amount in UAH
+    :param tolerance: float Relative tolerance (e.g. 0.1 for +-10%)
+    :return: dict Filters
+    """
+    # bounds are a bit wider, so float rounding doesn't exclude tenders with values exactly on bounds
+    return {
+        "$or": [
+            {
+                "valueUAH": {
+                    "$gte": value / (1 + tolerance) * (1 - VALUE_UAH_RANGE_MARGIN),
+                    "$lte": value / (1 - tolerance) * (1 + VALUE_UAH_RANGE_MARGIN),
+                }
+            },
+            {"valueUAH": None},
+        ]
+    }
+
+
+def get_value_uah_rate_date_filters(rate_date_field, saved=True):
+    """
+    Build filters of historical tenders, which value in UAH is saved by exchange rate on date of the field
+    (e.g. tenders of rules, which sum values by rates on dateCreated, may be saved with rate on tenderPeriod.startDate)
+    :param rate_date_field: str Field of tender with date of exchange rate
+    :param saved: bool Whether tenders with saved value in UAH or the rest of them (to be exchanged by rule) are matched
+    :return: dict Filters
+    """
+    same_rate_date = {"$expr": {"$eq": ["$valueUAHRateDate", f"${rate_date_field}"]}}
+    if saved:
+        return {"valueUAH": {"$ne": None}, **same_rate_date}
+    return {"$or": [{"valueUAH": None}, {"$expr": {"$ne": ["$valueUAHRateDate", f"${rate_date_field}"]}}]}
+
+
+async def get_exchanged_value(obj, date, context=None):
+    """
+    Get value amount of object in UAH by NBU exchange rate on provided date.
+    :param obj: dict Object with value (tender, contract)
+    :param date: str Date of exchange rate in ISO format
+    :param context: RiskContext with NBU client
+    :return: float Value amount in UAH
+    """
+    from prozorro.risks.exchange_rates import get_exchange_rate
+
+    if value_requires_exchange(obj):
+        rate = await get_exchange_rate(date, obj["value"]["currency"], context=context)
+        if rate is not None:
+            return obj["value"]["amount"] * rate
     return obj.get("value", {}).get("amount", 0)
+
+
+def value_uah_requires_exchange(obj, date):
+    return value_requires_exchange(obj) and (obj.get("valueUAH") is None or obj.get("valueUAHRateDate") != date)
+
+
+async def get_value_uah(obj, date, context=None):
+    """
+    Get value amount of object in UAH on provided date: `valueUAH` saved at ingestion if it was exchanged
+    by rate on the same date (see `add_values_uah`), otherwise value is exchanged by `get_exchanged_value`
+    :param obj: dict Object with value (tender, contract)
+    :param date: str Date of exchange rate in ISO format
+    :param context: RiskContext with NBU client
+    :return: float Value amount in UAH
+    """
+    if obj.get("valueUAH") is not None and obj.get("valueUAHRateDate") == date:
+        return obj["valueUAH"]
+    return await get_exchanged_value(obj, date, context=context)
@@ -5,6 +5,7 @@ import pytest
 from copy import deepcopy
 from datetime import timedelta
 
+from prozorro.risks.context import RiskContext
 from prozorro.risks.models import RiskNotFound, RiskFound
 from prozorro.risks.rules.sas24_3_11_1 import RiskRule
 from prozorro.risks.rules.sas24_3_11_2 import RiskRule as RiskRule2
@@ -99,6 +100,32 @@ async def test_sas24_unsuccessfuk_open_tender_value_out_of_range_has_risk(db, ap
     assert await RiskRule().process_tender(tender_data) == RiskFound()
 
 
+async def test_sas24_open_tender_value_uah_out_of_range_has_risk(db, api):
+    # value in UAH saved at ingestion is compared by database
+    open_data = deepcopy(open_tender_data)
+    open_data["valueUAH"] = tender_data["value"]["amount"] * 2
+    open_data["valueUAHRateDate"] = open_data["tenderPeriod"]["startDate"]
+    await db.tenders.insert_one(open_data)
+    assert await RiskRule().process_tender(tender_data) == RiskFound()
+
+
+async def test_open_tenders_query_is_not_cached(db, api):
+    # open tenders are filtered by title and value of tender, so their query isn't shared by other tenders
+    await db.tenders.insert_one(deepcopy(open_tender_data))
+    context = RiskContext()
+    for rule_class in (RiskRule, RiskRule2):
+        await rule_class().process_tender(tender_data, context=context)
+    assert not context.historical_cache.stats
+
+
+async def test_sas24_open_tender_value_uah_on_range_bound_no_risk(db, api):
+    open_data = deepcopy(open_tender_data)
+    open_data["valueUAH"] = tender_data["value"]["amount"] / 1.1 + 0.01
+    open_data["valueUAHRateDate"] = open_data["tenderPeriod"]["startDate"]
+    await db.tenders.insert_one(open_data)
+    assert await RiskRule().process_tender(tender_data) == RiskNotFound()
+
+
 async def test_sas24_one_of_two_open_tenders_matches_value_no_risk(db, api):
     # Достатньо однієї відміненої закупівлі з відповідним value, щоб ризик не спрацював.
     open_data_1 = deepcopy(open_tender_data)
@@ -302,7 +329,7 @@ async def test_complaints(db, api):
 # NBU exchange: the two rules become near-opposite for value (mis)matches.
 # ---------------------------------------------------------------------------
 @patch(
-    "prozorro.risks.utils.get_object_data",
+    "prozorro.risks.exchange_rates.get_object_data",
     return_value=[{"cc": "USD", "rate": 39.5151}, {"cc": "EUR", "rate": 42.3641}],
 )
 @pytest.mark.parametrize(
@@ -130,7 +130,7 @@ async def test_tender_value(db, api, amount, category, risk_class, risk_result):
 
 
 @patch(
-    "prozorro.risks.utils.get_object_data",
+    "prozorro.risks.exchange_rates.get_object_data",
     return_value=[{"cc": "USD", "rate": 39.5151}, {"cc": "EUR", "rate": 42.3641}],
 )
 @pytest.mark.parametrize(
@@ -175,3 +175,36 @@ async def test_historical_tenders_has_less_year_amount_for_services(db, api):
     risk_rule = RiskRule()
     result = await risk_rule.process_tender(tender_data)
     assert result == RiskNotFound()  # 200000 from historical tenders + 100000 contract < 400000
+
+
+async def test_historical_tenders_values_uah_are_summed_by_database(db, api):
+    history_tender_1 = deepcopy(history_tender_data)
+    history_tender_1["value"]["amount"] = 100000
+    history_tender_1["valueUAH"] = 250000
+    history_tender_1["valueUAHRateDate"] = history_tender_1["dateCreated"]
+    await db.tenders.insert_one(history_tender_1)
+
+    history_tender_2 = deepcopy(history_tender_data)
+    history_tender_2["_id"] = uuid4().hex
+    history_tender_2["value"]["amount"] = 50000  # saved without valueUAH
+    await db.tenders.insert_one(history_tender_2)
+
+    risk_rule = RiskRule()
+    result = await risk_rule.process_tender(tender_data)
+    assert result == RiskFound()  # 250000 + 50000 from historical tenders + 100000 contract >= 400000
+
+
+@patch(
+    "prozorro.risks.exchange_rates.get_object_data",
+    return_value=[{"cc": "USD", "rate": 39.5151}, {"cc": "EUR", "rate": 42.3641}],
+)
+async def test_historical_tenders_values_uah_exchanged_on_another_date_are_not_summed_by_database(mock_rates, db, api):
+    history_tender = deepcopy(history_tender_data)
+    history_tender["value"] = {"amount": 10000, "currency": "USD"}
+    history_tender["valueUAH"] = 100  # exchanged by rate on tenderPeriod.startDate
+    history_tender["valueUAHRateDate"] = "2023-01-05T10:00:00+02:00"
+    await db.tenders.insert_one(history_tender)
+
+    risk_rule = RiskRule()
+    result = await risk_rule.process_tender(tender_data)
+    assert result == RiskFound()  # 10000 USD by rate on dateCreated + 100000 contract >= 400000
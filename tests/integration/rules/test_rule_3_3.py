@@ -44,7 +44,7 @@ async def test_tender_without_active_awards():
 
 
 @patch(
-    "prozorro.risks.rules.sas_3_3.get_list_of_cpvs",
+    "prozorro.risks.rules.sas_3_3.get_entity_supplier_cpvs",
     return_value={"cpv": ["45310000-3", "45310000-2", "45310000-1", "45310000-5"]},
 )
 async def test_tender_for_4_and_more_cpvs(mock_cpvs):
@@ -55,7 +55,7 @@ async def test_tender_for_4_and_more_cpvs(mock_cpvs):
 
 
 @patch(
-    "prozorro.risks.rules.sas_3_3.get_list_of_cpvs",
+    "prozorro.risks.rules.sas_3_3.get_entity_supplier_cpvs",
     return_value={"cpv": ["45310000-3", "45310000-2", "45310000-1"]},
 )
 @pytest.mark.parametrize(
@@ -78,7 +78,8 @@ async def test_tender_for_3_and_one_more_cpvs_for_tender_with_lots(mock_cpvs, lo
 
 
 @patch(
-    "prozorro.risks.rules.sas_3_3.get_list_of_cpvs", return_value={"cpv": ["45310000-3", "45310000-2", "45310000-1"]}
+    "prozorro.risks.rules.sas_3_3.get_entity_supplier_cpvs",
+    return_value={"cpv": ["45310000-3", "45310000-2", "45310000-1"]},
 )
 async def test_tender_for_3_cpvs_and_no_new_one(mock_cpvs):
     tender_data["awards"][0]["status"] = "active"
@@ -96,7 +97,8 @@ async def test_tender_for_3_cpvs_and_no_new_one(mock_cpvs):
 
 
 @patch(
-    "prozorro.risks.rules.sas_3_3.get_list_of_cpvs", return_value={"cpv": ["45310000-3", "45310000-2", "45310000-1"]}
+    "prozorro.risks.rules.sas_3_3.get_entity_supplier_cpvs",
+    return_value={"cpv": ["45310000-3", "45310000-2", "45310000-1"]},
 )
 async def test_tender_for_3_cpvs_and_new_one_cpv(mock_cpvs):
     tender_data["awards"][0]["status"] = "active"
@@ -113,7 +115,7 @@ async def test_tender_for_3_cpvs_and_new_one_cpv(mock_cpvs):
     assert result_without_lots == RiskFound()
 
 
-@patch("prozorro.risks.rules.sas_3_3.get_list_of_cpvs", return_value={"cpv": ["45310000-3", "45310000-2"]})
+@patch("prozorro.risks.rules.sas_3_3.get_entity_supplier_cpvs", return_value={"cpv": ["45310000-3", "45310000-2"]})
 async def test_tender_for_less_than_3_cpvs(mock_cpvs):
     tender_data["awards"][0]["status"] = "active"
     risk_rule = RiskRule()
@@ -121,7 +123,7 @@ async def test_tender_for_less_than_3_cpvs(mock_cpvs):
     assert result == RiskNotFound()
 
 
-@patch("prozorro.risks.rules.sas_3_3.get_list_of_cpvs", return_value={})
+@patch("prozorro.risks.rules.sas_3_3.get_entity_supplier_cpvs", return_value={})
 async def test_tenders_with_no_matching_identifiers(mock_cpvs):
     tender_data["awards"][0]["status"] = "active"
     risk_rule = RiskRule()
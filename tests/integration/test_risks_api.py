@@ -1,8 +1,19 @@
+import asyncio
+import csv
+import gzip
+import io
+import zipfile
+from json import loads
+
+import pytest
+
 from aiohttp.hdrs import CONTENT_DISPOSITION, CONTENT_TYPE
 from copy import deepcopy
 from ciso8601 import parse_datetime
 from datetime import timedelta
 from bson.objectid import ObjectId
+from prozorro.risks.feed import RISKS_FEED_NOTIFIER
+from prozorro.risks.utils import encode_feed_offset
 from tests.integration.conftest import get_fixture_json
 
 tender = get_fixture_json("risks")
@@ -115,6 +126,55 @@ async def test_list_tenders_sort_by_value_amount(api, db):
     assert resp_json["items"][-1]["value"]["amount"] == tender_with_3_2_risk_found["value"]["amount"]
 
 
+async def test_list_tenders_cursor_pagination(api, db):
+    tenders = []
+    for index, (date_assessed, amount) in enumerate((
+        ("2023-03-14T21:37:16.832566+02:00", 100),
+        ("2023-03-14T21:37:16.832566+02:00", 300),
+        ("2023-03-15T21:37:16.832566+02:00", 200),
+        ("2023-03-16T21:37:16.832566+02:00", None),
+        ("2023-03-17T21:37:16.832566+02:00", 300),
+    )):
+        tender_obj = deepcopy(tender_with_3_1_risk_found)
+        tender_obj["_id"] = f"f59a674045ac4c349a220c8fbaf1840{index}"
+        tender_obj["dateAssessed"] = date_assessed
+        tender_obj["value"]["amount"] = amount
+        tenders.append(tender_obj)
+    await db.risks.insert_many(tenders)
+
+    for query, expected_ids in (
+        ("", [4, 3, 2, 1, 0]),
+        ("&order=asc", [0, 1, 2, 3, 4]),
+        ("&sort=value.amount", [4, 1, 2, 0, 3]),
+        ("&sort=value.amount&order=asc", [3, 0, 2, 1, 4]),
+    ):
+        ids, cursor = [], ""
+        while cursor is not None:
+            response = await api.get(f"/api/risks?limit=2&cursor={cursor}{query}")
+            assert response.status == 200
+            resp_json = await response.json()
+            assert len(resp_json["items"]) <= 2
+            assert "count" not in resp_json
+            ids.extend(item["_id"] for item in resp_json["items"])
+            cursor = resp_json["next_cursor"]
+        assert ids == [tenders[index]["_id"] for index in expected_ids]
+
+    response = await api.get("/api/risks?limit=2&cursor=&with_count=true")
+    assert response.status == 200
+    resp_json = await response.json()
+    assert resp_json["count"] == 5
+    assert "procuringEntityRegion" not in resp_json["items"][0]
+
+    response = await api.get(f"/api/risks?cursor={resp_json['next_cursor']}&order=asc")
+    assert response.status == 400
+
+    response = await api.get("/api/risks?cursor=invalid")
+    assert response.status == 400
+
+    response = await api.get("/api/risks?cursor=&sort=worked_risks")
+    assert response.status == 400
+
+
 async def test_list_tenders_filter_by_risks_worked(api, db):
     await db.risks.insert_many(
         [
@@ -250,6 +310,52 @@ async def test_get_risks(api, db):
     assert response.status == 404
 
 
+async def test_get_risks_fields_and_rule_metadata(api, db):
+    tender_data = deepcopy(tender)
+    tender_data["_id"] = "2e3a8ea3c2ed4a5e9a5f1c3a7a7d3f70"
+    tender_data["has_risks"] = True
+    tender_data["worked_risks"] = ["sas-3-1"]
+    # risk item saved with RISK_RULES_METADATA_REFERENCED
+    tender_data["risks"] = {
+        "sas-3-1": [{"risk_id": "sas-3-1", "indicator": "risk_found", "date": "2023-03-13T14:37:12.491341+02:00"}],
+    }
+    await db.risks.insert_one(tender_data)
+    response = await api.get(f"/api/risks/{tender_data['_id']}")
+    assert response.status == 200
+    risk_item = (await response.json())["risks"]["sas-3-1"][0]
+    assert risk_item["indicator"] == "risk_found"
+    assert risk_item["name"] == "Невиконання замовником рішення органу оскарження"
+    assert risk_item["legitimateness"]
+
+    response = await api.get(
+        f"/api/risks/{tender_data['_id']}",
+        params={"opt_fields": "risks", "risk_metadata": "false"},
+    )
+    assert response.status == 200
+    assert await response.json() == {"_id": tender_data["_id"], "risks": tender_data["risks"]}
+
+    # hidden fields aren't returned
+    response = await api.get(f"/api/risks/{tender_data['_id']}", params={"opt_fields": "worked_risks"})
+    assert await response.json() == {"_id": tender_data["_id"]}
+
+    response = await api.get(f"/api/risks/{tender_data['_id']}", params={"opt_fields": "value.amount"})
+    assert response.status == 400
+    response = await api.get(f"/api/risks/{tender_data['_id']}", params={"risk_metadata": "maybe"})
+    assert response.status == 400
+
+    response = await api.get("/api/risks", params={"opt_fields": "tenderID,risks", "risk_metadata": "false"})
+    assert response.status == 200
+    assert [set(item) for item in (await response.json())["items"]] == [{"_id", "tenderID", "risks"}]
+
+    # value of sort field is needed for cursor, but it isn't returned
+    response = await api.get(
+        "/api/risks",
+        params={"opt_fields": "tenderID", "sort": "procuringEntityRegion", "cursor": "", "limit": 1},
+    )
+    assert response.status == 200
+    assert [set(item) for item in (await response.json())["items"]] == [{"_id", "tenderID"}]
+
+
 async def test_get_tender_risks_report(api, db):
     tender_with_no_risks_found["procuringEntityEDRPOU"] = "22518133"
     await db.risks.insert_many(
@@ -277,6 +383,70 @@ async def test_get_tender_risks_report(api, db):
     ]
 
 
+async def test_get_tender_risks_report_with_gzip_compression(api, db):
+    tender_with_3_1_risk_found["procuringEntityEDRPOU"] = "22518133"
+    tender_with_3_1_risk_found["value"]["amount"] = 1000.5
+    await db.risks.insert_many([tender_with_3_1_risk_found, tender_with_3_2_risk_found])
+    response = await api.get("/api/risks-report?edrpou=22518133&compression=gzip")
+    assert response.status == 200
+    assert response.headers[CONTENT_DISPOSITION] == 'attachment; filename="Tender_risks_report.csv.gz"'
+    assert response.headers[CONTENT_TYPE] == "application/gzip"
+    csv_rows = list(csv.reader(io.StringIO(gzip.decompress(await response.read()).decode("utf-8"))))
+    assert csv_rows[0][:2] == ["_id", "tenderID"]
+    assert csv_rows[1][6:] == [
+        tender_with_3_1_risk_found["procuringEntity"]["name"],
+        "1000.5",
+        tender_with_3_1_risk_found["value"]["currency"],
+        "['sas-3-1']",
+    ]
+    assert len(csv_rows) == 2
+
+    response = await api.get("/api/risks-report?compression=zip")
+    assert response.status == 400
+
+
+async def test_get_tender_risks_report_in_xlsx_format(api, db):
+    tender_with_3_1_risk_found["procuringEntityEDRPOU"] = "22518133"
+    tender_with_3_1_risk_found["value"]["amount"] = 1000.5
+    await db.risks.insert_many([tender_with_3_1_risk_found, tender_with_3_2_risk_found])
+    response = await api.get("/api/risks-report?edrpou=22518133&format=xlsx")
+    assert response.status == 200
+    assert response.headers[CONTENT_DISPOSITION] == 'attachment; filename="Tender_risks_report.xlsx"'
+    assert response.headers[CONTENT_TYPE] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    with zipfile.ZipFile(io.BytesIO(await response.read())) as workbook:
+        assert "xl/workbook.xml" in workbook.namelist()
+        sheet = workbook.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert sheet.count("<row>") == 2
+    assert '<c t="inlineStr"><is><t xml:space="preserve">tenderID</t></is></c>' in sheet
+    assert "<c><v>1000.5</v></c>" in sheet
+    assert '<t xml:space="preserve">sas-3-1</t>' in sheet
+
+    response = await api.get("/api/risks-report?format=xlsx&compression=gzip")
+    assert response.status == 400
+    response = await api.get("/api/risks-report?format=pdf")
+    assert response.status == 400
+
+
+async def test_get_tender_risks_report_in_columnar_formats(api, db):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    tender_with_3_1_risk_found["procuringEntityEDRPOU"] = "22518133"
+    tender_with_3_1_risk_found["value"]["amount"] = 1000.5
+    await db.risks.insert_many([tender_with_3_1_risk_found, tender_with_3_2_risk_found])
+
+    response = await api.get("/api/risks-report?edrpou=22518133&format=parquet")
+    assert response.status == 200
+    assert response.headers[CONTENT_DISPOSITION] == 'attachment; filename="Tender_risks_report.parquet"'
+    table = pq.read_table(io.BytesIO(await response.read()))
+    assert table.column("valueAmount").to_pylist() == [1000.5]
+    assert table.column("worked_risks").to_pylist() == [["sas-3-1"]]
+
+    response = await api.get("/api/risks-report?edrpou=22518133&format=arrow")
+    assert response.status == 200
+    table = pa.ipc.open_stream(await response.read()).read_all()
+    assert table.column("tenderID").to_pylist() == [tender_with_3_1_risk_found["tenderID"]]
+
+
 async def test_list_tenders_filter_by_owner(api, db):
     tender_with_bank_risk_found = deepcopy(tender)
     tender_with_bank_risk_found["risks"] = {
@@ -376,3 +546,83 @@ async def test_feed_tenders(api, db):
     assert resp.status == 200
     resp_json = await resp.json()
     assert len(resp_json['data']) == 0
+
+
+async def test_feed_tenders_assessed_at_the_same_time(api, db):
+    tenders = []
+    for i in range(5):
+        same_time_tender = deepcopy(tender_with_no_risks_found)
+        same_time_tender["_id"] = f"f59a674045ac4c349a220c8fbaf1850{i}"
+        same_time_tender["dateAssessed"] = "2023-03-14T10:30:00+02:00" if i else "2023-03-13T10:30:00+02:00"
+        tenders.append(same_time_tender)
+    await db.risks.insert_many(tenders[::-1])
+
+    received = []
+    params = {"limit": 2}
+    for _ in range(5):
+        resp = await api.get("/api/risks-feed", params=params)
+        assert resp.status == 200
+        resp_json = await resp.json()
+        if not resp_json["data"]:
+            break
+        received.extend(item["_id"] for item in resp_json["data"])
+        params["offset"] = resp_json["next_page"]["offset"]
+    assert received == [item["_id"] for item in tenders]
+
+    resp = await api.get("/api/risks-feed", params={"offset": params["offset"], "descending": 1, "limit": 10})
+    resp_json = await resp.json()
+    assert [item["_id"] for item in resp_json["data"]] == [item["_id"] for item in tenders[-2::-1]]
+
+    # offset by date skips all tenders assessed at that time
+    resp = await api.get("/api/risks-feed", params={"offset": "2023-03-13T10:30:00+02:00"})
+    assert len((await resp.json())["data"]) == 4
+    resp = await api.get("/api/risks-feed", params={"offset": "2023-03-14T10:30:00+02:00"})
+    assert (await resp.json())["data"] == []
+    await db.risks.delete_many({})
+
+
+async def test_feed_tenders_long_polling_and_stream(api, db, monkeypatch):
+    monkeypatch.setattr(RISKS_FEED_NOTIFIER, "use_change_stream", False)
+    monkeypatch.setattr(RISKS_FEED_NOTIFIER, "poll_interval", 0.01)
+    first_tender = deepcopy(tender_with_3_1_risk_found)
+    first_tender["_id"] = "f59a674045ac4c349a220c8fbaf18600"
+    first_tender["dateAssessed"] = "2023-03-14T10:30:00+02:00"
+    await db.risks.insert_one(first_tender)
+
+    async def assess_tender(uid, date_assessed):
+        await asyncio.sleep(0.05)
+        new_tender = deepcopy(first_tender)
+        new_tender["_id"] = uid
+        new_tender["dateAssessed"] = date_assessed
+        await db.risks.insert_one(new_tender)
+
+    # response is returned when new tender is assessed
+    task = asyncio.create_task(assess_tender("f59a674045ac4c349a220c8fbaf18601", "2023-03-15T10:30:00+02:00"))
+    resp = await api.get("/api/risks-feed", params={"offset": first_tender["dateAssessed"], "wait": 10})
+    assert resp.status == 200
+    resp_json = await resp.json()
+    assert [item["_id"] for item in resp_json["data"]] == ["f59a674045ac4c349a220c8fbaf18601"]
+    await task
+
+    resp = await api.get("/api/risks-feed", params={"offset": "2023-03-16T10:30:00+02:00", "wait": 0})
+    assert resp.status == 200
+    assert (await resp.json())["data"] == []
+    resp = await api.get("/api/risks-feed?wait=soon")
+    assert resp.status == 400
+
+    resp = await api.get("/api/risks-feed/stream", headers={"Last-Event-ID": first_tender["dateAssessed"]})
+    assert resp.status == 200
+    assert resp.headers[CONTENT_TYPE] == "text/event-stream"
+    event_id = encode_feed_offset("2023-03-15T10:30:00+02:00", "f59a674045ac4c349a220c8fbaf18601")
+    assert await resp.content.readline() == f"id: {event_id}\n".encode()
+    assert loads((await resp.content.readline())[len(b"data: "):])["data"][0]["dateAssessed"] == (
+        "2023-03-15T10:30:00+02:00"
+    )
+    assert await resp.content.readline() == b"\n"
+
+    task = asyncio.create_task(assess_tender("f59a674045ac4c349a220c8fbaf18602", "2023-03-16T10:30:00+02:00"))
+    event_id = encode_feed_offset("2023-03-16T10:30:00+02:00", "f59a674045ac4c349a220c8fbaf18602")
+    assert await resp.content.readline() == f"id: {event_id}\n".encode()
+    resp.close()
+    await task
+    await db.risks.delete_many({})
@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock, patch
+
+from prozorro.risks.clients import (
+    CDB_CLIENT,
+    NBU_CLIENT,
+    cleanup_http_clients,
+    get_http_client,
+    init_http_clients,
+)
+from prozorro.risks.context import RiskContext
+from prozorro.risks.exchange_rates import EXCHANGE_RATES
+from prozorro.risks.utils import fetch_tender, get_exchanged_value
+
+
+async def test_http_clients_are_shared():
+    clients = await init_http_clients()
+    cdb_client = get_http_client(CDB_CLIENT)
+    assert cdb_client is clients[CDB_CLIENT]
+    assert get_http_client(CDB_CLIENT) is cdb_client
+    assert get_http_client(NBU_CLIENT) is not cdb_client
+    assert RiskContext().cdb_client is cdb_client
+
+    await cleanup_http_clients()
+    assert cdb_client.closed
+    new_client = get_http_client(CDB_CLIENT)
+    assert new_client is not cdb_client
+    await cleanup_http_clients()
+
+
+@patch("prozorro.risks.utils.get_object_data", return_value={"id": "1", "status": "active"})
+async def test_fetch_tender_uses_context_client(mock_get_object_data, db, api):
+    context = RiskContext(cdb_client=MagicMock(), nbu_client=MagicMock())
+    assert await fetch_tender("1", context=context) == {"id": "1", "status": "active"}
+    assert mock_get_object_data.call_args.args == (context.cdb_client, "1")
+
+
+@patch("prozorro.risks.exchange_rates.get_object_data", return_value=[{"cc": "USD", "rate": 40}])
+async def test_exchanged_value_uses_context_client(mock_rates, db, api):
+    EXCHANGE_RATES.clear()
+    context = RiskContext(cdb_client=MagicMock(), nbu_client=MagicMock())
+    obj = {"value": {"amount": 100, "currency": "USD"}}
+    assert await get_exchanged_value(obj, "2023-01-09T10:00:00+02:00", context=context) == 4000
+    assert mock_rates.call_args.args == (context.nbu_client, "20230109")
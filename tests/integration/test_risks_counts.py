@@ -0,0 +1,135 @@
+import re
+from copy import deepcopy
+from unittest.mock import patch
+
+from pymongo.errors import ExecutionTimeout
+
+from prozorro.risks.commands.rebuild_risk_stats import rebuild_risk_stats
+from prozorro.risks.counts import CountCache, RiskCounters, canonicalize_filters
+from prozorro.risks.db import build_tender_filters
+from prozorro.risks.settings import COUNT_EXACT_MAX_TIME
+from tests.integration.conftest import get_fixture_json
+
+tender = get_fixture_json("risks")
+
+
+def build_tender(uid, region, worked_risks, date_assessed="2023-03-13T14:37:12.491341+02:00"):
+    tender_obj = deepcopy(tender)
+    tender_obj.update(
+        _id=uid,
+        procuringEntityRegion=region,
+        worked_risks=worked_risks,
+        has_risks=bool(worked_risks),
+        dateAssessed=date_assessed,
+    )
+    return tender_obj
+
+
+def test_canonicalize_filters():
+    assert canonicalize_filters(
+        build_tender_filters(region=["Київ", "Одеська область"], risks=["sas-3-1", "sas-3-2"])
+    ) == canonicalize_filters(
+        build_tender_filters(risks=["sas-3-2", "sas-3-1"], region=["Одеська область", "Київ"])
+    )
+    assert canonicalize_filters({"worked_risks": {"$in": [re.compile("^sas")]}}) != canonicalize_filters(
+        {"worked_risks": {"$in": [re.compile("^sas24")]}}
+    )
+
+
+async def test_count_cache_is_invalidated_by_date_assessed(db):
+    await db.risks.insert_many([
+        build_tender("f59a674045ac4c349a220c8fbaf18400", "Київ", ["sas-3-1"]),
+        build_tender("f59a674045ac4c349a220c8fbaf18401", "Київ", ["sas-3-2"]),
+    ])
+    cache = CountCache(high_water_mark_ttl=0)
+    filters = build_tender_filters(region=["Київ"])
+    assert await cache.count(db.risks, filters) == (2, False)
+
+    # count isn't recalculated while there are no new assessed tenders
+    await db.risks.delete_one({"_id": "f59a674045ac4c349a220c8fbaf18401"})
+    assert await cache.count(db.risks, filters) == (2, False)
+
+    await db.risks.insert_many([
+        build_tender("f59a674045ac4c349a220c8fbaf18402", "Київ", ["sas-3-1"], "2023-03-14T14:37:12.491341+02:00"),
+        build_tender("f59a674045ac4c349a220c8fbaf18407", "Київ", ["sas-3-1"], "2023-03-14T14:37:12.491341+02:00"),
+    ])
+    assert await cache.count(db.risks, filters) == (3, False)
+    await db.risks.delete_many({})
+
+
+async def test_count_cache_reads_high_water_mark_once_per_interval(db):
+    await db.risks.insert_many([
+        build_tender("f59a674045ac4c349a220c8fbaf18408", "Київ", ["sas-3-1"]),
+        build_tender("f59a674045ac4c349a220c8fbaf18409", "Київ", ["sas-3-2"]),
+    ])
+    cache = CountCache(high_water_mark_ttl=60)
+    filters = build_tender_filters(region=["Київ"])
+    find_one = type(db.risks).find_one
+    calls = []
+
+    async def counted_find_one(self, *args, **kwargs):
+        calls.append(args)
+        return await find_one(self, *args, **kwargs)
+
+    with patch.object(type(db.risks), "find_one", counted_find_one):
+        assert await cache.count(db.risks, filters) == (2, False)
+        # tenders assessed within interval don't invalidate cached counts
+        await db.risks.insert_one(
+            build_tender("f59a674045ac4c349a220c8fbaf1840a", "Київ", ["sas-3-1"], "2023-03-14T14:37:12.491341+02:00")
+        )
+        assert await cache.count(db.risks, filters) == (2, False)
+        assert await cache.count(db.risks, build_tender_filters(region=["Київ"], risks=["sas-3-1"])) == (2, False)
+    assert len(calls) == 1
+
+    cache.clear()
+    assert await cache.count(db.risks, filters) == (3, False)
+    await db.risks.delete_many({})
+
+
+async def test_count_is_estimated_by_risk_counters(db):
+    await db.risks.insert_many([
+        build_tender("f59a674045ac4c349a220c8fbaf18403", "Київ", ["sas-3-1", "sas-3-2"]),
+        build_tender("f59a674045ac4c349a220c8fbaf18404", "Київ", ["sas-3-2"]),
+        build_tender("f59a674045ac4c349a220c8fbaf18405", "Одеська область", ["sas-3-1"]),
+        build_tender("f59a674045ac4c349a220c8fbaf18406", "Одеська область", []),
+    ])
+    await rebuild_risk_stats()
+    counters = RiskCounters()
+    await counters.refresh()
+    cache = CountCache(counters=counters)
+    with patch.object(type(db.risks), "count_documents", side_effect=ExecutionTimeout("operation exceeded time limit")):
+        assert await cache.count(db.risks, build_tender_filters()) == (3, True)
+        assert await cache.count(db.risks, build_tender_filters(region=["Київ"])) == (2, True)
+        assert await cache.count(db.risks, build_tender_filters(risks=["sas-3-1"])) == (2, True)
+        # tender with both risks is counted twice
+        assert await cache.count(db.risks, build_tender_filters(risks=["sas-3-1", "sas-3-2"])) == (4, True)
+        assert await cache.count(db.risks, build_tender_filters(risks=["sas-3-1", "sas-3-2"], risks_all="true")) == (
+            2, True
+        )
+        assert await cache.count(db.risks, build_tender_filters(owner=["sas"], region=["Одеська область"])) == (
+            1, True
+        )
+    await db.risks.delete_many({})
+    await db.risk_stats.delete_many({})
+
+
+async def test_count_is_exact_until_risk_counters_are_loaded(db):
+    await db.risks.insert_many([
+        build_tender("f59a674045ac4c349a220c8fbaf18408", "Київ", ["sas-3-1"]),
+        build_tender("f59a674045ac4c349a220c8fbaf18409", "Київ", ["sas-3-2"]),
+    ])
+    count_documents = type(db.risks).count_documents
+    timeout = ExecutionTimeout("operation exceeded time limit")
+
+    async def count_with_short_time_limit_exceeded(self, filters, maxTimeMS=None, **kwargs):
+        if maxTimeMS == COUNT_EXACT_MAX_TIME:
+            raise timeout
+        return await count_documents(self, filters, **kwargs)
+
+    cache = CountCache(counters=RiskCounters())
+    with (
+        patch.object(RiskCounters, "schedule_refresh"),
+        patch.object(type(db.risks), "count_documents", count_with_short_time_limit_exceeded),
+    ):
+        assert await cache.count(db.risks, build_tender_filters(region=["Київ"])) == (2, False)
+    await db.risks.delete_many({})
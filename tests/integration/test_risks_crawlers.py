@@ -1,7 +1,17 @@
-from unittest.mock import patch
+import asyncio
+from copy import deepcopy
+from unittest.mock import AsyncMock, patch
 
-from prozorro.risks.crawlers.contracts_crawler import process_contract
-from prozorro.risks.crawlers.tenders_crawler import process_tender
+import pytest
+
+from prozorro.risks.clients import init_http_clients
+from prozorro.risks.crawlers.base import run_crawler
+from prozorro.risks.crawlers.contracts_crawler import process_contract, process_contracts_batch
+from prozorro.risks.crawlers.tenders_crawler import HISTORICAL_PROJECTION, process_tender, process_tenders_batch
+from prozorro.risks.db import save_tender
+from prozorro.risks.historical_data import get_historical_tender
+
+from tests.integration.conftest import get_fixture_json
 
 
 @patch("prozorro.risks.crawlers.contracts_crawler.fetch_tender")
@@ -146,3 +156,136 @@ async def test_process_simultaneously_contracts_and_tenders(
     assert len(result["contracts"]) == 2
     assert result["contracts"]["e427359ed3614fef9a63f2e91fdafc6d"] == "terminated"
     assert result["contracts"]["1227359ed3614fef9a63f2e91fdafc6d"] == "cancelled"
+
+
+@patch("prozorro.risks.crawlers.tenders_crawler.get_object_data")
+@patch("prozorro.risks.crawlers.tenders_crawler.process_risks")
+async def test_process_tenders_batch(mock_process_risks, mock_get_object_data, db, api):
+    tenders = {
+        uid: {
+            "id": uid,
+            "status": "active.qualification",
+            "procurementMethodType": "aboveThresholdEU",
+            "dateCreated": "2024-05-08T19:52:31.887284+03:00",
+            "dateModified": "2024-05-08T19:52:31.887284+03:00",
+            "procuringEntity": {"identifier": {"scheme": "UA-EDR", "id": "39604270"}},
+            "items": [{"classification": {"id": "45310000-3"}}],
+        }
+        for uid in ("94d7d8f4aaf647c8bbe99ce71f8ebe01", "94d7d8f4aaf647c8bbe99ce71f8ebe02")
+    }
+    await db.risks.insert_one({
+        "_id": "94d7d8f4aaf647c8bbe99ce71f8ebe01",
+        "dateAssessed": "2024-05-01T19:52:31.887284+03:00",
+        "risks": {
+            "sas24-3-1": [
+                {
+                    "indicator": "risk_found",
+                    "date": "2024-05-01T19:52:31.887284+03:00",
+                    "history": [{"date": "2024-05-01T19:52:31.887284+03:00", "indicator": "risk_found"}],
+                }
+            ],
+        },
+        "worked_risks": ["sas24-3-1"],
+    })
+    mock_get_object_data.side_effect = lambda session, uid: tenders[uid]
+    mock_process_risks.side_effect = lambda tender, rules, **kwargs: {
+        "sas24-3-1": [{"indicator": "risk_not_found", "date": "2024-05-09T19:52:31.887284+03:00"}],
+    }
+
+    await process_tenders_batch(None, [{"id": uid} for uid in tenders])
+    result = await db.risks.find_one({"_id": "94d7d8f4aaf647c8bbe99ce71f8ebe01"})
+    assert result["worked_risks"] == []
+    assert result["has_risks"] is False
+    assert len(result["risks"]["sas24-3-1"][0]["history"]) == 2
+    result = await db.risks.find_one({"_id": "94d7d8f4aaf647c8bbe99ce71f8ebe02"})
+    assert len(result["risks"]["sas24-3-1"][0]["history"]) == 1
+    assert await db.tenders.count_documents({"procuringEntityIdentifier": "UA-EDR-39604270"}) == 2
+    # only fields registered by rules are saved to tenders collection
+    saved_tender = await db.tenders.find_one({"_id": "94d7d8f4aaf647c8bbe99ce71f8ebe01"})
+    assert "items" not in saved_tender
+    assert saved_tender["subjectOfProcurement"]
+    assert saved_tender["dateCreated"] == "2024-05-08T19:52:31.887284+03:00"
+
+
+@patch("prozorro.risks.crawlers.contracts_crawler.get_object_data")
+@patch("prozorro.risks.crawlers.contracts_crawler.fetch_tender")
+@patch("prozorro.risks.crawlers.contracts_crawler.process_risks", return_value={})
+async def test_process_contracts_batch_of_one_tender(
+    mock_process_risks, mock_fetch_tender, mock_get_object_data, db, api
+):
+    contracts = {
+        "e427359ed3614fef9a63f2e91fdafc01": {
+            "id": "e427359ed3614fef9a63f2e91fdafc01",
+            "tender_id": "94d7d8f4aaf647c8bbe99ce71f8ebe03",
+            "status": "terminated",
+        },
+        "e427359ed3614fef9a63f2e91fdafc02": {
+            "id": "e427359ed3614fef9a63f2e91fdafc02",
+            "tender_id": "94d7d8f4aaf647c8bbe99ce71f8ebe03",
+            "status": "active",
+        },
+    }
+    mock_get_object_data.side_effect = lambda session, uid, resource: contracts[uid]
+    mock_fetch_tender.return_value = {
+        "_id": "94d7d8f4aaf647c8bbe99ce71f8ebe03",
+        "status": "complete",
+        "procurementMethodType": "aboveThresholdEU",
+        "dateCreated": "2024-05-08T19:52:31.887284+03:00",
+    }
+    # both contracts of the same tender should be saved, the second one is applied after the bulk write
+    await process_contracts_batch(None, [{"id": uid} for uid in contracts])
+    result = await db.risks.find_one({"_id": "94d7d8f4aaf647c8bbe99ce71f8ebe03"})
+    assert result["contracts"] == {
+        "e427359ed3614fef9a63f2e91fdafc01": "terminated",
+        "e427359ed3614fef9a63f2e91fdafc02": "active",
+    }
+    assert result["terminated"] is False
+
+
+async def test_process_contract_with_projected_parent_tender(db, api):
+    contract = get_fixture_json("contract")
+    contract.update({
+        "status": "active",
+        "date": "2024-01-01T16:39:01.640632+02:00",
+        "period": {"startDate": "2024-01-01T16:39:01.640632+02:00", "endDate": "2024-01-10T16:39:01.640632+02:00"},
+    })
+    tender = get_fixture_json("base_tender")
+    tender.update({
+        "id": contract["tender_id"],
+        "status": "active.awarded",
+        "procurementMethodType": "aboveThresholdUA",
+        "mainProcurementCategory": "works",
+        "value": {"amount": 1600000, "currency": "UAH"},
+        "contracts": [deepcopy(contract)],
+    })
+    # parent tender is read from tenders collection with fields saved by tenders crawler only
+    await save_tender(get_historical_tender(tender, HISTORICAL_PROJECTION))
+    saved_tender = await db.tenders.find_one({"_id": contract["tender_id"]})
+    assert saved_tender["contracts"] == [{"id": contract["id"], "date": contract["date"], "status": "active"}]
+
+    await process_contract(contract)
+    result = await db.risks.find_one({"_id": contract["tender_id"]})
+    assert result["risks"]["sas24-3-7"][0]["indicator"] == "risk_found"
+
+
+def test_http_clients_are_closed_after_crawler_is_stopped():
+    clients = []
+
+    def crawler_main(data_handler, init_task=None):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        clients.extend(loop.run_until_complete(init_http_clients()).values())
+        raise KeyboardInterrupt
+
+    try:
+        with (
+            patch("prozorro.risks.crawlers.base.main", crawler_main),
+            patch("prozorro.risks.crawlers.base.cleanup_db_client", AsyncMock()) as cleanup_db_client,
+            pytest.raises(KeyboardInterrupt),
+        ):
+            run_crawler(AsyncMock())
+    finally:
+        asyncio.get_event_loop().close()
+        asyncio.set_event_loop(None)
+    assert clients and all(client.closed for client in clients)
+    cleanup_db_client.assert_awaited_once()
@@ -1,6 +1,12 @@
+from contextlib import aclosing
 from copy import deepcopy
+from unittest.mock import AsyncMock, patch
 
-from prozorro.risks.db import update_tender_risks
+import pytest
+from pymongo.errors import PyMongoError
+
+from prozorro.risks.commands.compact_risk_history import compact_batch, compact_risk_histories
+from prozorro.risks.db import bulk_update_tender_risks, iter_tenders_from_historical_data, update_tender_risks
 from tests.integration.conftest import get_fixture_json
 
 tender = get_fixture_json("risks")
@@ -46,7 +52,8 @@ async def test_update_tender_risks_with_already_existed_one(db):
     assert result["worked_risks"] == ["sas-3-1"]
     assert len(result["risks"].keys()) == 3
     assert result["risks"]["sas-3-1"][0]["date"] == "2023-03-21T14:37:12.491341+02:00"
-    assert len(result["risks"]["sas-3-1"][0]["history"]) == 2
+    # indicator hasn't been changed, so history isn't extended
+    assert len(result["risks"]["sas-3-1"][0]["history"]) == 1
     assert len(result["risks"]["sas-3-2-1"][0]["history"]) == 1
     assert len(result["risks"]["sas-3-2"][0]["history"]) == 1
     assert result["has_risks"]
@@ -203,3 +210,153 @@ async def test_update_tender_with_additional_contracts_meta_info(db):
     assert len(result["risks"]["sas-3-4"][-1]["history"]) == 1
     assert len(result["risks"]["sas-3-2"][0]["history"]) == 1
     assert result["has_risks"]
+
+
+async def test_bulk_update_tender_risks(db):
+    tender_obj = deepcopy(tender_with_3_1_risk_found)
+    tender_obj["_id"] = "f59a674045ac4c349a220c8fbaf18401"
+    tender_obj["dateAssessed"] = "2023-03-13T14:37:12.491341+02:00"
+    await db.risks.insert_one(tender_obj)
+    risks = {
+        "sas-3-1": [
+            {
+                "indicator": "risk_not_found",
+                "date": "2023-03-21T14:37:12.491341+02:00",
+            }
+        ],
+    }
+    new_risks = {
+        "sas-3-2": [
+            {
+                "indicator": "risk_found",
+                "date": "2023-03-21T14:37:12.491341+02:00",
+            }
+        ],
+    }
+    await bulk_update_tender_risks([
+        (tender_obj["_id"], risks, {"dateAssessed": "2023-03-21T14:37:12.491341+02:00"}, None),
+        ("f59a674045ac4c349a220c8fbaf18402", new_risks, {"dateAssessed": "2023-03-21T14:37:12.491341+02:00"}, None),
+        # repeated update of the same tender in one batch
+        (tender_obj["_id"], new_risks, {"dateAssessed": "2023-03-22T14:37:12.491341+02:00"}, None),
+    ])
+    result = await db.risks.find_one(tender_obj["_id"])
+    assert result["worked_risks"] == ["sas-3-2"]
+    assert len(result["risks"]["sas-3-1"][0]["history"]) == 2
+    assert result["dateAssessed"] == "2023-03-22T14:37:12.491341+02:00"
+    result = await db.risks.find_one("f59a674045ac4c349a220c8fbaf18402")
+    assert result["worked_risks"] == ["sas-3-2"]
+    assert result["has_risks"]
+
+
+@patch("prozorro.risks.db.asyncio.sleep")
+@patch("prozorro.risks.db.MONGODB_UPDATE_RETRIES", 2)
+async def test_update_tender_risks_retries_are_bounded(mock_sleep, db):
+    collection = AsyncMock()
+    collection.find_one_and_update.side_effect = PyMongoError("Connection refused")
+    with patch("prozorro.risks.db.get_risks_collection", return_value=collection):
+        with pytest.raises(PyMongoError):
+            await update_tender_risks(
+                "f59a674045ac4c349a220c8fbaf18403", {}, {"dateAssessed": "2023-03-21T14:37:12.491341+02:00"}
+            )
+    assert collection.find_one_and_update.call_count == 3
+    assert mock_sleep.call_count == 2
+
+
+@patch("prozorro.risks.db.RISK_HISTORY_COLLECTION_ENABLED", True)
+@patch("prozorro.risks.db.RISK_HISTORY_MAX_DEPTH", 2)
+async def test_update_tender_risks_compacts_history(db):
+    uid = "f59a674045ac4c349a220c8fbaf18404"
+    for date, indicator in (
+        ("2023-03-21T14:37:12.491341+02:00", "risk_found"),
+        ("2023-03-22T14:37:12.491341+02:00", "risk_found"),
+        ("2023-03-23T14:37:12.491341+02:00", "risk_not_found"),
+        ("2023-03-24T14:37:12.491341+02:00", "risk_found"),
+    ):
+        await update_tender_risks(uid, {"sas-3-1": [{"indicator": indicator, "date": date}]}, {"dateAssessed": date})
+    result = await db.risks.find_one(uid)
+    assert result["risks"]["sas-3-1"][0]["date"] == "2023-03-24T14:37:12.491341+02:00"
+    assert result["risks"]["sas-3-1"][0]["history"] == [
+        {"date": "2023-03-23T14:37:12.491341+02:00", "indicator": "risk_not_found"},
+        {"date": "2023-03-24T14:37:12.491341+02:00", "indicator": "risk_found"},
+    ]
+    assert await db.risk_history.count_documents({"tender_id": uid, "risk_id": "sas-3-1", "item_id": "tender"}) == 4
+
+
+async def test_compact_risk_history_command(db):
+    tender_obj = deepcopy(tender_with_3_1_risk_found)
+    tender_obj["_id"] = "f59a674045ac4c349a220c8fbaf18405"
+    tender_obj["risks"]["sas-3-1"][0]["history"] = [
+        {"date": "2023-03-13T14:37:12.491341+02:00", "indicator": "risk_found"},
+        {"date": "2023-03-14T14:37:12.491341+02:00", "indicator": "risk_found"},
+        {"date": "2023-03-15T14:37:12.491341+02:00", "indicator": "risk_not_found"},
+    ]
+    await db.risks.insert_one(tender_obj)
+    await compact_risk_histories(batch_size=1, save_history=True)
+    result = await db.risks.find_one(tender_obj["_id"])
+    assert [log["date"] for log in result["risks"]["sas-3-1"][0]["history"]] == [
+        "2023-03-13T14:37:12.491341+02:00",
+        "2023-03-15T14:37:12.491341+02:00",
+    ]
+    assert len(result["risks"]["sas-3-2-1"][0]["history"]) == 1
+    assert await db.risk_history.count_documents({"tender_id": tender_obj["_id"]}) == 4
+
+
+async def test_compact_risk_history_command_saves_history_of_modified_documents(db):
+    tender_obj = deepcopy(tender_with_3_1_risk_found)
+    tender_obj["_id"] = "f59a674045ac4c349a220c8fbaf18407"
+    tender_obj["risks"]["sas-3-1"][0]["history"] = [
+        {"date": "2023-03-13T14:37:12.491341+02:00", "indicator": "risk_found"},
+        {"date": "2023-03-14T14:37:12.491341+02:00", "indicator": "risk_found"},
+    ]
+    await db.risks.insert_one(tender_obj)
+
+    # document was assessed by crawler after it had been read, so it's skipped without history
+    stale_tender = {**tender_obj, "dateAssessed": "2023-03-12T14:37:12.491341+02:00"}
+    assert await compact_batch([stale_tender], save_history=True) == 0
+    assert await db.risk_history.count_documents({"tender_id": tender_obj["_id"]}) == 0
+
+    await compact_risk_histories(batch_size=10, save_history=True)
+    assert await db.risk_history.count_documents({"tender_id": tender_obj["_id"]}) == 3
+    # nothing is compacted on rerun, so history isn't duplicated
+    await compact_risk_histories(batch_size=10, save_history=True)
+    assert await db.risk_history.count_documents({"tender_id": tender_obj["_id"]}) == 3
+    await db.risks.delete_one({"_id": tender_obj["_id"]})
+
+
+async def test_compact_risk_history_command_strips_rule_metadata(db):
+    tender_obj = deepcopy(tender_with_3_1_risk_found)
+    tender_obj["_id"] = "f59a674045ac4c349a220c8fbaf18406"
+    tender_obj["risks"]["sas-3-1"][0].update(name="Name", description="Description", legitimateness="Legitimateness")
+    await db.risks.insert_one(tender_obj)
+    await compact_risk_histories(batch_size=10, strip_metadata=True)
+    result = await db.risks.find_one(tender_obj["_id"])
+    assert result["risks"]["sas-3-1"] == tender_with_3_1_risk_found["risks"]["sas-3-1"]
+    await db.risks.delete_one({"_id": tender_obj["_id"]})
+
+
+async def test_iter_tenders_from_historical_data(db):
+    await db.tenders.insert_many([
+        {"_id": f"historical-{index}", "procuringEntityIdentifier": "UA-EDR-00000001", "title": "T", "index": index}
+        for index in range(5)
+    ])
+    filters = {"procuringEntityIdentifier": "UA-EDR-00000001"}
+    with pytest.raises(ValueError):
+        async for _ in iter_tenders_from_historical_data(filters, projection={}):
+            pass
+
+    tenders = [
+        tender
+        async for batch in iter_tenders_from_historical_data(filters, projection={"index": True}, batch_size=2)
+        for tender in batch
+    ]
+    assert sorted(tender["index"] for tender in tenders) == [0, 1, 2, 3, 4]
+    assert all(set(tender) == {"_id", "index"} for tender in tenders)
+
+    batches = [batch async for batch in iter_tenders_from_historical_data(filters, {"index": True}, limit=3)]
+    assert sum(len(batch) for batch in batches) == 3
+
+    # iteration is stopped after the first batch and cursor is closed
+    async with aclosing(iter_tenders_from_historical_data(filters, {"index": True}, batch_size=2)) as batches:
+        async for batch in batches:
+            break
+    await db.tenders.delete_many(filters)
@@ -0,0 +1,83 @@
+import asyncio
+from unittest.mock import patch
+
+from prozorro.risks.exchange_rates import EXCHANGE_RATES, add_values_uah, prefetch_exchange_rates_range
+from prozorro.risks.utils import get_exchanged_value, get_value_uah
+
+NBU_RATES = [{"cc": "USD", "rate": 39.5151}, {"cc": "EUR", "rate": 42.3641}]
+
+
+@patch("prozorro.risks.exchange_rates.get_object_data", return_value=NBU_RATES)
+async def test_exchanged_value_requests_nbu_once_per_date(mock_rates, db, api):
+    EXCHANGE_RATES.clear()
+    obj = {"id": "1", "value": {"amount": 100, "currency": "USD"}}
+    results = await asyncio.gather(
+        *(get_exchanged_value(obj, "2023-01-02T10:00:00+02:00") for _ in range(5))
+    )
+    assert results == [100 * 39.5151] * 5
+    assert mock_rates.call_count == 1
+
+    obj["value"]["currency"] = "EUR"
+    assert await get_exchanged_value(obj, "2023-01-02T18:00:00+02:00") == 100 * 42.3641
+    assert mock_rates.call_count == 1
+
+    stored = await db.exchange_rates.find_one({"_id": "20230102"})
+    assert stored["rates"] == {"USD": 39.5151, "EUR": 42.3641}
+
+
+@patch("prozorro.risks.exchange_rates.get_object_data", return_value=NBU_RATES)
+async def test_exchanged_value_uses_shared_collection(mock_rates, db, api):
+    EXCHANGE_RATES.clear()
+    await db.exchange_rates.insert_one({"_id": "20230103", "rates": {"USD": 40}})
+    obj = {"id": "1", "value": {"amount": 100, "currency": "USD"}}
+    assert await get_exchanged_value(obj, "2023-01-03T10:00:00+02:00") == 4000
+    assert mock_rates.call_count == 0
+
+
+@patch("prozorro.risks.exchange_rates.get_object_data", return_value=NBU_RATES)
+async def test_exchanged_value_for_uah_and_unknown_currency(mock_rates, db, api):
+    EXCHANGE_RATES.clear()
+    assert await get_exchanged_value({"value": {"amount": 100, "currency": "UAH"}}, "2023-01-04") == 100
+    assert mock_rates.call_count == 0
+    assert await get_exchanged_value({"value": {"amount": 100, "currency": "XXX"}}, "2023-01-04") == 100
+    assert mock_rates.call_count == 1
+
+
+@patch("prozorro.risks.exchange_rates.get_object_data", return_value=NBU_RATES)
+async def test_prefetch_exchange_rates_range(mock_rates, db, api):
+    EXCHANGE_RATES.clear()
+    await db.exchange_rates.insert_one({"_id": "20230106", "rates": {"USD": 40}})
+    await prefetch_exchange_rates_range("2023-01-05", "2023-01-07")
+    assert mock_rates.call_count == 2
+    assert await db.exchange_rates.count_documents({"_id": {"$in": ["20230105", "20230106", "20230107"]}}) == 3
+
+    obj = {"value": {"amount": 1, "currency": "USD"}}
+    assert await get_exchanged_value(obj, "2023-01-06T00:00:00+02:00") == 40
+    assert await get_exchanged_value(obj, "2023-01-07T00:00:00+02:00") == 39.5151
+    assert mock_rates.call_count == 2
+
+
+@patch("prozorro.risks.exchange_rates.get_object_data", return_value=NBU_RATES)
+async def test_add_values_uah(mock_rates, db, api):
+    EXCHANGE_RATES.clear()
+    tender = {"value": {"amount": 100, "currency": "USD"}}
+    contract = {"value": {"amount": 100, "currency": "UAH"}}
+    unknown_currency = {"value": {"amount": 100, "currency": "XXX"}}
+    without_value = {"value": {"amount": 0, "currency": "USD"}}
+    await add_values_uah([
+        (tender, "2023-01-08T10:00:00+02:00"),
+        (contract, "2023-01-09T10:00:00+02:00"),
+        (unknown_currency, "2023-01-08T10:00:00+02:00"),
+        (without_value, "2023-01-08T10:00:00+02:00"),
+    ])
+    assert mock_rates.call_count == 1
+    assert tender["valueUAH"] == 100 * 39.5151
+    assert tender["valueUAHRateDate"] == "2023-01-08T10:00:00+02:00"
+    assert contract["valueUAH"] == 100
+    assert "valueUAH" not in unknown_currency
+    assert "valueUAH" not in without_value
+
+    # saved value is used only for the same rate date
+    tender["valueUAH"] = 4000
+    assert await get_value_uah(tender, "2023-01-08T10:00:00+02:00") == 4000
+    assert await get_value_uah(tender, "2023-01-09T10:00:00+02:00") == 100 * 39.5151
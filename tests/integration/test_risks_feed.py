@@ -0,0 +1,57 @@
+import asyncio
+from unittest.mock import patch
+
+from prozorro.risks.feed import RisksFeedNotifier
+
+
+class FakeChangeStream:
+    def __init__(self, collection, resume_after):
+        self.collection = collection
+        self.resume_token = resume_after
+
+    async def __aenter__(self):
+        self.collection.opened.append(self.resume_token)
+        return self
+
+    async def __aexit__(self, *_):
+        self.collection.closed += 1
+
+    async def try_next(self):
+        await asyncio.sleep(0.01)
+        if self.collection.changes:
+            self.resume_token, date_assessed = self.collection.changes.pop(0)
+            return {"dateAssessed": date_assessed}
+        return None
+
+
+class FakeRisksCollection:
+    def __init__(self):
+        self.changes = []
+        self.opened = []
+        self.closed = 0
+
+    def watch(self, pipeline, resume_after=None, max_await_time_ms=None):
+        return FakeChangeStream(self, resume_after)
+
+    async def find_one(self, *args, **kwargs):
+        return None
+
+
+async def test_feed_change_stream_is_closed_without_waiters():
+    collection = FakeRisksCollection()
+    notifier = RisksFeedNotifier(use_change_stream=True, poll_interval=0.01)
+    with patch("prozorro.risks.feed.get_risks_collection", return_value=collection):
+        collection.changes.append(("token-1", "2023-03-14T10:30:00+02:00"))
+        assert await notifier.wait(None, timeout=1) is True
+        await asyncio.sleep(0.05)
+        # stream isn't read while there are no waiting consumers
+        assert collection.opened == [None]
+        assert collection.closed == 1
+
+        collection.changes.append(("token-2", "2023-03-15T10:30:00+02:00"))
+        assert await notifier.wait("2023-03-14T10:30:00+02:00", timeout=1) is True
+        await asyncio.sleep(0.05)
+        # the next waiting consumer resumes stream from the last received change
+        assert collection.opened == [None, "token-1"]
+        assert collection.closed == 2
+        await notifier.stop()
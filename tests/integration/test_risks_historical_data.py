@@ -1,6 +1,22 @@
+import asyncio
 from copy import deepcopy
 from datetime import datetime
-from prozorro.risks.historical_data import get_list_of_cpvs
+from unittest.mock import patch
+
+from pymongo.errors import AutoReconnect
+
+from prozorro.risks.commands.rebuild_entity_supplier_cpvs import rebuild_entity_supplier_cpvs
+from prozorro.risks.context import RiskContext
+from prozorro.risks.db import bulk_save_tenders, save_tender
+from prozorro.risks.historical_cache import HistoricalQueryCache, get_query_key
+from prozorro.risks.historical_data import (
+    build_historical_projection,
+    get_entity_supplier_cpvs,
+    get_historical_tender,
+    get_list_of_cpvs,
+    iter_historical_tenders,
+)
+from prozorro.risks.rules import sas24_3_11_2, sas_3_3
 from prozorro.risks.settings import TIMEZONE
 
 from tests.integration.conftest import get_fixture_json
@@ -114,3 +130,223 @@ async def test_get_list_of_cpvs(db):
     )
     assert "cpv" in result
     assert sorted(result["cpv"]) == ["45310000-1", "45310000-2", "45310000-4"]
+
+
+async def test_entity_supplier_cpvs(db):
+    def get_tender(uid, *contracts, **fields):
+        return {
+            "id": uid,
+            "procuringEntityIdentifier": "UA-EDR-39604271",
+            "procurementMethodType": "aboveThresholdUA",
+            "mainProcurementCategory": "works",
+            "contracts": [
+                {
+                    "dateSigned": date_signed,
+                    "items": [{"classification": {"id": cpv}}],
+                    "suppliers": [{"identifier": {"scheme": "UA-EDR", "id": "21809562"}}],
+                }
+                for date_signed, cpv in contracts
+            ],
+            **fields,
+        }
+
+    date_signed = datetime(2022, 2, 2).isoformat()
+    await save_tender(get_tender("1", (date_signed, "45310000-4")))
+    await bulk_save_tenders([
+        get_tender("2", (date_signed, "45310000-2")),
+        get_tender("3", (date_signed, "45310000-4")),
+        get_tender("4", (date_signed, "45310000-1"), (datetime(2023, 1, 1, tzinfo=TIMEZONE).isoformat(), "45310000-5")),
+        get_tender("5", (date_signed, "45310000-3"), procurementMethodType="reporting"),
+        get_tender("6", (date_signed, "45310000-7"), procuringEntityIdentifier="UA-EDR-39604211"),
+    ])
+    kwargs = {
+        "year": 2022,
+        "entity_identifier": "UA-EDR-39604271",
+        "supplier_identifier": {"scheme": "UA-EDR", "id": "21809562"},
+        "procurement_methods": ("aboveThresholdUA", "aboveThreshold"),
+        "procurement_categories": ("works",),
+    }
+
+    async def assert_cpvs(expected):
+        result = await get_entity_supplier_cpvs(**kwargs)
+        assert sorted(result["cpv"]) == expected
+        assert sorted((await get_list_of_cpvs(**kwargs)).get("cpv", [])) == expected
+
+    await assert_cpvs(["45310000-1", "45310000-2", "45310000-4"])
+    await save_tender(get_tender("3", (date_signed, "45310000-6")))
+    await assert_cpvs(["45310000-1", "45310000-2", "45310000-4", "45310000-6"])
+    await bulk_save_tenders([get_tender("1"), get_tender("2", (date_signed, "45310000-2"))])
+    await assert_cpvs(["45310000-1", "45310000-2", "45310000-6"])
+    assert (await get_entity_supplier_cpvs(**{**kwargs, "year": 2023}))["cpv"] == ["45310000-5"]
+
+    await db.entity_supplier_cpvs.delete_many({})
+    assert await rebuild_entity_supplier_cpvs(batch_size=2) == 6
+    await assert_cpvs(["45310000-1", "45310000-2", "45310000-6"])
+
+
+async def test_entity_supplier_cpvs_after_repeated_bulk_save(db):
+    tender = {
+        "id": "f59a674045ac4c349a220c8fbaf18700",
+        "procuringEntityIdentifier": "UA-EDR-39604272",
+        "procurementMethodType": "aboveThresholdUA",
+        "mainProcurementCategory": "goods",
+        "contracts": [
+            {
+                "dateSigned": datetime(2022, 2, 2).isoformat(),
+                "items": [{"classification": {"id": "45310000-4"}}],
+                "suppliers": [{"identifier": {"scheme": "UA-EDR", "id": "21809562"}}],
+            },
+        ],
+    }
+    find_one_and_replace = type(db.tenders).find_one_and_replace
+    calls = []
+
+    async def failing_find_one_and_replace(self, *args, **kwargs):
+        if self.name == "tenders":
+            calls.append(args)
+            if len(calls) == 1:
+                raise AutoReconnect("Connection refused")
+        return await find_one_and_replace(self, *args, **kwargs)
+
+    with (
+        patch.object(type(db.tenders), "find_one_and_replace", failing_find_one_and_replace),
+        patch("prozorro.risks.db.MONGODB_ERROR_INTERVAL", 0),
+    ):
+        await bulk_save_tenders([tender])
+    assert len(calls) == 2
+    result = await get_entity_supplier_cpvs(
+        year=2022,
+        entity_identifier="UA-EDR-39604272",
+        supplier_identifier={"scheme": "UA-EDR", "id": "21809562"},
+        procurement_methods=("aboveThresholdUA",),
+        procurement_categories=("goods",),
+    )
+    assert result == {"cpv": ["45310000-4"]}
+
+
+def test_historical_tender_projection():
+    projection = build_historical_projection([sas_3_3.RiskRule, sas24_3_11_2.RiskRule])
+    assert projection["procuringEntity"] is True
+    assert projection["contracts"] == {
+        "dateSigned": True,
+        "suppliers": {"identifier": True},
+        "items": {"classification": {"id": True}},
+    }
+    tender = {
+        "id": "f59a674045ac4c349a220c8fbaf184b9",
+        "title": "Title",
+        "status": "complete",
+        "procuringEntity": {"name": "Name", "identifier": {"scheme": "UA-EDR", "id": "39604270"}},
+        "bids": [{"id": "bid", "documents": []}],
+        "contracts": [
+            {
+                "dateSigned": "2024-05-08T19:52:31.887284+03:00",
+                "documents": [{"title": "contract.pdf"}],
+                "items": [{"description": "Item", "classification": {"id": "45310000-3", "scheme": "ДК021"}}],
+                "suppliers": [{"name": "Supplier", "identifier": {"scheme": "UA-EDR", "id": "21809562"}}],
+            },
+        ],
+        "awards": [{"lotID": "lot", "complaints": [{"type": "complaint", "status": "satisfied", "title": "T"}]}],
+    }
+    assert get_historical_tender(tender, projection) == {
+        "_id": "f59a674045ac4c349a220c8fbaf184b9",
+        "title": "Title",
+        "status": "complete",
+        "procuringEntity": {"name": "Name", "identifier": {"scheme": "UA-EDR", "id": "39604270"}},
+        "contracts": [
+            {
+                "dateSigned": "2024-05-08T19:52:31.887284+03:00",
+                "items": [{"classification": {"id": "45310000-3"}}],
+                "suppliers": [{"identifier": {"scheme": "UA-EDR", "id": "21809562"}}],
+            },
+        ],
+        "awards": [{"lotID": "lot", "complaints": [{"type": "complaint", "status": "satisfied"}]}],
+    }
+    assert get_historical_tender(tender) is tender
+
+
+async def test_entity_supplier_cpvs_after_concurrent_bulk_save(db):
+    def get_tender(*cpvs):
+        return {
+            "id": "f59a674045ac4c349a220c8fbaf18701",
+            "procuringEntityIdentifier": "UA-EDR-39604273",
+            "procurementMethodType": "aboveThresholdUA",
+            "mainProcurementCategory": "goods",
+            "contracts": [
+                {
+                    "dateSigned": datetime(2022, 2, 2).isoformat(),
+                    "items": [{"classification": {"id": cpv}} for cpv in cpvs],
+                    "suppliers": [{"identifier": {"scheme": "UA-EDR", "id": "21809562"}}],
+                },
+            ],
+        }
+
+    collection_type = type(db.tenders)
+
+    def with_latency(method):
+        async def call(self, *args, **kwargs):
+            await asyncio.sleep(0)
+            return await method(self, *args, **kwargs)
+        return call
+
+    # the same tender is saved by tenders and delay crawlers at the same time
+    with (
+        patch.object(collection_type, "bulk_write", with_latency(collection_type.bulk_write)),
+        patch.object(collection_type, "find_one_and_replace", with_latency(collection_type.find_one_and_replace)),
+    ):
+        await asyncio.gather(*(bulk_save_tenders([get_tender("45310000-4")]) for _ in range(2)))
+        filters = {"procuringEntityIdentifier": "UA-EDR-39604273", "cpv": "45310000-4"}
+        assert [doc["count"] async for doc in db.entity_supplier_cpvs.find(filters)] == [1]
+        await asyncio.gather(*(bulk_save_tenders([get_tender()]) for _ in range(2)))
+        assert [doc["count"] async for doc in db.entity_supplier_cpvs.find(filters)] == [0]
+
+
+async def test_historical_query_cache():
+    cache = HistoricalQueryCache(ttl=60, maxsize=2)
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return {"value": value}
+
+    assert get_query_key("q", {"a": 1, "b": 2}) == get_query_key("q", {"b": 2, "a": 1})
+    results = await asyncio.gather(*(cache.get("a", lambda: load("a")) for _ in range(3)))
+    assert results == [{"value": "a"}] * 3
+    assert await cache.get("a", lambda: load("a")) == {"value": "a"}
+    assert calls == ["a"]
+    assert cache.stats == {"misses": 1, "coalesced": 2, "hits": 1}
+
+    await cache.get("b", lambda: load("b"))
+    await cache.get("c", lambda: load("c"))  # the least recently used "a" is evicted
+    await cache.get("a", lambda: load("a"))
+    assert calls == ["a", "b", "c", "a"]
+
+    result, _ = cache._results["a"]
+    cache._results["a"] = (result, 0)  # expired
+    await cache.get("a", lambda: load("a"))
+    assert calls == ["a", "b", "c", "a", "a"]
+
+    with patch("prozorro.risks.historical_cache.logger") as logger:
+        cache.log_stats()
+    extra = logger.info.call_args.kwargs["extra"]
+    assert extra["MESSAGE_ID"] == "HISTORICAL_QUERY_CACHE_STATS"
+    assert (extra["QUERIES"], extra["MISSES"], extra["HIT_RATE"]) == (8, 5, 3 / 8)
+    assert not cache.stats
+
+
+async def test_iter_historical_tenders_with_context(db):
+    await db.tenders.insert_many([
+        {"_id": f"{index:032x}", "procuringEntityIdentifier": "UA-EDR-00000001", "dateCreated": "2024-01-01"}
+        for index in range(3)
+    ])
+    context = RiskContext()
+    filters = {"procuringEntityIdentifier": "UA-EDR-00000001"}
+    projection = {"dateCreated": True}
+    with patch("prozorro.risks.historical_data.HISTORICAL_QUERY_BATCH_SIZE", 2):
+        for _ in range(2):
+            batches = [tenders async for tenders in iter_historical_tenders(filters, projection, context=context)]
+            assert [len(tenders) for tenders in batches] == [2, 1]
+    tenders = [tender async for tenders in iter_historical_tenders(filters, projection) for tender in tenders]
+    assert tenders == [tender for tenders in batches for tender in tenders]
+    assert context.historical_cache.stats == {"misses": 1, "hits": 1}
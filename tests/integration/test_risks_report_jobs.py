@@ -0,0 +1,136 @@
+import asyncio
+import csv
+import io
+import os
+from copy import deepcopy
+from datetime import timedelta
+
+import pytest
+
+from aiohttp.hdrs import CONTENT_DISPOSITION
+
+from prozorro.risks import report_jobs
+from prozorro.risks.report_jobs import FileReportStorage, delete_expired_report_jobs, get_report_watermark
+from prozorro.risks.utils import get_now
+from tests.integration.conftest import get_fixture_json
+
+tender = get_fixture_json("risks")
+tender["_id"] = "f59a674045ac4c349a220c8fbaf18598"
+tender["procuringEntityEDRPOU"] = "22518133"
+tender["worked_risks"] = ["sas-3-1"]
+tender["has_risks"] = True
+
+
+async def wait_for_job(api, job_id):
+    for _ in range(100):
+        response = await api.get(f"/api/risks-report/jobs/{job_id}")
+        assert response.status == 200
+        job = await response.json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Report job {job_id} isn't finished")
+
+
+async def test_report_job_file_is_reused_until_new_tenders_assessed(api, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "REPORT_JOBS_STORAGE", "file")
+    monkeypatch.setattr(report_jobs, "REPORT_JOBS_DIR", str(tmp_path))
+    await db.risks.insert_one(deepcopy(tender))
+
+    response = await api.post("/api/risks-report/jobs?edrpou=22518133&risks=sas-3-1")
+    assert response.status == 202
+    job = await response.json()
+    assert job["status"] == "queued"
+    assert job["params"] == {"edrpou": "22518133", "risks": ["sas-3-1"]}
+    assert "artifact" not in job
+
+    job = await wait_for_job(api, job["id"])
+    assert job["status"] == "done"
+    assert job["rows"] == 1
+    assert job["url"] == f"/api/risks-report/jobs/{job['id']}/file"
+    assert len(os.listdir(tmp_path)) == 1
+
+    response = await api.get(job["url"])
+    assert response.status == 200
+    assert response.headers[CONTENT_DISPOSITION] == 'attachment; filename="Tender_risks_report.csv"'
+    csv_rows = list(csv.reader(io.StringIO(await response.text())))
+    assert len(csv_rows) == 2
+    assert csv_rows[1][:2] == [tender["_id"], tender["tenderID"]]
+
+    # the same filters in other order get the same done job
+    response = await api.post("/api/risks-report/jobs?risks=sas-3-1&edrpou=22518133")
+    assert response.status == 200
+    assert (await response.json())["id"] == job["id"]
+
+    # newly assessed tender changes watermark, so report is generated again
+    new_tender = deepcopy(tender)
+    new_tender["_id"] = "f59a674045ac4c349a220c8fbaf18599"
+    new_tender["dateAssessed"] = get_now().isoformat()
+    await db.risks.insert_one(new_tender)
+    response = await api.post("/api/risks-report/jobs?edrpou=22518133&risks=sas-3-1")
+    assert response.status == 202
+    new_job = await wait_for_job(api, (await response.json())["id"])
+    assert new_job["id"] != job["id"]
+    assert new_job["rows"] == 2
+
+
+async def test_report_job_errors(api, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "REPORT_JOBS_STORAGE", "file")
+    monkeypatch.setattr(report_jobs, "REPORT_JOBS_DIR", str(tmp_path))
+    response = await api.post("/api/risks-report/jobs?format=xlsx&compression=gzip")
+    assert response.status == 400
+    response = await api.post("/api/risks-report/jobs?sort=tenderID")
+    assert response.status == 400
+    response = await api.get(f"/api/risks-report/jobs/{'0' * 64}")
+    assert response.status == 404
+
+    # job isn't processed without worker
+    await report_jobs.REPORT_JOBS_WORKER.stop()
+    response = await api.post("/api/risks-report/jobs?edrpou=22518133")
+    assert response.status == 202
+    job = await response.json()
+    response = await api.get(f"/api/risks-report/jobs/{job['id']}/file")
+    assert response.status == 409
+
+
+async def test_expired_report_jobs_are_deleted(db, tmp_path):
+    storage = FileReportStorage(str(tmp_path))
+    artifact = await storage.open("a" * 64, "Tender_risks_report.csv")
+    await artifact.write(b"_id\r\n")
+    await artifact.close()
+    finished = (get_now() - timedelta(days=2)).isoformat()
+    await db.report_jobs.insert_many([
+        {"_id": "a" * 64, "status": "done", "finished": finished, "artifact": artifact.ref},
+        {"_id": "b" * 64, "status": "done", "finished": get_now().isoformat(), "artifact": "missing.csv"},
+    ])
+    try:
+        await delete_expired_report_jobs(storage)
+        assert [job["_id"] async for job in db.report_jobs.find()] == ["b" * 64]
+        assert os.listdir(tmp_path) == []
+    finally:
+        await db.report_jobs.delete_many({})
+
+
+async def test_report_watermark_is_rounded(db):
+    assert await get_report_watermark() is None
+    await db.risks.insert_many([
+        {**deepcopy(tender), "_id": "f59a674045ac4c349a220c8fbaf18600", "dateAssessed": "2023-03-13T14:05:00+02:00"},
+    ])
+    try:
+        assert await get_report_watermark() == "2023-03-13T14:00:00+02:00"
+        await db.risks.insert_one(
+            {**deepcopy(tender), "_id": "f59a674045ac4c349a220c8fbaf18601", "dateAssessed": "2023-03-13T14:55:00+02:00"}
+        )
+        assert await get_report_watermark() == "2023-03-13T14:00:00+02:00"
+        await db.risks.insert_one(
+            {**deepcopy(tender), "_id": "f59a674045ac4c349a220c8fbaf18602", "dateAssessed": "2023-03-13T15:00:00+02:00"}
+        )
+        assert await get_report_watermark() == "2023-03-13T15:00:00+02:00"
+    finally:
+        await db.risks.delete_many({})
+
+
+def test_file_report_storage_requires_directory(monkeypatch):
+    monkeypatch.setattr(report_jobs, "REPORT_JOBS_DIR", None)
+    with pytest.raises(ValueError):
+        FileReportStorage()
@@ -0,0 +1,75 @@
+import importlib
+from copy import deepcopy
+from datetime import timedelta
+from itertools import product
+from unittest.mock import patch
+
+from prozorro.risks.crawlers.base import process_risks
+from prozorro.risks.rules.registry import RuleSet, RulesRegistry
+from tests.integration.conftest import get_fixture_json
+
+TENDER_RULE_MODULES = (
+    "sas_3_1", "sas_3_2", "sas_3_2_1", "sas_3_3", "sas_3_3_1", "sas_3_5", "sas_3_6", "sas_3_8", "sas_3_9",
+    "sas24_3_1", "sas24_3_2", "sas24_3_2_1", "sas24_3_5", "sas24_3_9", "sas24_3_10", "sas24_3_11_1",
+    "sas24_3_11_2", "sas24_3_13", "sas24_3_14_1", "sas24_3_14_2", "sas24_3_15",
+)
+TENDER_RULES = [
+    importlib.import_module(f"prozorro.risks.rules.{module_name}").RiskRule()
+    for module_name in TENDER_RULE_MODULES
+]
+
+
+def get_tender_variants():
+    base_tender = get_fixture_json("base_tender")
+    for method, status, kind, category in product(
+        ("aboveThreshold", "aboveThresholdEU", "belowThreshold", "negotiation", "reporting"),
+        ("active.tendering", "active.awarded", "complete", "cancelled"),
+        ("general", "defense", "other"),
+        ("goods", "works", None),
+    ):
+        tender = deepcopy(base_tender)
+        tender.update(procurementMethodType=method, status=status)
+        tender["procuringEntity"]["kind"] = kind
+        if category:
+            tender["mainProcurementCategory"] = category
+        else:
+            tender.pop("mainProcurementCategory")
+        yield tender
+
+
+async def test_pruned_rules_results_are_the_same():
+    registry = RulesRegistry(TENDER_RULES)
+    pruned = 0
+    for tender in get_tender_variants():
+        candidates = registry.get_candidates(tender)
+        for rule in TENDER_RULES:
+            if rule not in candidates:
+                pruned += 1
+                assert await rule.process_tender(tender) == rule.not_matched_result(tender), rule.identifier
+    assert pruned > 0
+
+
+@patch("prozorro.risks.rules.sas24_3_1.RiskRule.process_tender")
+async def test_process_risks_with_registry(mock_process_tender):
+    rule = importlib.import_module("prozorro.risks.rules.sas24_3_1").RiskRule()
+    registry = RulesRegistry([rule])
+    tender = get_fixture_json("base_tender")
+    tender.update(procurementMethodType="reporting")
+
+    risks = await process_risks(tender, registry)
+    assert risks["sas24-3-1"][0]["indicator"] == "risk_not_found"
+    assert mock_process_tender.call_count == 0
+    assert registry.stats == {"objects": 1, "rules_processed": 0, "rules_pruned": 1}
+    assert registry.pruned_per_object == {1: 1}
+
+    registry.log_stats()
+    assert not registry.stats
+
+
+def test_rule_set_drops_archived_rules_at_midnight():
+    archived_rule = importlib.import_module("prozorro.risks.rules.sas_3_1").RiskRule()
+    rule = importlib.import_module("prozorro.risks.rules.sas24_3_1").RiskRule()
+    rule_set = RuleSet([archived_rule, rule])
+    end_date = archived_rule.descriptor.end_date
+    assert rule_set.get_active_rules(end_date - timedelta(days=1)) == (archived_rule, rule)
+    assert rule_set.get_active_rules(end_date) == (rule,)
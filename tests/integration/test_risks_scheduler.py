@@ -0,0 +1,67 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from prozorro.risks.exceptions import RequestRetryException
+from prozorro.risks.scheduler import FetchScheduler, TokenBucket
+
+
+async def test_scheduler_limits_concurrency():
+    scheduler = FetchScheduler(max_concurrency=3, min_concurrency=1, rate=0, burst=0)
+    running, max_running = 0, 0
+
+    async def fetch():
+        nonlocal running, max_running
+        async with scheduler.slot("https://api.prozorro.gov.ua/api/2.5/tenders/1"):
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(fetch() for _ in range(20)))
+    assert max_running == 3
+    assert scheduler.in_flight == 0
+
+
+async def test_scheduler_decreases_concurrency_on_too_many_requests():
+    scheduler = FetchScheduler(max_concurrency=16, min_concurrency=2, rate=0, burst=0)
+    response = MagicMock(status=429)
+    for _ in range(2):
+        with pytest.raises(RequestRetryException):
+            async with scheduler.slot("https://api.prozorro.gov.ua/api/2.5/tenders/1"):
+                raise RequestRetryException(response=response)
+    # the second 429 of the same burst isn't counted
+    assert scheduler.limit == 8
+
+    with patch("prozorro.risks.scheduler.DECREASE_INTERVAL", 0):
+        for _ in range(5):
+            scheduler.observe(429, 0.1)
+    assert scheduler.limit == 2
+
+
+async def test_scheduler_increases_concurrency_after_successes():
+    scheduler = FetchScheduler(max_concurrency=4, min_concurrency=1, rate=0, burst=0, latency_target=1)
+    scheduler.limit = 2
+    for _ in range(2):
+        scheduler.observe(200, 0.1)
+    assert scheduler.limit == 3
+    for _ in range(3):
+        scheduler.observe(200, 0.1)
+    assert scheduler.limit == 4
+    for _ in range(10):
+        scheduler.observe(200, 0.1)
+    assert scheduler.limit == 4
+
+    scheduler.observe(200, 2)
+    assert scheduler.limit == 3
+
+
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, burst=2)
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    for _ in range(6):
+        await bucket.acquire()
+    # 2 requests of burst and 4 requests with 100 rps
+    assert loop.time() - started_at >= 0.035
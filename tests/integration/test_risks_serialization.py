@@ -0,0 +1,41 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from bson import ObjectId
+
+from prozorro.risks.serialization import JSON_BACKENDS, get_json_backend, json_dumps
+from prozorro.risks.settings import TIMEZONE
+
+
+@pytest.mark.parametrize("backend", sorted(JSON_BACKENDS))
+def test_json_backends_return_the_same_values(backend):
+    dumps = JSON_BACKENDS[backend]
+    uid, object_id = uuid4(), ObjectId()
+    data = {
+        "naive": datetime(2023, 3, 13, 14, 37, 12),
+        "aware": TIMEZONE.localize(datetime(2023, 3, 13, 14, 37, 12, 491341)),
+        "offset": datetime(2023, 3, 13, 14, 37, 12, tzinfo=timezone(timedelta(hours=-5))),
+        "ids": [uid, object_id],
+        "risks": {"sas-3-2", "sas-3-1"},
+        "items": [{"amount": 1000.5, "name": "Київ", "nested": {1: None, "flag": True}}],
+    }
+    assert json.loads(dumps(data)) == {
+        "naive": "2023-03-13T14:37:12+00:00",
+        "aware": "2023-03-13T14:37:12.491341+02:00",
+        "offset": "2023-03-13T14:37:12-05:00",
+        "ids": [str(uid), str(object_id)],
+        "risks": ["sas-3-1", "sas-3-2"],
+        "items": [{"amount": 1000.5, "name": "Київ", "nested": {"1": None, "flag": True}}],
+    }
+    with pytest.raises(TypeError):
+        dumps({"date": date(2023, 3, 13)})
+
+
+def test_json_backend_selection():
+    assert get_json_backend("stdlib") is JSON_BACKENDS["stdlib"]
+    assert get_json_backend("auto") is JSON_BACKENDS.get("orjson", JSON_BACKENDS["stdlib"])
+    with pytest.raises(ValueError):
+        get_json_backend("simplejson")
+    assert json_dumps({"b": 1, "a": {1, 2}}, sort_keys=True) == '{"a": [1, 2], "b": 1}'
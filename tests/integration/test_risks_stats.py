@@ -0,0 +1,153 @@
+from unittest.mock import patch
+
+from pymongo.errors import AutoReconnect
+
+from prozorro.risks.commands.rebuild_risk_stats import rebuild_risk_stats
+from prozorro.risks.db import apply_risk_stats_snapshots, bulk_update_tender_risks, update_tender_risks
+
+
+def build_update(uid, region, amount, indicators, date_assessed="2023-03-21T14:37:12.491341+02:00", status="active"):
+    risks = {
+        risk_id: [{"indicator": indicator, "date": date_assessed}]
+        for risk_id, indicator in indicators.items()
+    }
+    additional_fields = {
+        "dateAssessed": date_assessed,
+        "procuringEntityRegion": region,
+        "value": {"amount": amount, "currency": "UAH"},
+        "status": status,
+    }
+    return uid, risks, additional_fields, None
+
+
+async def get_stats(db):
+    return {
+        (stats["_id"]["region"], stats["_id"]["risk"], stats["_id"]["terminated"]): (stats["count"], stats["amount"])
+        async for stats in db.risk_stats.find({"$or": [{"count": {"$ne": 0}}, {"amount": {"$ne": 0}}]})
+    }
+
+
+async def test_risk_stats_are_updated_incrementally(db):
+    await update_tender_risks(*build_update(
+        "f59a674045ac4c349a220c8fbaf18500", "Київ", 100, {"sas-3-1": "risk_found", "sas-3-2": "risk_found"}
+    ))
+    await bulk_update_tender_risks([
+        build_update("f59a674045ac4c349a220c8fbaf18501", "Київ", 200, {"sas-3-1": "risk_found"}),
+        build_update("f59a674045ac4c349a220c8fbaf18502", "Одеська область", 300, {"sas-3-1": "risk_not_found"}),
+    ])
+    assert await get_stats(db) == {
+        ("Київ", None, False): (2, 300),
+        ("Київ", "sas-3-1", False): (2, 300),
+        ("Київ", "sas-3-2", False): (1, 100),
+    }
+
+    # risk isn't found anymore, tender is terminated and its amount is changed
+    await update_tender_risks(*build_update(
+        "f59a674045ac4c349a220c8fbaf18500", "Київ", 150, {"sas-3-2": "risk_not_found"}, status="cancelled"
+    ))
+    # the same result doesn't change stats
+    await update_tender_risks(*build_update("f59a674045ac4c349a220c8fbaf18501", "Київ", 200, {"sas-3-1": "risk_found"}))
+    await update_tender_risks(*build_update(
+        "f59a674045ac4c349a220c8fbaf18502", "Одеська область", 300, {"sas-3-1": "risk_found"}
+    ))
+    expected_stats = {
+        ("Київ", None, False): (1, 200),
+        ("Київ", "sas-3-1", False): (1, 200),
+        ("Київ", None, True): (1, 150),
+        ("Київ", "sas-3-1", True): (1, 150),
+        ("Одеська область", None, False): (1, 300),
+        ("Одеська область", "sas-3-1", False): (1, 300),
+    }
+    assert await get_stats(db) == expected_stats
+
+    await db.risk_stats.delete_many({})
+    await rebuild_risk_stats(batch_size=2)
+    assert await get_stats(db) == expected_stats
+    await db.risks.delete_many({})
+    await db.risk_stats.delete_many({})
+
+
+async def test_risk_stats_after_concurrent_update_of_bulk_updated_tender(db):
+    uid = "f59a674045ac4c349a220c8fbaf18503"
+    await update_tender_risks(*build_update(uid, "Київ", 100, {"sas-3-1": "risk_found"}))
+    interleaved = []
+
+    async def apply_after_concurrent_update(uids):
+        if not interleaved:
+            # another crawler updates the same tender between bulk write and stats update
+            interleaved.append(uids)
+            await update_tender_risks(*build_update(uid, "Київ", 300, {"sas-3-1": "risk_found"}))
+        await apply_risk_stats_snapshots(uids)
+
+    with patch("prozorro.risks.db.apply_risk_stats_snapshots", apply_after_concurrent_update):
+        await bulk_update_tender_risks([build_update(uid, "Київ", 200, {"sas-3-1": "risk_found"})])
+    assert interleaved == [[uid]]
+    assert await get_stats(db) == {
+        ("Київ", None, False): (1, 300),
+        ("Київ", "sas-3-1", False): (1, 300),
+    }
+    # snapshot is kept only until its delta is applied
+    assert await db.risks.count_documents({"stats_previous": {"$exists": True}}) == 0
+    await db.risks.delete_many({})
+    await db.risk_stats.delete_many({})
+
+
+async def test_risk_stats_after_repeated_update_of_updated_tender(db):
+    uid = "f59a674045ac4c349a220c8fbaf18504"
+    find_one_and_update = type(db.risks).find_one_and_update
+    calls = []
+
+    async def applied_update_with_lost_reply(self, *args, **kwargs):
+        result = await find_one_and_update(self, *args, **kwargs)
+        if self.name == "risks" and kwargs.get("upsert"):
+            calls.append(result)
+            if len(calls) == 1:
+                raise AutoReconnect("Connection reset by peer")
+        return result
+
+    with (
+        patch.object(type(db.risks), "find_one_and_update", applied_update_with_lost_reply),
+        patch("prozorro.risks.db.MONGODB_ERROR_INTERVAL", 0),
+    ):
+        await update_tender_risks(*build_update(uid, "Київ", 100, {"sas-3-1": "risk_found"}))
+    assert len(calls) == 2
+    assert await get_stats(db) == {
+        ("Київ", None, False): (1, 100),
+        ("Київ", "sas-3-1", False): (1, 100),
+    }
+    await db.risks.delete_many({})
+    await db.risk_stats.delete_many({})
+
+
+async def test_get_risks_stats(api, db):
+    await bulk_update_tender_risks([
+        build_update(
+            "f59a674045ac4c349a220c8fbaf18503", "Київ", 100, {"sas-3-1": "risk_found", "sas-3-2": "risk_found"}
+        ),
+        build_update("f59a674045ac4c349a220c8fbaf18504", "Київ", 200, {"sas-3-1": "risk_found"}),
+        build_update("f59a674045ac4c349a220c8fbaf18505", "Одеська область", 300, {"sas-3-2": "risk_found"}),
+    ])
+    response = await api.get("/api/risks-stats")
+    assert response.status == 200
+    assert (await response.json())["items"] == [{"count": 3, "amount": 600}]
+
+    response = await api.get("/api/risks-stats?group_by=region")
+    assert response.status == 200
+    assert (await response.json())["items"] == [
+        {"region": "Київ", "count": 2, "amount": 300},
+        {"region": "Одеська область", "count": 1, "amount": 300},
+    ]
+
+    response = await api.get("/api/risks-stats?group_by=risk&region=Київ")
+    assert response.status == 200
+    assert (await response.json())["items"] == [
+        {"risk": "sas-3-1", "count": 2, "amount": 300},
+        {"risk": "sas-3-2", "count": 1, "amount": 100},
+    ]
+
+    response = await api.get("/api/risks-stats?risks=sas-3-2&terminated=false")
+    assert response.status == 200
+    assert (await response.json())["items"] == [{"count": 2, "amount": 400}]
+
+    response = await api.get("/api/risks-stats?group_by=edrpou")
+    assert response.status == 400
@@ -1,7 +1,19 @@
 import pytest
+from bson import ObjectId
 from copy import deepcopy
+from datetime import datetime, timedelta, timezone
 
-from prozorro.risks.utils import get_subject_of_procurement
+from prozorro.risks.context import RiskContext
+from prozorro.risks.rules.facts import TenderFacts
+from prozorro.risks.rules.utils import _cached_end_date, calculate_end_date, count_winner_disqualifications_and_bidders
+from prozorro.risks.settings import TIMEZONE
+from prozorro.risks.utils import (
+    encode_feed_offset,
+    get_now,
+    get_subject_of_procurement,
+    parse_feed_offset,
+    parse_offset,
+)
 from tests.integration.conftest import get_fixture_json
 
 tender_data = get_fixture_json("base_tender")
@@ -78,3 +90,81 @@ async def test_cpv_parent_codes(db, api, tender_items_1, tender_items_2, result)
     tender_2["items"] = tender_items_2
     condition = get_subject_of_procurement(tender_1) == get_subject_of_procurement(tender_2)
     assert condition is result
+
+
+def test_calculate_end_date_with_working_days():
+    start = TIMEZONE.localize(datetime(2024, 1, 5, 10, 30))
+    end_date = calculate_end_date(start, timedelta(days=3), normalized=False, working_days=True)
+    assert end_date == TIMEZONE.localize(datetime(2024, 1, 10, 10, 30))
+    end_date = calculate_end_date(start, -timedelta(days=5), normalized=False, working_days=True)
+    assert end_date == TIMEZONE.localize(datetime(2023, 12, 29, 10, 30))
+
+
+def test_calculate_end_date_is_cached():
+    start = datetime.fromisoformat("2024-01-05T01:30:00+02:00")
+    end_date = calculate_end_date(start, timedelta(days=30))
+    assert calculate_end_date(start, timedelta(days=30)) is end_date
+    # the same moment in other timezone is another day, so it isn't taken from cache
+    utc_start = start.astimezone(timezone.utc)
+    assert utc_start == start
+    assert calculate_end_date(utc_start, timedelta(days=30)) != end_date
+
+
+def test_calculate_end_date_without_cache():
+    _cached_end_date.cache_clear()
+    now = get_now()
+    end_date = calculate_end_date(now, -timedelta(days=3), ceil=False, cache=False)
+    assert end_date == calculate_end_date(now, -timedelta(days=3), ceil=False)
+    assert _cached_end_date.cache_info().currsize == 1
+
+
+def test_tender_facts_counts_are_the_same_as_utils():
+    tender = deepcopy(tender_data)
+    tender["lots"] = [{"id": "lot1", "status": "active"}, {"id": "lot2", "status": "active"}]
+    supplier = tender["awards"][0]["suppliers"][0]
+    tender["awards"] = [
+        {"id": "1", "status": "unsuccessful", "lotID": "lot1", "suppliers": [supplier]},
+        {
+            "id": "2",
+            "status": "unsuccessful",
+            "lotID": "lot1",
+            "suppliers": [{**supplier, "identifier": {**supplier["identifier"], "id": "1111"}}],
+        },
+        {"id": "3", "status": "active", "lotID": "lot1", "bid_id": "bid1", "suppliers": [supplier]},
+        {"id": "4", "status": "unsuccessful", "lotID": "lot2", "suppliers": [supplier]},
+    ]
+    tender["bids"] = [
+        {"id": "bid1", "status": "active", "tenderers": [supplier], "lotValues": [{"relatedLot": "lot1"}]},
+        {"id": "bid2", "status": "active", "tenderers": [supplier], "lotValues": [{"relatedLot": "lot2"}]},
+    ]
+    tender_facts = TenderFacts(tender)
+    for lot in [None] + tender["lots"]:
+        assert tender_facts.count_winner_disqualifications_and_bidders(lot) == (
+            count_winner_disqualifications_and_bidders(tender, lot, check_winner=True)
+        )
+    assert tender_facts.is_winner_awarded()
+    assert tender_facts.is_winner_awarded(tender["lots"][0])
+    assert not tender_facts.is_winner_awarded(tender["lots"][1])
+    assert tender_facts.bids_by_id["bid2"] is tender["bids"][1]
+
+
+def test_tender_facts_are_shared_by_context():
+    tender = deepcopy(tender_data)
+    context = RiskContext()
+    assert context.get_tender_facts(tender) is context.get_tender_facts(tender)
+    assert context.get_tender_facts(deepcopy(tender)) is not context.get_tender_facts(tender)
+
+
+def test_parse_feed_offset():
+    uid = ObjectId()
+    assert parse_feed_offset(encode_feed_offset("2023-03-14T10:30:00+02:00", uid)) == (
+        "2023-03-14T10:30:00+02:00", uid
+    )
+    assert parse_feed_offset(encode_feed_offset("2023-03-14T10:30:00+02:00", "f59a674045ac")) == (
+        "2023-03-14T10:30:00+02:00", "f59a674045ac"
+    )
+    # offsets in timestamp and ISO formats are parsed without _id
+    assert parse_feed_offset("2023-03-14T10:30:00+02:00") == ("2023-03-14T10:30:00+02:00", None)
+    assert parse_feed_offset("1678782600") == (parse_offset("1678782600"), None)
+    with pytest.raises(ValueError):
+        parse_feed_offset("not-an-offset")